@@ -0,0 +1,61 @@
+"""Diff two benchmark result files and flag regressions.
+
+	python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+
+Exits with status 1 when any case got slower (or its peak memory grew) by
+more than the threshold; cases below the noise floor are not flagged.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+	with open(path, 'r', encoding='utf-8') as fh:
+		data = json.load(fh)
+	return {(r['size'], r['case']): r for r in data['results']}, data.get('meta', {})
+
+
+def compare(old, new, threshold=0.2, floor_seconds=0.002):
+	"""Rows of (size, case, old_s, new_s, ratio, old_peak, new_peak, flag)."""
+	rows = []
+	for key in sorted(set(old) & set(new)):
+		a, b = old[key], new[key]
+		ratio = b['seconds'] / a['seconds'] if a['seconds'] else float('inf')
+		flags = []
+		if ratio > 1 + threshold and b['seconds'] > floor_seconds:
+			flags.append('slower')
+		if a.get('peak_bytes') and b.get('peak_bytes') and b['peak_bytes'] > a['peak_bytes'] * (1 + threshold):
+			flags.append('memory')
+		if ratio < 1 - threshold and a['seconds'] > floor_seconds:
+			flags.append('faster')
+		rows.append((key[0], key[1], a['seconds'], b['seconds'], ratio, a.get('peak_bytes'), b.get('peak_bytes'), ','.join(flags)))
+	return rows
+
+
+def _mib(v):
+	return f'{v / 2**20:8.1f}' if v is not None else '       -'
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('old')
+	parser.add_argument('new')
+	parser.add_argument('--threshold', type=float, default=0.2, help='relative change that counts (default 0.2)')
+	args = parser.parse_args(argv)
+
+	old, old_meta = load(args.old)
+	new, new_meta = load(args.new)
+	print(f"old: {old_meta.get('commit')}  new: {new_meta.get('commit')}")
+	print(f"{'size':>9} {'case':<45} {'old ms':>10} {'new ms':>10} {'ratio':>6} {'old MiB':>8} {'new MiB':>8}")
+	regressions = 0
+	for size, case, a, b, ratio, pa, pb, flag in compare(old, new, args.threshold):
+		regressions += 'slower' in flag or 'memory' in flag
+		print(f'{size:>9} {case:<45} {a * 1000:10.2f} {b * 1000:10.2f} {ratio:6.2f} {_mib(pa)} {_mib(pb)} {flag}')
+	for key in sorted(set(old) ^ set(new)):
+		print(f"{key[0]:>9} {key[1]:<45} only in {'old' if key in old else 'new'}")
+	return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,161 @@
+"""Load-test the JSON API with concurrent keep-alive clients.
+
+	python -m benchmarks.loadtest --clients 16 --seconds 20
+	python -m benchmarks.loadtest --url http://127.0.0.1:8765 --clients 64
+
+Without --url a server (python -m source.api) is started on a free port for
+the run. Each client thread sends requests drawn from a mix of endpoints
+and random filter combinations over one connection, as fast as answers
+come back. Prints client-side latency percentiles and throughput per
+endpoint, then the server's own /stats.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+
+MIX = {
+	'kpis': 3, 'titles_per_decade': 2, 'top_genres': 2, 'country_counts': 2,
+	'best_per_year': 1, 'top_popular': 1, 'imdb_vs_tmdb': 1,
+}
+TYPES = [None, 'MOVIE', 'SHOW']
+
+
+def _free_port():
+	with socket.socket() as s:
+		s.bind(('127.0.0.1', 0))
+		return s.getsockname()[1]
+
+
+def start_server(data, port):
+	root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+	proc = subprocess.Popen([sys.executable, '-m', 'source.api', '--data', data, '--port', str(port)],
+							cwd=root, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+	# the server prints one line once the dataset is loaded
+	line = proc.stdout.readline()
+	if proc.poll() is not None or 'serving' not in line:
+		proc.kill()
+		raise RuntimeError(f'server did not start: {line}{proc.stdout.read()}')
+	return proc
+
+
+def _get(conn, path):
+	conn.request('GET', path)
+	resp = conn.getresponse()
+	body = resp.read()
+	return resp.status, body
+
+
+def requests_for(decades, genres, rng):
+	"""Endless (endpoint, path) pairs from the mix, with random filters."""
+	names = list(MIX)
+	weights = np.array([MIX[n] for n in names], dtype=float)
+	weights /= weights.sum()
+	while True:
+		name = names[rng.choice(len(names), p=weights)]
+		params = {}
+		t = TYPES[rng.integers(len(TYPES))]
+		if t:
+			params['type'] = t
+		if len(decades) >= 2 and rng.random() < 0.5:
+			a, b = sorted(rng.choice(len(decades), 2, replace=False))
+			params['decades'] = f'{decades[a]},{decades[b]}'
+		if genres and rng.random() < 0.5:
+			params['genres'] = ','.join(rng.choice(genres, rng.integers(1, 3), replace=False))
+			params['genre_mode'] = 'all' if rng.random() < 0.3 else 'any'
+		yield name, f'/{name}?{urlencode(params)}'
+
+
+def client(host, port, seconds, decades, genres, seed, out):
+	rng = np.random.default_rng(seed)
+	conn = http.client.HTTPConnection(host, port, timeout=60)
+	stop = time.perf_counter() + seconds
+	for name, path in requests_for(decades, genres, rng):
+		if time.perf_counter() >= stop:
+			break
+		t = time.perf_counter()
+		try:
+			status, _ = _get(conn, path)
+		except (OSError, http.client.HTTPException):
+			conn.close()
+			conn = http.client.HTTPConnection(host, port, timeout=60)
+			status = 0
+		out.append((name, time.perf_counter() - t, status))
+	conn.close()
+
+
+def run(url, clients, seconds, seed=0):
+	parts = urlsplit(url)
+	host, port = parts.hostname, parts.port or 80
+	conn = http.client.HTTPConnection(host, port, timeout=60)
+	# filter values to draw from, from the server's own data
+	_, body = _get(conn, '/titles_per_decade')
+	decades = [r['decade'] for r in json.loads(body)['data']]
+	_, body = _get(conn, '/top_genres?n=12')
+	genres = [r['genre'] for r in json.loads(body)['data']]
+	conn.close()
+
+	results = [[] for _ in range(clients)]
+	threads = [threading.Thread(target=client, args=(host, port, seconds, decades, genres, seed + i, results[i]))
+			   for i in range(clients)]
+	t = time.perf_counter()
+	for th in threads:
+		th.start()
+	for th in threads:
+		th.join()
+	wall = time.perf_counter() - t
+	rows = [r for rs in results for r in rs]
+	return rows, wall
+
+
+def report(rows, wall, clients):
+	print(f'{len(rows)} requests from {clients} clients in {wall:.1f}s: {len(rows) / wall:.1f} req/s, '
+		  f'{sum(1 for r in rows if r[2] != 200)} errors')
+	print(f"{'endpoint':<18} {'n':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+	for name in sorted({r[0] for r in rows}) + ['(all)']:
+		lat = np.array([r[1] for r in rows if name == '(all)' or r[0] == name]) * 1000
+		p50, p90, p99 = np.percentile(lat, [50, 90, 99])
+		print(f'{name:<18} {len(lat):>7} {p50:8.2f} {p90:8.2f} {p99:8.2f} {lat.max():8.2f}')
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--url', default=None, help='a running server (default: start one)')
+	parser.add_argument('--data', default='data/cleaned.csv', help='dataset for the started server')
+	parser.add_argument('--clients', type=int, default=16)
+	parser.add_argument('--seconds', type=float, default=10)
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args(argv)
+
+	proc = None
+	url = args.url
+	if url is None:
+		port = _free_port()
+		proc = start_server(args.data, port)
+		url = f'http://127.0.0.1:{port}'
+	try:
+		rows, wall = run(url, args.clients, args.seconds, args.seed)
+		report(rows, wall, args.clients)
+		parts = urlsplit(url)
+		conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+		_, body = _get(conn, '/stats')
+		print('server /stats:')
+		print(json.dumps(json.loads(body), indent=1))
+	finally:
+		if proc is not None:
+			proc.terminate()
+			proc.wait()
+
+
+if __name__ == '__main__':
+	sys.exit(main())
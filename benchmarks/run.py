@@ -0,0 +1,268 @@
+"""Time the cleaning, analysis and figure-building functions on synthetic catalogues.
+
+	python -m benchmarks.run                      # 10K and 100K rows
+	python -m benchmarks.run --sizes 10k,100k,1m,10m --repeat 1
+	python -m benchmarks.run --only analysis. --out benchmarks/results/mine.json
+
+Each case is timed `repeat` times (the minimum is the headline number) and
+run once more under tracemalloc for its peak allocation. Results go to a JSON
+file (default benchmarks/results/<git sha>.json) that benchmarks.compare diffs.
+Inputs shared by several cases are built only when one of them runs; the
+all-pairs similar cases are skipped above SIMILAR_MAX_ROWS rows.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synth
+from source import analysis as an
+from source import cleaning
+from source import cube as cb
+from source import profiling
+from source import ranges
+from source import schema
+from source import search
+from source import similar
+
+
+DEFAULT_SIZES = [10_000, 100_000]
+RESULTS_DIR = 'benchmarks/results'
+# similar.nearest is exact all-pairs (O(n^2), ~110 s at 100K rows): skipped above this
+SIMILAR_MAX_ROWS = 100_000
+
+
+class Lazy:
+	"""A case input built on first use, so cases left out by --only never build it."""
+
+	def __init__(self, fn):
+		self.fn = fn
+		self.value = None
+		self.ready = False
+
+	def __call__(self):
+		if not self.ready:
+			self.value, self.ready = self.fn(), True
+		return self.value
+
+
+def needs(fn, *inputs):
+	# run() builds inputs before timing fn, so the build is not in fn's numbers
+	fn.needs = inputs
+	return fn
+
+
+def _payload(value):
+	# JSON spec size for figures
+	if hasattr(value, 'to_plotly_json'):
+		from source import visuals as vz
+		return vz.payload_bytes(value)
+	return None
+
+
+def _rows(value):
+	# rows in a result, for the rows_out column
+	if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+		return int(len(value))
+	return None
+
+
+def measure(fn, repeat=3, memory=True):
+	"""(rows_out, payload_bytes, run times, tracemalloc peak) of fn."""
+	runs = []
+	value = None
+	for _ in range(repeat):
+		t = time.perf_counter()
+		value = fn()
+		runs.append(time.perf_counter() - t)
+	rows, payload = _rows(value), _payload(value)
+	peak = None
+	if memory:
+		value = None
+		tracemalloc.start()
+		try:
+			fn()
+			peak = tracemalloc.get_traced_memory()[1]
+		finally:
+			tracemalloc.stop()
+	return rows, payload, runs, peak
+
+
+def cases(path):
+	"""(name, fn, rows_in) in run order; later cases reuse earlier outputs."""
+	raw = pd.read_csv(path)
+	n = len(raw)
+	yield 'cleaning.clean_data', lambda: cleaning.clean_data(path), n
+	yield f'cleaning.clean_data_parallel[{os.cpu_count()}w]', lambda: cleaning.clean_data_parallel(path), n
+	yield 'cleaning.clean_frame', lambda: cleaning.clean_frame(raw), n
+	yield 'cleaning.parse_list_column[genres]', lambda: cleaning.parse_list_column(raw['genres']), n
+
+	df = cleaning.clean_data(path)
+	del raw
+	m = len(df)
+	decs = sorted(set(df['decade'].dropna().astype(str)))
+	top = an.top_genres(df, n=2)['genre'].tolist()
+	yield 'schema.compact', lambda: schema.compact(df), m
+	yield 'analysis.build_list_indexes', lambda: an.build_list_indexes(df), m
+	yield 'cube.build_cube', lambda: cb.build_cube(df), m
+	yield 'profiling.Profile.build', lambda: profiling.Profile.build(df), m
+	prof = Lazy(lambda: profiling.Profile.build(df))
+	yield 'profiling.Profile.summary[MOVIE]', needs(lambda: prof().summary(type_value='MOVIE'), prof), m
+	yield 'profiling.Profile.histogram[imdb_score]', needs(lambda: prof().histogram('imdb_score'), prof), m
+
+	idx = an.build_list_indexes(df)
+	yield 'ranges.build_ranges', lambda: ranges.build_ranges(df, idx), m
+	yr = Lazy(lambda: ranges.build_ranges(df, idx))
+	span = dict(type_value='MOVIE', genres=top[:1], decades=[decs[len(decs) // 2], decs[-1]])
+	yield 'ranges.YearRanges.summary', needs(lambda: yr().summary('imdb_score', **span), yr), m
+	yield 'ranges.YearRanges.year_span', needs(lambda: yr().year_span(**span), yr), m
+	yield 'ranges.YearRanges.best_per_year', needs(lambda: yr().best_per_year(df, **span), yr), m
+	filters = {
+		'type': dict(type_value='MOVIE'),
+		'decades': dict(decades=[decs[len(decs) // 2], decs[-1]]),
+		'genres': dict(genres=top),
+		'all': dict(type_value='SHOW', decades=[decs[len(decs) // 2], decs[-1]], genres=top, genre_mode='all'),
+	}
+	for label, f in filters.items():
+		yield f'analysis.filter_data[{label}]', lambda f=f: an.filter_data(df, **f), m
+		yield f'analysis.filter_data[{label},indexed]', lambda f=f: an.filter_data(df, index=idx, **f), m
+		yield f'analysis.filter_rows[{label},indexed]', lambda f=f: an.filter_rows(df, index=idx, **f), m
+
+	yield 'analysis.titles_per_decade', lambda: an.titles_per_decade(df), m
+	yield 'analysis.top_genres', lambda: an.top_genres(df), m
+	yield 'analysis.top_genres[indexed]', lambda: an.top_genres(df, index=idx), m
+	yield 'analysis.country_counts', lambda: an.country_counts(df), m
+	yield 'analysis.country_counts[indexed]', lambda: an.country_counts(df, index=idx), m
+	yield 'analysis.score_distribution', lambda: an.score_distribution(df), m
+	yield 'analysis.best_imdb_each_year', lambda: an.best_imdb_each_year(df), m
+	yield 'analysis.top_popular', lambda: an.top_popular(df, n=20), m
+	yield 'analysis.top_titles[release_year]', lambda: an.top_titles(df, k=10, by='release_year'), m
+	yield 'analysis.top_titles[genres,indexed]', lambda: an.top_titles(df, k=10, by='genres', index=idx), m
+	yield 'analysis.top_titles[countries,min_votes]', lambda: an.top_titles(df, k=10, by='production_countries', min_votes=1000, index=idx), m
+	yield 'analysis.imdb_vs_tmdb', lambda: an.imdb_vs_tmdb(df), m
+
+	yield 'search.SearchIndex.build', lambda: search.SearchIndex.build(df), m
+	sidx = Lazy(lambda: search.SearchIndex.build(df))
+	yield 'search.search[word]', needs(lambda: sidx().search('love '), sidx), m
+	yield 'search.search[two words,prefix]', needs(lambda: sidx().search('dark kni'), sidx), m
+	yield 'search.search[common prefix]', needs(lambda: sidx().search('the'), sidx), m
+	yield 'search.str_contains[word]', lambda: df['title'].str.contains('love', case=False, na=False), m
+
+	yield 'similar.features', lambda: similar.features(df, idx), m
+	if m <= SIMILAR_MAX_ROWS:
+		vectors = Lazy(lambda: similar.features(df, idx))
+		near = Lazy(lambda: similar.SimilarIndex(*similar.nearest(vectors(), 10)))
+		yield 'similar.nearest[k=10]', needs(lambda: similar.nearest(vectors(), 10), vectors), m
+		yield 'similar.SimilarIndex.of', needs(lambda: near().of(m // 2), near), m
+
+	from source import countries
+	from source import visuals as vz
+	tg = an.top_genres(df)
+	tp = an.titles_per_decade(df)
+	cc = an.country_counts(df)
+	cc_labeled = cc.assign(label=countries.labels(cc['country']))
+	scores = df[['imdb_score']].dropna()
+	pop = an.top_popular(df, n=20)
+	best = an.best_imdb_each_year(df)
+	comp = an.imdb_vs_tmdb(df)
+	# time the builds themselves, not the figure cache
+	vz.FIGURES = vz.FigureCache(maxsize=0)
+	# plotly sets up templates and validators on the first figure; keep that out of the timings
+	vz.bar_top_genres(tg.head(1))
+	yield 'visuals.bar_top_genres', lambda: vz.bar_top_genres(tg), len(tg)
+	yield 'visuals.line_titles_per_decade', lambda: vz.line_titles_per_decade(tp), len(tp)
+	yield 'visuals.hist_scores', lambda: vz.hist_scores(scores), len(scores)
+	yield 'visuals.bar_top_countries', lambda: vz.bar_top_countries(cc_labeled), len(cc_labeled)
+	yield 'visuals.bar_top_popular', lambda: vz.bar_top_popular(pop), len(pop)
+	yield 'visuals.line_best_imdb_each_year', lambda: vz.line_best_imdb_each_year(best), len(best)
+	yield 'visuals.scatter_imdb_vs_tmdb', lambda: vz.scatter_imdb_vs_tmdb(comp), len(comp)
+	yield 'visuals.choropleth_countries', lambda: vz.choropleth_countries(cc), len(cc)
+	# the large-N paths, forced, so every size shows what each one costs
+	for mode in ['svg', 'webgl', 'density']:
+		yield f'visuals.scatter_imdb_vs_tmdb[{mode}]', lambda mode=mode: vz.scatter_imdb_vs_tmdb(comp, mode=mode), len(comp)
+	yield 'visuals.hist_scores[binned]', lambda: vz.hist_scores(scores, max_points=0), len(scores)
+
+
+def _git(*args):
+	try:
+		return subprocess.run(['git', *args], capture_output=True, text=True, check=True).stdout.strip()
+	except Exception:
+		return None
+
+
+def environment():
+	return {
+		'commit': _git('rev-parse', '--short', 'HEAD'),
+		'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+		'python': platform.python_version(),
+		'pandas': pd.__version__,
+		'numpy': np.__version__,
+		'platform': platform.platform(),
+		'cpus': os.cpu_count(),
+		'generator_version': synth.GENERATOR_VERSION,
+		'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+	}
+
+
+def run(sizes=None, repeat=None, memory=True, only=None, seed=0, log=print):
+	"""Run every case for every size; returns the JSON-ready result dict."""
+	out = {'meta': environment(), 'results': []}
+	for n in sizes or DEFAULT_SIZES:
+		t = time.perf_counter()
+		path = synth.catalogue(n, seed=seed)
+		log(f'{synth.size_label(n)}: catalogue {path} ready in {time.perf_counter() - t:.1f}s')
+		# big catalogues default to a single timed run per case
+		reps = repeat or (3 if n <= 100_000 else 1)
+		for name, fn, rows_in in cases(path):
+			if only and not any(name.startswith(o) for o in only):
+				continue
+			for build in getattr(fn, 'needs', ()):
+				build()
+			rows, payload, runs, peak = measure(fn, reps, memory)
+			row = {
+				'size': n, 'case': name, 'seconds': min(runs), 'runs': runs,
+				'peak_bytes': peak, 'rows_in': rows_in, 'rows_out': rows,
+				'payload_bytes': payload,
+			}
+			out['results'].append(row)
+			mem = f'{peak / 2**20:9.1f} MiB' if peak is not None else ''
+			payload = f'  payload {row["payload_bytes"] / 1024:,.0f} KiB' if row['payload_bytes'] is not None else ''
+			log(f'  {name:<45} {row["seconds"] * 1000:10.2f} ms {mem}{payload}')
+	return out
+
+
+def default_output(meta):
+	name = (meta.get('commit') or 'results') + ('-dirty' if meta.get('dirty') else '')
+	return os.path.join(RESULTS_DIR, name + '.json')
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--sizes', default=','.join(synth.size_label(n) for n in DEFAULT_SIZES),
+						help='comma-separated row counts, e.g. 10k,100k,1m,10m')
+	parser.add_argument('--repeat', type=int, default=None, help='timed runs per case (default 3, 1 above 100K rows)')
+	parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+	parser.add_argument('--only', default=None, help='comma-separated case name prefixes')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--out', default=None, help='result file (default benchmarks/results/<git sha>.json)')
+	args = parser.parse_args(argv)
+
+	sizes = [synth.parse_size(s) for s in args.sizes.split(',') if s.strip()]
+	only = [o.strip() for o in args.only.split(',')] if args.only else None
+	result = run(sizes, args.repeat, not args.no_memory, only, args.seed)
+	path = args.out or default_output(result['meta'])
+	os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+	with open(path, 'w', encoding='utf-8') as fh:
+		json.dump(result, fh, indent=1)
+	print(f'wrote {path}')
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,111 @@
+"""Resident memory of N concurrent processes holding the cleaned dataset.
+
+	python -m benchmarks.sessions --size 100k --sessions 1,2,4,8
+
+Each process loads the dataset either as its own pandas copy ('copy':
+load_cleaned(compact=True)) or attached to the shared memory-mapped columns
+('shared': load_cleaned(shared=True)), runs a few filters and aggregations
+over it, then reports its memory once every process is loaded; 'none' only
+imports, the floor subtracted in the 'over floor' column. PSS
+(proportional set size) splits shared pages between the processes mapping
+them, so the sum over processes is the real footprint. Linux only (reads
+/proc/self/smaps_rollup).
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import time
+
+from benchmarks import synth
+
+
+def _memory():
+	out = {}
+	with open('/proc/self/smaps_rollup', 'r', encoding='utf-8') as fh:
+		for line in fh:
+			parts = line.split()
+			if parts[0] in ('Rss:', 'Pss:'):
+				out[parts[0][:-1].lower()] = int(parts[1]) * 1024
+	return out
+
+
+def _session(path, mode, loaded, done, results):
+	from source import analysis as an
+	if mode == 'none':
+		# interpreter + imports only, the floor of every session
+		loaded.wait()
+		results.put(dict(_memory(), load_seconds=0.0))
+		done.wait()
+		return
+	t = time.perf_counter()
+	df = an.load_cleaned(path, shared=mode == 'shared', compact=True)
+	load = time.perf_counter() - t
+	# touch every column the dashboard reads
+	idx = an.build_list_indexes(df)
+	decs = sorted(set(df['decade'].dropna().astype(str)))
+	sub = an.filter_data(df, 'MOVIE', [decs[len(decs) // 2], decs[-1]], ['drama'], index=idx)
+	an.top_genres(df, index=idx)
+	an.best_imdb_each_year(sub)
+	an.imdb_vs_tmdb(sub)
+	df['title'].str.len().sum()
+	df['description'].str.len().sum()
+	loaded.wait()
+	results.put(dict(_memory(), load_seconds=load))
+	done.wait()
+
+
+def cleaned_catalogue(n, seed=0):
+	"""A cleaned synthetic catalogue of n rows next to the raw one (written once)."""
+	raw = synth.catalogue(n, seed)
+	path = raw[:-len('.csv')] + '.cleaned.csv'
+	if not os.path.exists(path):
+		from source import cleaning
+		cleaning.save_cleaned_data(cleaning.clean_data(raw), path, search_index=False, similar_index=False)
+	return path
+
+
+def measure(path, mode, sessions):
+	ctx = mp.get_context('spawn')
+	loaded, done = ctx.Barrier(sessions + 1), ctx.Barrier(sessions + 1)
+	results = ctx.Queue()
+	procs = [ctx.Process(target=_session, args=(path, mode, loaded, done, results)) for _ in range(sessions)]
+	for p in procs:
+		p.start()
+	loaded.wait()
+	rows = [results.get() for _ in procs]
+	done.wait()
+	for p in procs:
+		p.join()
+	return {
+		'mode': mode, 'sessions': sessions,
+		'pss_total': sum(r['pss'] for r in rows), 'rss_total': sum(r['rss'] for r in rows),
+		'load_seconds': max(r['load_seconds'] for r in rows),
+	}
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--size', default='100k')
+	parser.add_argument('--sessions', default='1,2,4,8')
+	parser.add_argument('--modes', default='none,copy,shared')
+	args = parser.parse_args(argv)
+
+	path = cleaned_catalogue(synth.parse_size(args.size))
+	from source import analysis as an
+	# publish (and fill the binary cache) up front, so no session pays for it
+	an.load_cleaned(path, shared=True)
+	print(f"{'mode':<7} {'sessions':>8} {'PSS MiB':>9} {'per session':>12} {'over floor':>11} {'RSS MiB':>9} {'load s':>7}")
+	floor = {}
+	for mode in args.modes.split(','):
+		for n in [int(x) for x in args.sessions.split(',')]:
+			r = measure(path, mode, n)
+			if mode == 'none':
+				floor[n] = r['pss_total']
+			over = (r['pss_total'] - floor[n]) / 2**20 if n in floor else float('nan')
+			print(f"{mode:<7} {n:>8} {r['pss_total'] / 2**20:9.1f} {r['pss_total'] / n / 2**20:12.1f} {over:11.1f} "
+				  f"{r['rss_total'] / 2**20:9.1f} {r['load_seconds']:7.3f}")
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,141 @@
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+
+FIXTURE = 'data/data.csv'
+DATA_DIR = 'benchmarks/.data'
+# bump when generated catalogues change, so cached files are regenerated
+GENERATOR_VERSION = 1
+
+COLUMNS = [
+	'id', 'title', 'type', 'description', 'release_year', 'age_certification', 'runtime',
+	'genres', 'production_countries', 'seasons', 'imdb_id', 'imdb_score', 'imdb_votes',
+	'tmdb_popularity', 'tmdb_score',
+]
+
+
+def parse_size(text):
+	# '10k' -> 10_000, '1m' -> 1_000_000, '2500' -> 2500
+	text = str(text).strip().lower().replace('_', '')
+	scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+	return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def size_label(n):
+	if n % 1_000_000 == 0:
+		return f'{n // 1_000_000}M'
+	if n % 1_000 == 0:
+		return f'{n // 1_000}K'
+	return str(n)
+
+
+@functools.lru_cache(maxsize=4)
+def _fixture(path):
+	# empirical distributions the catalogue is sampled from
+	src = pd.read_csv(path)
+	out = {'rows': src}
+	for col in ['genres', 'production_countries']:
+		lists = src[col].map(_parse)
+		flat = pd.Series([v for items in lists for v in items], dtype=object)
+		freq = flat.value_counts()
+		lengths = lists.map(len)
+		out[col] = (
+			np.asarray(freq.index, dtype=object),
+			freq.to_numpy(dtype=float) / freq.sum(),
+			lengths[lengths > 0].to_numpy(),
+		)
+	return out
+
+
+def _parse(cell):
+	import ast
+	try:
+		v = ast.literal_eval(cell)
+		return [str(x) for x in v] if isinstance(v, list) else []
+	except Exception:
+		return []
+
+
+def _sample_lists(rng, labels, weights, lengths):
+	# per row, lengths[i] distinct labels drawn proportionally to weights (Gumbel top-k)
+	keys = np.log(weights)[None, :] - np.log(-np.log(rng.random((len(lengths), len(labels)))))
+	order = np.argsort(-keys, axis=1)[:, :max(int(lengths.max()), 1) if len(lengths) else 1]
+	return [str(labels[order[i, :k]].tolist()) for i, k in enumerate(lengths.tolist())]
+
+
+def _jitter(rng, values, scale, lo, hi, decimals):
+	# additive noise on the present values, rounded and clipped; NaN stays NaN
+	out = values + rng.normal(0, scale, len(values))
+	return np.clip(np.round(out, decimals), lo, hi)
+
+
+def _spread(rng, values, sigma, decimals):
+	# multiplicative (log-normal) noise for heavy-tailed counts
+	return np.round(values * rng.lognormal(0, sigma, len(values)), decimals)
+
+
+def generate(n, seed=0, start=0, fixture=FIXTURE, remix=0.3, dup_rate=0.001):
+	"""A synthetic raw catalogue of n rows with data.csv's schema.
+
+	Rows are bootstrapped from the fixture (so types, years, runtimes,
+	certifications, missing values, descriptions with quoted newlines and the
+	score/vote correlations keep their real shape), then perturbed: years and
+	scores get noise, votes and popularity a log-normal spread, and a remix
+	share of genre/country lists is redrawn from the fixture's label
+	frequencies and list lengths, so there are many more distinct lists than
+	in the fixture. Ids are unique except for a dup_rate share of repeats.
+	start offsets the ids and the random stream, so consecutive chunks of one
+	catalogue can be generated independently.
+	"""
+	fx = _fixture(fixture)
+	src = fx['rows']
+	rng = np.random.default_rng([seed, start])
+	out = src.iloc[rng.integers(0, len(src), n)].reset_index(drop=True)
+
+	show = (out['type'] == 'SHOW').to_numpy()
+	serial = pd.Series(np.arange(start, start + n)).astype(str)
+	out['id'] = pd.Series(np.where(show, 'ts', 'tm'), dtype=object) + serial
+	if dup_rate and n > 1:
+		dups = np.flatnonzero(rng.random(n) < dup_rate)
+		dups = dups[dups > 0]
+		out.loc[dups, 'id'] = out['id'].to_numpy()[rng.integers(0, dups)]
+
+	years = src['release_year']
+	out['release_year'] = _jitter(rng, out['release_year'].to_numpy(dtype=float), 2.0, years.min(), years.max(), 0).astype(np.int64)
+	out['imdb_score'] = _jitter(rng, out['imdb_score'].to_numpy(dtype=float), 0.3, 1.0, 10.0, 1)
+	out['tmdb_score'] = _jitter(rng, out['tmdb_score'].to_numpy(dtype=float), 0.3, 0.0, 10.0, 3)
+	out['imdb_votes'] = _spread(rng, out['imdb_votes'].to_numpy(dtype=float), 0.5, 0)
+	out['tmdb_popularity'] = _spread(rng, out['tmdb_popularity'].to_numpy(dtype=float), 0.5, 3)
+	has_imdb = out['imdb_id'].notna().to_numpy()
+	out['imdb_id'] = np.where(has_imdb, pd.Series(rng.integers(1, 10**8, n)).map('tt{:08d}'.format), None)
+
+	for col, rate in [('genres', remix), ('production_countries', remix / 3)]:
+		labels, weights, lengths = fx[col]
+		rows = np.flatnonzero(rng.random(n) < rate)
+		if len(rows):
+			cells = out[col].to_numpy(dtype=object)
+			cells[rows] = _sample_lists(rng, labels, weights, rng.choice(lengths, len(rows)))
+			out[col] = cells
+	return out[COLUMNS]
+
+
+def write_catalogue(n, path, seed=0, chunk_rows=500_000, fixture=FIXTURE):
+	# generated and appended chunk by chunk, so 10M rows never sit in memory at once
+	os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+	tmp = path + '.tmp'
+	for start in range(0, n, chunk_rows):
+		chunk = generate(min(chunk_rows, n - start), seed=seed, start=start, fixture=fixture)
+		chunk.to_csv(tmp, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+	os.replace(tmp, path)
+	return path
+
+
+def catalogue(n, seed=0, directory=DATA_DIR, fixture=FIXTURE):
+	"""Path of a generated n-row catalogue, written on first use and reused after."""
+	path = os.path.join(directory, f'catalogue-{size_label(n)}-s{seed}-v{GENERATOR_VERSION}.csv')
+	if not os.path.exists(path):
+		write_catalogue(n, path, seed=seed, fixture=fixture)
+	return path
@@ -1,9 +1,8 @@
+import time
+_T_START = time.perf_counter()
+
 import streamlit as st
-import pandas as pd
 import os, sys
-import pycountry
-import plotly.io as pio
-import csv
 
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -11,39 +10,98 @@ if ROOT not in sys.path:
 	sys.path.insert(0, ROOT)
 
 from source import analysis as an
-from source import visuals as vz
+from source import csvscan
+from source import cube as cb
+from source import instrument
+from source import profiling
+from source import ranges as rg
+from source import search
+from source import similar
+
+IMPORT_SECONDS = time.perf_counter() - _T_START
 
 
 st.set_page_config(page_title='MovieMind', layout='wide')
 
-# Global Plotly style closer to a modern, minimal feel
-pio.templates.default = 'plotly_dark'
+VIEWS = ['Overview', 'Genres', 'Ratings', 'Popularity', 'Countries', 'Map', 'Compare']
+
+
+def _vz():
+	# plotly and the figure builders are imported by the first view that draws
+	# a chart, not at startup
+	import plotly.io as pio
+	from source import visuals as vz
+	# Global Plotly style closer to a modern, minimal feel
+	pio.templates.default = 'plotly_dark'
+	return vz
+
+
+def _chart(fig):
+	with instrument.span('plotly_chart') as rec:
+		if instrument.current() is not None:
+			# JSON spec size sent to the browser, for tuning the large-N thresholds
+			rec['payload_bytes'] = _vz().payload_bytes(fig)
+		st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+
+
+@st.cache_resource(show_spinner=False)
+def _load_dataset(path, stamp):
+	# stamp (size, mtime) makes a changed file load again; the genre/country
+	# multi-hot indexes, the count cube, the year-range index and the search
+	# index are built (or read from disk) once per load, not per rerun. The
+	# frame itself is the read-only memory-mapped copy every session and
+	# replica shares
+	df = an.load_cleaned(path, shared=True)
+	idx = an.build_list_indexes(df)
+	return df, idx, cb.build_cube(df), rg.build_ranges(df, idx), search.load_or_build(path, df)
 
 
 def load_data():
-	df = an.load_cleaned('data/cleaned.csv')
-	return df
+	path = 'data/cleaned.csv'
+	stat = os.stat(path)
+	return _load_dataset(path, (stat.st_size, stat.st_mtime_ns))
+
+
+@st.cache_resource(show_spinner=False)
+def _similar_index(path, stamp):
+	# written when cleaning (or by python -m source.similar); built on first use
+	# of the "Titles like" picker only for catalogues small enough to take
+	# seconds, None otherwise rather than blocking the session on the
+	# all-pairs search
+	df, idx, _, _, _ = _load_dataset(path, stamp)
+	found = similar.load_for(path, df)
+	if found is not None or len(df) > similar.BUILD_MAX_ROWS:
+		return found
+	return similar.load_or_build(path, df, index=idx)
+
+
+def similar_index():
+	path = 'data/cleaned.csv'
+	stat = os.stat(path)
+	return _similar_index(path, (stat.st_size, stat.st_mtime_ns))
+
+
+@st.cache_resource(show_spinner=False)
+def _profile(path, stamp):
+	# written by save_cleaned_data next to the CSV; built from the frame if
+	# missing or stale, on first use of the Ratings view
+	df = _load_dataset(path, stamp)[0]
+	return profiling.load_or_build(path, df)
+
+
+def profile():
+	path = 'data/cleaned.csv'
+	stat = os.stat(path)
+	return _profile(path, (stat.st_size, stat.st_mtime_ns))
 
 
 def get_raw_total_rows(path: str):
-	"""Count logical CSV records robustly (handles quoted newlines). No caching."""
+	"""Count logical CSV records robustly (handles quoted newlines).
+
+	One quote-aware byte pass, cached in a sidecar keyed on the file's size and mtime.
+	"""
 	try:
-		with open(path, 'r', encoding='utf-8', newline='') as f:
-			sample = f.read(4096)
-			f.seek(0)
-			try:
-				dialect = csv.Sniffer().sniff(sample)
-				f_has_header = csv.Sniffer().has_header(sample)
-			except Exception:
-				dialect = csv.excel
-				f_has_header = True
-			reader = csv.reader(f, dialect)
-			rows = 0
-			if f_has_header:
-				next(reader, None)
-			for _ in reader:
-				rows += 1
-			return int(rows)
+		return int(csvscan.count_records(path)['csv_records'])
 	except Exception:
 		return None
 
@@ -56,6 +114,17 @@ def get_decades(df):
 
 
 def main():
+	# tracing is switched on from the debug panel; the checkbox state of the
+	# previous run decides whether this rerun is recorded
+	if st.session_state.get('trace_on'):
+		with instrument.collect('rerun', memory=bool(st.session_state.get('trace_memory'))) as tr:
+			dashboard(tr)
+	else:
+		dashboard()
+
+
+def dashboard(tr=None):
+	t_rerun = time.perf_counter()
 	# Inject custom CSS for neal.fun-inspired aesthetics
 	st.markdown(
 		"""
@@ -109,18 +178,18 @@ def main():
 		  font-weight: 600;
 		}
 
-		/* Tabs as soft pills */
-		.stTabs [data-baseweb="tab-list"] {
+		/* View switcher as soft pills */
+		div[role="radiogroup"] {
 		  gap: 0.5rem;
 		}
-		.stTabs [data-baseweb="tab"] {
+		div[role="radiogroup"] > label {
 		  height: 44px;
 		  background: rgba(255,255,255,0.04);
 		  border-radius: 999px;
 		  padding: 0 16px;
 		  border: 1px solid rgba(255,255,255,0.06);
 		}
-		.stTabs [aria-selected="true"] {
+		div[role="radiogroup"] > label:has(input:checked) {
 		  background: linear-gradient(135deg, rgba(0,209,178,0.22), rgba(0,209,178,0.05));
 		  border-color: rgba(0,209,178,0.35);
 		}
@@ -143,7 +212,8 @@ def main():
 		unsafe_allow_html=True,
 	)
 
-	df = load_data()
+	with instrument.span('load'):
+		df, idx, cube, ranges, sidx = load_data()
 
 	# Sidebar filters
 	st.sidebar.header('Filters')
@@ -160,23 +230,19 @@ def main():
 	else:
 		decade_range = None
 
-	# genre list from primary_genre or exploded genres
-	all_genres = []
-	if 'genres' in df.columns:
-		for v in df['genres']:
-			if isinstance(v, list):
-				all_genres.extend(v)
-			else:
-				try:
-					all_genres.extend(eval(v))
-				except Exception:
-					pass
-	all_genres = sorted(set(all_genres))
+	# genre list: the labels of the (cached) genres index, not a re-parse of the column per rerun
+	all_genres = idx['genres'].labels.tolist() if 'genres' in idx else []
 	picked_genres = st.sidebar.multiselect('Genres', options=all_genres, default=[])
+	genre_mode = st.sidebar.radio('Match genres', ['Any', 'All'], index=0, horizontal=True)
 
 	# apply filters
 	t = None if type_value == 'ALL' else type_value
-	df_f = an.filter_data(df, type_value=t, decades=decade_range, genres=picked_genres)
+	# every aggregation below is memoized on (dataset version, filters, function, args)
+	filters = dict(type_value=t, decades=decade_range, genres=picked_genres, genre_mode=genre_mode.lower())
+	query = dict(filters, index=idx)
+	with instrument.span('filter', rows_in=len(df)) as rec:
+		df_f = an.cached(an.filter_data, df, **query)
+		rec['rows_out'] = len(df_f)
 
 	# KPI row
 	col1, col2, col3 = st.columns([1,1,1])
@@ -190,14 +256,18 @@ def main():
 			raw_total = len(df)
 		st.metric(label='Total Titles (All)', value=f"{raw_total:,}")
 	with col2:
-		avg_imdb = float(df_f['imdb_score'].dropna().mean()) if 'imdb_score' in df_f.columns else 0
+		# count questions (KPI, Overview, Genres, Countries, Map) are answered from the cube
+		avg_imdb = cube.mean_score('imdb_score', **filters) if 'imdb_score' in df.columns else 0
 		st.metric(label='Avg IMDb Score', value=f"{avg_imdb:.2f}")
 	with col3:
-		if 'release_year' in df_f.columns and not df_f['release_year'].dropna().empty:
-			yr_min, yr_max = int(df_f['release_year'].min()), int(df_f['release_year'].max())
-			span = f"{yr_min} – {yr_max}"
+		# from the year-range index's prefix counts when it answers the filter (one genre at most)
+		if ranges.supports(**filters):
+			years = ranges.year_span(**filters)
+		elif 'release_year' in df_f.columns and not df_f['release_year'].dropna().empty:
+			years = df_f['release_year'].min(), df_f['release_year'].max()
 		else:
-			span = '—'
+			years = None
+		span = f"{int(years[0])} – {int(years[1])}" if years else '—'
 		st.metric(label='Year Range', value=span)
 
 	# Optional second row for filtered count if you want clarity
@@ -218,21 +288,18 @@ def main():
 					"mtime": stat.st_mtime,
 					"size_bytes": stat.st_size,
 				})
-				robust = get_raw_total_rows(raw_path_dbg)
-				st.write({"csv_records_robust": robust})
-				# Simple physical line count (header included)
-				try:
-					with open(raw_path_dbg, 'rb') as fh:
-						lines = sum(1 for _ in fh)
-					st.write({"physical_lines": int(lines)})
-				except Exception:
-					pass
-				# Pandas row count for comparison
-				try:
-					p_rows = int(pd.read_csv(raw_path_dbg).shape[0])
-					st.write({"pandas_rows": p_rows})
-				except Exception as e:
-					st.write({"pandas_error": str(e)})
+				# csv records, physical lines and pandas rows all come from one cached pass
+				st.write(csvscan.count_records(raw_path_dbg))
+			load_info = df.attrs.get('load')
+			if load_info:
+				st.write({
+					"load_seconds": round(load_info['seconds'], 4),
+					"load_cache": 'hit' if load_info['hit'] else 'rebuild',
+					"load_reason": load_info.get('reason'),
+				})
+			st.write({"result_cache": an.RESULTS.stats()})
+			st.write({"dataset_bytes": int(df.memory_usage(deep=True).sum()),
+					  "mapped_bytes": (df.attrs.get('shared') or {}).get('bytes')})
 			# Always show cleaned/filtered rows
 			st.write({
 				"cleaned_rows": int(len(df)),
@@ -240,93 +307,143 @@ def main():
 			})
 		except Exception as e:
 			st.write({"debug_error": str(e)})
+		st.checkbox('Trace reruns', key='trace_on', help='Record a per-call timing breakdown of each rerun')
+		st.checkbox('Trace memory (slow)', key='trace_memory', disabled=not st.session_state.get('trace_on'))
+		# filled once the selected view has rendered
+		timing_slot = st.empty()
+
+	# Views: only the selected one is computed and drawn on a rerun
+	view = st.radio('View', VIEWS, index=0, horizontal=True, label_visibility='collapsed', key='view')
+	ctx = dict(df=df, df_f=df_f, cube=cube, ranges=ranges, sidx=sidx, filters=filters, query=query, template=template)
+	t_view = time.perf_counter()
+	with instrument.span(f'view {view}'):
+		RENDERERS[view](**ctx)
+	with timing_slot.container():
+		st.write({
+			"view": view,
+			"view_ms": round((time.perf_counter() - t_view) * 1000, 1),
+			"rerun_ms": round((time.perf_counter() - t_rerun) * 1000, 1),
+			"startup_import_ms": round(IMPORT_SECONDS * 1000, 1),
+		})
+		if 'source.visuals' in sys.modules:
+			st.write({"figure_cache": sys.modules['source.visuals'].FIGURES.stats()})
+		if tr is not None:
+			st.dataframe(tr.table(), hide_index=True)
+			st.download_button('Export trace (JSON)', tr.to_json(indent=1), file_name='trace.json', mime='application/json')
+
+
+def render_overview(df, df_f, cube, ranges, sidx, filters, query, template):
+	st.subheader('Overview')
+	st.write('Number of titles (Movies and Shows or both) per decade.')
+	tp = cube.titles_per_decade(**filters)
+	_chart(_vz().line_titles_per_decade(tp, template=template))
+
+
+def render_genres(df, df_f, cube, ranges, sidx, filters, query, template):
+	st.subheader('Top Genres')
+	tg = cube.top_genres(n=10, **filters)
+	_chart(_vz().bar_top_genres(tg, template=template))
+
+	st.write('Click a bar and filter above for a simple drilldown table.')
+	cols = ['title', 'release_year', 'type', 'primary_genre', 'imdb_score']
+	q = st.text_input('Search titles and descriptions', key='search', placeholder='e.g. dark kni')
+	if q.strip():
+		# ranked index lookup, restricted to the filtered rows
+		pos, scores = sidx.search(q, rows=df.index.get_indexer(df_f.index), limit=25)
+		hits = df.iloc[pos][cols].assign(score=scores.round(2))
+		st.caption(f'{len(hits)} best matches')
+		st.dataframe(hits)
+	else:
+		pos = df.index.get_indexer(df_f.index[:25])
+		st.dataframe(df_f[cols].head(25))
+
+	pick = st.selectbox('Titles like', pos.tolist(), index=None, key='similar_to',
+						format_func=lambda p: df['title'].iat[p], placeholder='Pick a title from the table')
+	if pick is not None:
+		with st.spinner('Finding similar titles…'), instrument.span('similar'):
+			near = similar_index()
+		if near is None:
+			st.info(f'Similar titles are not built for this catalogue ({len(df):,} titles). '
+					'Run `python -m source.similar data/cleaned.csv` once, then reload.')
+		else:
+			nb, sims = near.of(pick)
+			st.dataframe(df.iloc[nb][cols].assign(similarity=sims.round(3)))
 
-	# Tabs
-	tabs = st.tabs(['Overview', 'Genres', 'Ratings', 'Popularity', 'Countries', 'Map', 'Compare'])
 
-	with tabs[0]:
-		st.subheader('Overview')
-		st.write('Number of titles (Movies and Shows or both) per decade.')
-		tp = an.titles_per_decade(df_f)
-		fig = vz.line_titles_per_decade(tp, template=template)
-		st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+def render_ratings(df, df_f, cube, ranges, sidx, filters, query, template):
+	st.subheader('Ratings (IMDb first)')
+	vz = _vz()
+	_chart(vz.hist_scores(df_f[['imdb_score']].dropna(), score_col='imdb_score', template=template))
 
-	with tabs[1]:
-		st.subheader('Top Genres')
-		tg = an.top_genres(df_f, n=10)
-		fig = vz.bar_top_genres(tg, template=template)
-		st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+	# percentiles from the clean-time profile (type / decade cells), without
+	# scanning rows; a genre filter needs the filtered rows
+	if filters['genres']:
+		pct = an.cached(profiling.summarize, df, **query)
+	else:
+		pct = profile().summary(type_value=filters['type_value'], decades=filters['decades'])
+	st.write('Numeric columns: exact count, mean, spread and range; percentiles approximate (about 1% in rank)')
+	st.dataframe(pct.round(2), hide_index=True)
 
-		st.write('Click a bar and filter above for a simple drilldown table.')
-		st.dataframe(df_f[['title', 'release_year', 'type', 'primary_genre', 'imdb_score']].head(25))
+	if ranges.supports(**filters):
+		best = ranges.best_per_year(df, **filters)
+	else:
+		best = an.cached(an.best_imdb_each_year, df, **query)
+	_chart(vz.line_best_imdb_each_year(best, template=template))
 
-	with tabs[2]:
-		st.subheader('Ratings (IMDb first)')
-		hist = vz.hist_scores(df_f[['imdb_score']].dropna(), score_col='imdb_score', template=template)
-		st.plotly_chart(hist, use_container_width=True, config={"displayModeBar": False})
 
-		best = an.best_imdb_each_year(df_f)
-		fig2 = vz.line_best_imdb_each_year(best, template=template)
-		st.plotly_chart(fig2, use_container_width=True, config={"displayModeBar": False})
+def render_popularity(df, df_f, cube, ranges, sidx, filters, query, template):
+	st.subheader('Popularity')
+	top_pop = an.cached(an.top_popular, df, n=20, **query)
+	_chart(_vz().bar_top_popular(top_pop, template=template))
 
-	with tabs[3]:
-		st.subheader('Popularity')
-		top_pop = an.top_popular(df_f, n=20)
-		fig = vz.bar_top_popular(top_pop, template=template)
-		st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
 
-	with tabs[4]:
-		st.subheader('Countries (Production)')
-		cc = an.country_counts(df_f)
-
-		# Build friendly label: country full name only (no emoji)
-		def country_label(v):
-			try:
-				if not isinstance(v, str):
-					return str(v)
-				code = v.strip().upper()
-				rec = None
-				if len(code) == 2 and code.isalpha():
-					rec = pycountry.countries.get(alpha_2=code)
-				elif len(code) == 3 and code.isalpha():
-					rec = pycountry.countries.get(alpha_3=code)
-				if rec is None:
-					rec = pycountry.countries.get(name=code)
-				return rec.name if rec else code
-			except Exception:
-				return str(v)
-
-		cc = cc.copy()
-		if 'country' in cc.columns:
-			cc['label'] = cc['country'].apply(country_label)
-
-		fig = vz.bar_top_countries(cc, template=template)
-		st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+def render_countries(df, df_f, cube, ranges, sidx, filters, query, template):
+	from source import countries
+	st.subheader('Countries (Production)')
+	cc = cube.country_counts(**filters)
+
+	# Build friendly label: country full name only (no emoji), from the precomputed table
+	cc = cc.copy()
+	if 'country' in cc.columns:
+		cc['label'] = countries.labels(cc['country'])
+
+	_chart(_vz().bar_top_countries(cc, template=template))
+
+
+def render_map(df, df_f, cube, ranges, sidx, filters, query, template):
+	st.subheader('World Map (Heatmap)')
+	st.caption('A big, simple heatmap of production countries. Filter on the left to update it.')
+	cc = cube.country_counts(**filters)
+
+	# Simple control for value scaling only
+	scale_mode = st.radio('Scale', ['Log','Linear'], index=0, horizontal=True)
+
+	map_fig = _vz().choropleth_countries(
+		cc,
+		template=template,
+		height=820,
+		color_scale='Blues',
+		scale_mode=scale_mode.lower(),
+	)
+	_chart(map_fig)
+
+
+def render_compare(df, df_f, cube, ranges, sidx, filters, query, template):
+	st.subheader('Compare IMDb vs TMDB')
+	comp = an.cached(an.imdb_vs_tmdb, df, **query)
+	color_by = 'type' if 'type' in comp.columns else None
+	_chart(_vz().scatter_imdb_vs_tmdb(comp, color_by=color_by, template=template))
 
-	with tabs[5]:
-		st.subheader('World Map (Heatmap)')
-		st.caption('A big, simple heatmap of production countries. Filter on the left to update it.')
-		cc = an.country_counts(df_f)
-
-		# Simple control for value scaling only
-		scale_mode = st.radio('Scale', ['Log','Linear'], index=0, horizontal=True)
-
-		map_fig = vz.choropleth_countries(
-			cc,
-			template=template,
-			height=820,
-			color_scale='Blues',
-			scale_mode=scale_mode.lower(),
-		)
-		st.plotly_chart(map_fig, use_container_width=True, config={"displayModeBar": False})
-
-	with tabs[6]:
-		st.subheader('Compare IMDb vs TMDB')
-		comp = an.imdb_vs_tmdb(df_f)
-		color_by = 'type' if 'type' in comp.columns else None
-		fig = vz.scatter_imdb_vs_tmdb(comp, color_by=color_by, template=template)
-		st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
 
+RENDERERS = {
+	'Overview': render_overview,
+	'Genres': render_genres,
+	'Ratings': render_ratings,
+	'Popularity': render_popularity,
+	'Countries': render_countries,
+	'Map': render_map,
+	'Compare': render_compare,
+}
 
 if __name__ == '__main__':
 	main()
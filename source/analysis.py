@@ -1,122 +1,323 @@
+import hashlib
+import inspect
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
 import pandas as pd
 
+from source import colstore
+from source import planner
+from source import instrument
+from source import schema
+from source import shared as sharedstore
+from source import topk
+from source.cleaning import parse_list_column
+from source.multihot import MultiHotIndex
 
-def load_cleaned(path: str = 'data/cleaned.csv'):
-	df = pd.read_csv(path)
-	return df
+LIST_COLUMNS = ['genres', 'production_countries']
+
+
+@instrument.timed
+def load_cleaned(path: str = 'data/cleaned.csv', use_cache: bool = True, compact: bool = False, shared: bool = False):
+	# with use_cache the CSV is parsed once into a binary column store
+	# (data/.cache/<name>/) and reloaded from there until the CSV changes;
+	# df.attrs['load'] reports the load time and whether the cache was hit.
+	# compact applies schema.SCHEMA (categoricals, narrow ints, float32 scores).
+	# shared (implies compact) publishes the compact frame once as memory-mapped
+	# column files (source/shared.py) and returns a read-only frame over them,
+	# the same pages for every process and session that loads it
+	if shared:
+		t0 = time.perf_counter()
+		directory = sharedstore.shared_dir_for(path)
+		source = colstore.source_fingerprint(path, with_hash=False)
+		df = sharedstore.attach_current(directory, source)
+		info = {'source': path, 'shared': directory, 'hit': df is not None, 'reason': 'attached' if df is not None else 'published'}
+		if df is None:
+			# attach the version this call published, not whatever CURRENT names by
+			# now (another process may have republished in between)
+			frame = load_cleaned(path, use_cache, compact=True)
+			version = sharedstore.publish(frame, directory, source)
+			try:
+				df = sharedstore.attach(version)
+			except OSError:
+				# a newer version replaced it before it was mapped: serve the frame built here
+				df, info['reason'] = frame, 'unshared'
+		else:
+			version = df.attrs['shared']['version']
+		# the published version (CSV size + mtime) identifies the data across processes
+		info.update(version=os.path.basename(version), rows=int(len(df)), seconds=time.perf_counter() - t0)
+		df.attrs['load'] = info
+		return _versioned(df, info['version'])
+	if not use_cache:
+		df = pd.read_csv(path)
+		return schema.compact(df) if compact else df
+	df, info = colstore.load_csv(path)
+	if compact:
+		df = schema.compact(df)
+	df.attrs['load'] = info
+	# the compact frame holds other dtypes, so its results are kept apart
+	return _versioned(df, f"{info['version']}-compact" if compact else info['version'])
+
+
+def result_bytes(value):
+	# approximate size of a cached result: array / frame buffers (strings by
+	# their buffers, not per object), small Python values by getsizeof
+	if isinstance(value, pd.DataFrame):
+		return int(value.memory_usage(index=True).sum())
+	if isinstance(value, pd.Series):
+		return int(value.memory_usage(index=True))
+	# numpy arrays (e.g. filter_rows positions)
+	nbytes = getattr(value, 'nbytes', None)
+	return sys.getsizeof(value) if nbytes is None else int(nbytes)
+
+
+class ResultCache:
+	"""Thread-safe LRU cache for analysis results, bounded by entry count and approximate bytes.
+
+	Entries are keyed per dataset version, so callers alternating between
+	datasets keep each one's results; stale versions age out of the LRU.
+	Cached results are shared between callers, so treat them as read-only.
+	"""
+
+	def __init__(self, maxsize=256, max_bytes=256 << 20):
+		self.maxsize = maxsize
+		self.max_bytes = max_bytes
+		self.bytes = 0
+		self.hits = self.misses = self.evictions = 0
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
 
+	def get_or_compute(self, version, key, compute):
+		key = (version, key)
+		with self._lock:
+			if key in self._data:
+				self._data.move_to_end(key)
+				self.hits += 1
+				return self._data[key][0]
+			self.misses += 1
+		value = compute()
+		size = result_bytes(value)
+		with self._lock:
+			if key not in self._data and size <= self.max_bytes:
+				self._data[key] = (value, size)
+				self.bytes += size
+				while len(self._data) > self.maxsize or self.bytes > self.max_bytes:
+					_, (_, dropped) = self._data.popitem(last=False)
+					self.bytes -= dropped
+					self.evictions += 1
+		return value
 
-def filter_data(df, type_value=None, decades=None, genres=None):
-	data = df.copy()
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+			self.bytes = 0
 
-	if type_value:
-		data = data[data['type'].str.upper() == type_value.upper()]
+	def stats(self):
+		with self._lock:
+			return {
+				'size': len(self._data), 'maxsize': self.maxsize, 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+				'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+				'versions': len({version for version, _ in self._data}),
+			}
 
-	if decades and len(decades) == 2:
-		# decades are strings like "1970s" -> take first 4 chars
-		def decade_to_int(x):
+
+RESULTS = ResultCache()
+
+# id(frame) -> content fingerprint, and id(frame) -> version for the frames
+# load_cleaned returned; each entry is dropped when its frame is collected,
+# so a reused id never finds a stale one. Keyed on the frame object, not on
+# df.attrs, which pandas copies onto every frame derived from it
+_FINGERPRINTS = {}
+_VERSIONS = {}
+
+
+def _versioned(df, version):
+	if version:
+		_VERSIONS[id(df)] = version
+		weakref.finalize(df, _VERSIONS.pop, id(df), None)
+	return df
+
+
+def frame_fingerprint(df):
+	"""sha1 of a frame's columns, dtypes, index and values, computed once per frame object.
+
+	List cells are hashed by their text. The frame is assumed not to be
+	mutated in place afterwards, as for every cached result.
+	"""
+	fp = _FINGERPRINTS.get(id(df))
+	if fp is None:
+		h = hashlib.sha1(repr((list(df.columns), [str(t) for t in df.dtypes], len(df))).encode())
+		h.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+		for col in df.columns:
 			try:
-				return int(str(x)[:4])
-			except Exception:
-				return None
-		start_dec = decade_to_int(decades[0])
-		end_dec = decade_to_int(decades[1])
-		if start_dec is not None and end_dec is not None and 'decade' in data.columns:
-			d_int = data['decade'].astype(str).str[:4].astype('int', errors='ignore')
-			data = data[(d_int >= start_dec) & (d_int <= end_dec)]
-
-	if genres and len(genres) > 0 and 'genres' in data.columns:
-		# genres stored as strings like "['drama','crime']"; ensure list
-		def has_any(lst):
-			if not isinstance(lst, list):
-				return False
-			return any(g in lst for g in genres)
-		# try to eval strings to list
-		parsed = []
-		for v in data['genres']:
-			if isinstance(v, list):
-				parsed.append(v)
-			else:
-				try:
-					parsed.append(eval(v))
-				except Exception:
-					parsed.append([])
-		data = data.copy()
-		data['__genres_list'] = parsed
-		data = data[data['__genres_list'].apply(has_any)]
-		data = data.drop(columns=['__genres_list'])
-
-	return data
+				values = pd.util.hash_pandas_object(df[col], index=False)
+			except TypeError:
+				values = pd.util.hash_pandas_object(df[col].astype(str), index=False)
+			h.update(values.to_numpy().tobytes())
+		fp = f'frame-{h.hexdigest()}'
+		_FINGERPRINTS[id(df)] = fp
+		weakref.finalize(df, _FINGERPRINTS.pop, id(df), None)
+	return fp
+
+
+def dataset_version(df):
+	# the source CSV's version for the very frame load_cleaned returned; any
+	# other frame (a subset or copy of it included) by a content fingerprint
+	# (or pass version= explicitly to skip hashing it)
+	return _VERSIONS.get(id(df)) or frame_fingerprint(df)
+
+
+def _filter_key(type_value, decades, genres, genre_mode):
+	return (
+		type_value.upper() if type_value else None,
+		tuple(decades) if decades and len(decades) == 2 else None,
+		tuple(sorted(set(genres))) if genres else (),
+		genre_mode if genres else None,
+	)
 
 
+def cached(fn, df, type_value=None, decades=None, genres=None, index=None, genre_mode='any',
+		   version=None, cache=None, **kwargs):
+	"""fn(filter_data(df, ...), **kwargs), memoized per dataset version and filter.
+
+	fn is filter_data itself or any function of the filtered frame (top_genres,
+	country_counts, ...). index is forwarded to filter_rows and to fn when fn
+	takes it, but is not part of the key. Only the filter's row positions are
+	cached, not the filtered frame (8 bytes a row instead of a copy of every
+	column); the rows are taken again when fn's result has to be computed.
+	"""
+	cache = cache or RESULTS
+	version = version or dataset_version(df)
+	fkey = _filter_key(type_value, decades, genres, genre_mode)
+	rows = cache.get_or_compute(version, ('filter_rows', fkey), lambda: filter_rows(
+		df, type_value=type_value, decades=decades, genres=genres, index=index, genre_mode=genre_mode))
+
+	def filtered():
+		return df.iloc[:] if len(rows) == len(df) else df.iloc[rows]
+
+	if fn is filter_data:
+		return filtered()
+	if index is not None and 'index' in inspect.signature(fn).parameters:
+		kwargs['index'] = index
+	key = (fn.__module__, fn.__name__, fkey, tuple(sorted((k, v) for k, v in kwargs.items() if k != 'index')))
+	return cache.get_or_compute(version, key, lambda: fn(filtered(), **kwargs))
+
+
+@instrument.timed
+def build_list_indexes(df):
+	# multi-hot indexes for the list columns plus the filter planner's typed
+	# keys ('keys'); build once per loaded frame and pass as index= to
+	# filter_data / filter_rows / top_genres / country_counts
+	index = {col: MultiHotIndex.build(df, col) for col in LIST_COLUMNS if col in df.columns}
+	index['keys'] = planner.FilterKeys.build(df, index.get('genres'))
+	return index
+
+
+@instrument.timed
+def filter_rows(df, type_value=None, decades=None, genres=None, index=None, genre_mode='any'):
+	"""Row positions (ascending int64) of the rows filter_data keeps.
+
+	Planned by source/planner.py over typed keys (type code, decade year,
+	genre multi-hot) built once per frame by build_list_indexes: the most
+	selective predicate runs first and the rest only over the rows it
+	keeps. Nothing is copied; take the rows with df.iloc[rows] when a frame
+	is needed. Decade ranges are inclusive; rows whose decade does not parse
+	never match a decade range.
+	"""
+	return planner.select(df, type_value, decades, genres, index, genre_mode)
+
+
+@instrument.timed
+def filter_data(df, type_value=None, decades=None, genres=None, index=None, genre_mode='any'):
+	# genre_mode: 'any' keeps titles with at least one picked genre, 'all' with every one.
+	# A new frame of the kept rows, materialized once; df itself (possibly a
+	# read-only shared one) is not copied whole
+	rows = filter_rows(df, type_value, decades, genres, index, genre_mode)
+	if len(rows) == len(df):
+		return df.iloc[:]
+	return df.iloc[rows]
+
+
+@instrument.timed
+def unique_list_values(df, col='genres'):
+	# sorted distinct items of a list column (e.g. the genre picker options)
+	if col not in df.columns:
+		return []
+	return sorted(set(parse_list_column(df[col]).values.tolist()))
+
+
+@instrument.timed
 def titles_per_decade(df):
 	if 'decade' not in df.columns:
 		return pd.DataFrame({'decade': [], 'count': []})
-	out = df.groupby('decade').size().reset_index(name='count').sort_values('decade')
+	out = df.groupby('decade', observed=True).size().reset_index(name='count').sort_values('decade')
 	return out
 
 
-def top_genres(df, n=10):
+def _indexed_counts(df, index, col, label):
+	mh = index[col]
+	counts = mh.counts(mh.positions(df.index)).sort_values(ascending=False, kind='stable')
+	return counts.rename_axis(label).reset_index()
+
+
+@instrument.timed
+def top_genres(df, n=10, index=None):
 	if 'genres' not in df.columns:
 		return pd.DataFrame({'genre': [], 'count': []})
-	# ensure list
-	rows = []
-	for v in df['genres']:
-		if isinstance(v, list):
-			rows.extend(v)
-		else:
-			try:
-				rows.extend(eval(v))
-			except Exception:
-				pass
-	s = pd.Series(rows)
+	if index and 'genres' in index:
+		return _indexed_counts(df, index, 'genres', 'genre').head(n)
+	s = pd.Series(parse_list_column(df['genres']).values)
 	counts = s.value_counts().head(n)
 	return counts.reset_index().rename(columns={'index': 'genre', 0: 'count'})
 
 
+@instrument.timed
 def score_distribution(df, score_col='imdb_score'):
 	if score_col not in df.columns:
 		return df[[score_col]].dropna()  # will error; simple return
 	return df[[score_col]].dropna()
 
 
-def best_imdb_each_year(df):
+@instrument.timed
+def best_imdb_each_year(df, min_votes=None):
 	if 'imdb_score' not in df.columns or 'release_year' not in df.columns:
 		return pd.DataFrame({'release_year': [], 'title': [], 'imdb_score': []})
-	# keep rows with year
-	temp = df.dropna(subset=['release_year', 'imdb_score'])
-	temp['release_year'] = temp['release_year'].astype(int, errors='ignore')
-	# idxmax per year
-	idx = temp.groupby('release_year')['imdb_score'].idxmax()
-	out = temp.loc[idx, ['release_year', 'title', 'imdb_score']].sort_values('release_year')
-	return out
+	# first title with the year's highest score (rows without a year or score skipped)
+	out = topk.top_k(df, 'imdb_score', k=1, by='release_year', min_votes=min_votes, columns=['title', 'imdb_score'])
+	out['release_year'] = out['release_year'].astype(int)
+	return out[['release_year', 'title', 'imdb_score']]
+
+
+@instrument.timed
+def top_titles(df, score_col='imdb_score', k=10, by=None, min_votes=None, index=None):
+	# k best titles overall or per release_year / decade / genres / production_countries, see topk.top_k
+	return topk.top_k(df, score_col, k=k, by=by, min_votes=min_votes, index=index)
 
 
-def country_counts(df):
+@instrument.timed
+def country_counts(df, index=None):
 	if 'production_countries' not in df.columns:
 		return pd.DataFrame({'country': [], 'count': []})
-	rows = []
-	for v in df['production_countries']:
-		if isinstance(v, list):
-			rows.extend(v)
-		else:
-			try:
-				rows.extend(eval(v))
-			except Exception:
-				pass
-	s = pd.Series(rows)
+	if index and 'production_countries' in index:
+		return _indexed_counts(df, index, 'production_countries', 'country')
+	s = pd.Series(parse_list_column(df['production_countries']).values)
 	counts = s.value_counts()
 	return counts.reset_index().rename(columns={'index': 'country', 0: 'count'})
 
 
-def top_popular(df, n=20):
+@instrument.timed
+def top_popular(df, n=20, min_votes=None):
 	if 'tmdb_popularity' not in df.columns:
 		return pd.DataFrame({'title': [], 'tmdb_popularity': []})
-	temp = df.dropna(subset=['tmdb_popularity'])
-	out = temp.sort_values('tmdb_popularity', ascending=False).head(n)
-	return out[['title', 'tmdb_popularity', 'release_year']]
+	out = topk.top_k(df, 'tmdb_popularity', k=n, min_votes=min_votes, columns=['title', 'tmdb_popularity', 'release_year'])
+	return out.drop(columns='rank')
 
 
+@instrument.timed
 def imdb_vs_tmdb(df):
 	# return rows with both scores present for comparison
 	cols = ['imdb_score', 'tmdb_score']
@@ -0,0 +1,242 @@
+"""Local HTTP/JSON API over the dashboard's numbers.
+
+	python -m source.api --data data/cleaned.csv --port 8765
+
+	GET /top_genres?type=MOVIE&decades=1990s,2010s&genres=drama,comedy&genre_mode=all&n=10
+
+Endpoints: titles_per_decade, top_genres, country_counts, best_per_year,
+top_popular, imdb_vs_tmdb and kpis, each taking filter_data's filters as
+query parameters (type, decades=start,end, genres=a,b, genre_mode=any|all)
+plus its own (n, limit, min_votes). /stats reports request counts,
+throughput and latency percentiles per endpoint; /health is a liveness
+check. Responses are {"endpoint", "filters", "rows", "data": [records]}.
+
+The dataset (shared memory-mapped columns), its multi-hot indexes, the
+count cube and the year-range index are loaded once and only read by
+requests, each served on its own thread; filtered results are memoized in
+analysis.RESULTS.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from source import analysis as an
+from source import cube as cb
+from source import ranges as rg
+from source import schema
+
+
+class BadRequest(ValueError):
+	pass
+
+
+class Metrics:
+	"""Thread-safe request counters and recent latencies per endpoint."""
+
+	def __init__(self, window=10_000):
+		self.window = window
+		self.started = time.time()
+		self._lock = threading.Lock()
+		self._latency = {}
+		self._count = {}
+		self._errors = {}
+		# completion times of recent requests, for the last-minute rate
+		self._recent = deque(maxlen=window)
+
+	def record(self, endpoint, seconds, ok=True):
+		with self._lock:
+			self._latency.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+			self._count[endpoint] = self._count.get(endpoint, 0) + 1
+			if not ok:
+				self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+			self._recent.append(time.time())
+
+	def snapshot(self):
+		with self._lock:
+			latency = {k: np.array(v) for k, v in self._latency.items()}
+			count, errors, recent = dict(self._count), dict(self._errors), np.array(self._recent)
+		now = time.time()
+		uptime = now - self.started
+		total = sum(count.values())
+		endpoints = {}
+		for name, lat in sorted(latency.items()):
+			p50, p90, p99 = np.percentile(lat, [50, 90, 99]) * 1000
+			endpoints[name] = {
+				'requests': count[name], 'errors': errors.get(name, 0),
+				'p50_ms': round(p50, 3), 'p90_ms': round(p90, 3), 'p99_ms': round(p99, 3),
+				'max_ms': round(lat.max() * 1000, 3), 'mean_ms': round(lat.mean() * 1000, 3),
+			}
+		return {
+			'uptime_s': round(uptime, 1), 'requests': total,
+			'requests_per_s': round(total / uptime, 2) if uptime else None,
+			'requests_per_s_1m': round(int((recent > now - 60).sum()) / min(60, uptime), 2) if uptime else None,
+			'latency_window': self.window, 'endpoints': endpoints, 'result_cache': an.RESULTS.stats(),
+		}
+
+
+def parse_filters(params):
+	"""filter_data's keyword arguments from query parameters."""
+	def one(name, default=None):
+		values = params.get(name)
+		return values[-1] if values else default
+
+	def many(name):
+		return [v.strip() for value in params.get(name, []) for v in value.split(',') if v.strip()]
+
+	type_value = one('type')
+	if type_value and type_value.upper() == 'ALL':
+		type_value = None
+	decades = many('decades')
+	if decades and len(decades) != 2:
+		raise BadRequest('decades takes two values: start,end (e.g. 1990s,2010s)')
+	genre_mode = one('genre_mode', 'any').lower()
+	if genre_mode not in ('any', 'all'):
+		raise BadRequest("genre_mode is 'any' or 'all'")
+	return {'type_value': type_value, 'decades': decades or None, 'genres': many('genres'), 'genre_mode': genre_mode}
+
+
+def _int(params, name, default=None):
+	values = params.get(name)
+	if not values:
+		return default
+	try:
+		return int(values[-1])
+	except ValueError:
+		raise BadRequest(f'{name} must be an integer') from None
+
+
+def _head(frame, limit):
+	return frame.head(limit) if limit else frame
+
+
+# endpoint -> fn(state, filters, params) returning a frame; counts come from
+# the cube, row-level results from the filtered frame, as in the dashboard
+ENDPOINTS = {
+	'titles_per_decade': lambda s, f, p: s['cube'].titles_per_decade(**f),
+	'top_genres': lambda s, f, p: s['cube'].top_genres(n=_int(p, 'n', 10), **f),
+	'country_counts': lambda s, f, p: _head(s['cube'].country_counts(**f), _int(p, 'limit')),
+	'best_per_year': lambda s, f, p: _best_per_year(s, f, _int(p, 'min_votes')),
+	'top_popular': lambda s, f, p: an.cached(an.top_popular, s['df'], index=s['index'], n=_int(p, 'n', 20),
+											 min_votes=_int(p, 'min_votes'), **f),
+	'imdb_vs_tmdb': lambda s, f, p: _head(
+		an.cached(an.imdb_vs_tmdb, s['df'], index=s['index'], **f)[['title', 'type', 'release_year', 'imdb_score', 'tmdb_score']],
+		_int(p, 'limit', 5000)),
+	'kpis': lambda s, f, p: _kpis(s, f),
+}
+
+
+def _best_per_year(state, filters, min_votes):
+	if min_votes is None and state['ranges'].supports(**filters):
+		return state['ranges'].best_per_year(state['df'], **filters)
+	return an.cached(an.best_imdb_each_year, state['df'], index=state['index'], min_votes=min_votes, **filters)
+
+
+def _kpis(state, filters):
+	cube, ranges = state['cube'], state['ranges']
+	row = {'titles': cube.count(**filters), 'avg_imdb_score': cube.mean_score('imdb_score', **filters)}
+	# spread, best score and year span: O(1) from the year-range index for at
+	# most one genre, else from the filtered rows
+	if ranges.supports(**filters):
+		summary, years = ranges.summary('imdb_score', **filters), ranges.year_span(**filters)
+		std, best = summary['std'], summary['max']
+	else:
+		sub = an.cached(an.filter_data, state['df'], index=state['index'], **filters)
+		score, year = sub['imdb_score'].dropna(), sub['release_year'].dropna()
+		std, best = float(score.std()), float(score.max()) if len(score) else float('nan')
+		years = (year.min().item(), year.max().item()) if len(year) else None
+	# the scores are float32: report them (and their aggregates) at float32's precision
+	avg, std, best = schema.widen_float32([row['avg_imdb_score'], std, best]).tolist()
+	row.update(avg_imdb_score=avg, imdb_score_std=std, max_imdb_score=best,
+			   year_min=int(years[0]) if years else None, year_max=int(years[1]) if years else None)
+	return pd.DataFrame([row])
+
+
+def load_state(path):
+	df = an.load_cleaned(path, shared=True)
+	index = an.build_list_indexes(df)
+	return {'path': path, 'df': df, 'index': index, 'cube': cb.build_cube(df), 'ranges': rg.build_ranges(df, index)}
+
+
+class Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	server_version = 'MovieMind'
+
+	def do_GET(self):
+		t = time.perf_counter()
+		url = urlsplit(self.path)
+		endpoint = url.path.strip('/') or 'health'
+		status, body = 200, None
+		try:
+			if endpoint == 'health':
+				body = json.dumps({'status': 'ok', 'rows': len(self.server.state['df'])})
+			elif endpoint == 'stats':
+				body = json.dumps(self.server.metrics.snapshot())
+			elif endpoint in ENDPOINTS:
+				params = parse_qs(url.query)
+				filters = parse_filters(params)
+				# float32 scores widened at their stored precision, not as 7.4000000954
+				out = schema.widen_floats(ENDPOINTS[endpoint](self.server.state, filters, params))
+				# the frame serializes itself; only the envelope goes through json
+				body = (f'{{"endpoint":{json.dumps(endpoint)},"filters":{json.dumps(filters)},'
+						f'"rows":{len(out)},"data":{out.to_json(orient="records")}}}')
+			else:
+				status, body = 404, json.dumps({'error': f'unknown endpoint {endpoint!r}', 'endpoints': sorted(ENDPOINTS)})
+		except BadRequest as e:
+			status, body = 400, json.dumps({'error': str(e)})
+		except Exception as e:
+			status, body = 500, json.dumps({'error': f'{type(e).__name__}: {e}'})
+		data = body.encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.send_header('Server-Timing', f'app;dur={(time.perf_counter() - t) * 1000:.2f}')
+		self.end_headers()
+		self.wfile.write(data)
+		if endpoint not in ('health', 'stats'):
+			self.server.metrics.record(endpoint if status != 404 else '(unknown)', time.perf_counter() - t, status < 400)
+
+	def log_message(self, format, *args):
+		if self.server.verbose:
+			super().log_message(format, *args)
+
+
+def make_server(path='data/cleaned.csv', host='127.0.0.1', port=8765, verbose=False):
+	"""A ThreadingHTTPServer with the dataset loaded; call serve_forever() on it."""
+	server = ThreadingHTTPServer((host, port), Handler)
+	server.daemon_threads = True
+	server.state = load_state(path)
+	server.metrics = Metrics()
+	server.verbose = verbose
+	return server
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--data', default='data/cleaned.csv')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--verbose', action='store_true', help='log every request')
+	args = parser.parse_args(argv)
+
+	t = time.perf_counter()
+	server = make_server(args.data, args.host, args.port, args.verbose)
+	print(f"{len(server.state['df'])} titles loaded in {time.perf_counter() - t:.2f}s; "
+		  f'serving on http://{args.host}:{server.server_port}/', flush=True)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,6 +1,19 @@
 import ast #tool for parsing Python code
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress
+import numpy as np
 import pandas as pd
 
+from source import csvscan
+from source import instrument
+from source import profiling
+from source import search
+from source.ragged import Ragged
+
 def parseList(value): # convert a value like "['drama', 'crime']" (a string) into a Python list
     #---> input values: could be NaN, a string, a list, or other types
     
@@ -34,10 +47,84 @@ def parseList(value): # convert a value like "['drama', 'crime']" (a string) int
 	#For any other type returns [str(value)]
 	return [str(value)]
 
-def clean_data(): #Loads the CSV and performs the full cleaning pipeline on data/data.csv.
-    #---> uses the fixed CSV path: data/data.csv
+# Strict form written by save_cleaned_data: "['a', 'b']" with plain single-quoted
+# items (no quotes, backslashes or newlines inside). An item that is exactly ', '
+# would read as a separator in the split below, so it is not strict either.
+# Anything else goes through parseList.
+_LIST_RE = re.compile(r"\[(?:'(?!, ')[^'\\\n]*'(?:, '(?!, ')[^'\\\n]*')*)?\]")
+_ITEM_SEP = "', '"
+
+def _parse_cells(cells): # parseList over a list of distinct cells, as a Ragged
+	match = _LIST_RE.fullmatch
+	strict = [type(t) is str and match(t) is not None for t in cells]
+	lengths = np.zeros(len(cells), dtype=np.int64)
+	mask = np.zeros(len(cells), dtype=bool)
+
+	# strict cells: one join + split over all of them, item count from separators
+	nonempty = [k and len(t) > 2 for t, k in zip(cells, strict)]
+	body = '\n'.join(compress(cells, nonempty))
+	fast_values = body[2:-2].replace("']\n['", _ITEM_SEP).split(_ITEM_SEP) if body else []
+	lengths[np.flatnonzero(nonempty)] = [t.count(_ITEM_SEP) + 1 for t in compress(cells, nonempty)]
+
+	# everything else keeps parseList semantics (lists are passed through)
+	slow = {}
+	for i in np.flatnonzero(~np.array(strict, dtype=bool)).tolist():
+		v = cells[i]
+		lst = v if isinstance(v, list) else parseList(v)
+		if lst is None:
+			mask[i] = True
+		else:
+			lengths[i] = len(lst)
+			slow[i] = lst
+
+	offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+	np.cumsum(lengths, out=offsets[1:])
+	values = np.empty(int(offsets[-1]), dtype=object)
+	if not slow:
+		values[:] = fast_values
+		return Ragged(offsets, values, mask)
+	# scatter strict items to their row slots, then fill the other rows
+	fast_rows = np.flatnonzero(nonempty)
+	fast_lengths = lengths[fast_rows]
+	within = np.arange(len(fast_values)) - np.repeat(np.cumsum(fast_lengths) - fast_lengths, fast_lengths)
+	values[np.repeat(offsets[fast_rows], fast_lengths) + within] = fast_values
+	for i, lst in slow.items():
+		values[offsets[i]:offsets[i + 1]] = lst
+	return Ragged(offsets, values, mask)
+
+@instrument.timed
+def parse_list_column(series): # vectorized parseList over a whole column
+    #---> returns a Ragged (offsets + values); rows parseList maps to None are masked
+    #---> list cells repeat a lot (genre combos), so only distinct cells are parsed
+
+	s = pd.Series(series).reset_index(drop=True)
+	try:
+		codes, uniques = pd.factorize(s, use_na_sentinel=True)
+	except TypeError:
+		# unhashable cells (already lists): dedupe by object identity instead,
+		# which still catches the shared lists the column store hands out
+		cells = s.tolist()
+		codes, _ = pd.factorize(np.fromiter((id(v) for v in cells), dtype=np.int64, count=len(cells)))
+		_, first = np.unique(codes, return_index=True)
+		return _parse_cells([cells[i] for i in first.tolist()]).take(codes)
+	parsed = _parse_cells(list(uniques) + [None])
+	# code -1 (NaN) picks the trailing None row
+	return parsed.take(np.where(codes < 0, len(uniques), codes))
+
+@instrument.timed
+def clean_data(path='data/data.csv'): #Loads the CSV and performs the full cleaning pipeline on data/data.csv.
+    #---> uses data/data.csv unless another path is given
     
-	df = pd.read_csv('data/data.csv')
+	df = pd.read_csv(path)
+	df = clean_frame(df)
+
+	# 5) Drop duplicate ids if present (if they exist)
+	if 'id' in df.columns:
+		df = df.drop_duplicates(subset=['id'], keep='first').reset_index(drop=True)
+	return df
+
+@instrument.timed
+def clean_frame(df): #Steps 1-4 of the pipeline on an already loaded frame (or chunk); no dedup
  
 	# 1) Basic string cleanup
 	
@@ -48,10 +135,12 @@ def clean_data(): #Loads the CSV and performs the full cleaning pipeline on data
 	if 'type' in df.columns:
 		df['type'] = df['type'].astype('string').str.strip().str.upper()
 
-	# 2) Parse List columns
+	# 2) Parse List columns (vectorized, see parse_list_column)
+	parsed = {}
 	for col in ['genres', 'production_countries']:
 		if col in df.columns:
-			df[col] = df[col].apply(parseList)
+			parsed[col] = parse_list_column(df[col])
+			df[col] = parsed[col].to_lists()
 
 	# 3) Parse Number columns
 	for col in ['release_year', 'runtime', 'seasons', 'imdb_votes']:
@@ -63,25 +152,247 @@ def clean_data(): #Loads the CSV and performs the full cleaning pipeline on data
 
 	# 4) Helpful derived columns (simplified)
 	if 'genres' in df.columns:
-		df['primary_genre'] = df['genres'].apply(lambda x: x[0] if isinstance(x, list) and x else None)
+		df['primary_genre'] = parsed['genres'].first()
 	if 'release_year' in df.columns:
 		def to_decade(y):
 			if pd.isna(y):
 				return None
 			return f"{int(y)//10*10}s"
 		df['decade'] = df['release_year'].apply(to_decade)
+	return df
+
+def _clean_range(job): # worker: read one record-aligned byte range (plus the header) and clean it
+	path, start, end = job
+	with csvscan.open_range(path, start, end) as stream:
+		df = pd.read_csv(stream)
+	cells = {col: df[col] for col in ['genres', 'production_countries'] if col in df.columns}
+	df = clean_frame(df)
+	# first-wins inside the partition already; the merge repeats it across partitions
+	if 'id' in df.columns:
+		df = df.drop_duplicates(subset=['id'], keep='first')
+	# send list columns as codes + one parsed list per distinct cell: pickling a
+	# Python list per row costs more than cleaning the partition
+	distinct = {}
+	for col, raw in cells.items():
+		codes, _ = pd.factorize(raw.loc[df.index], use_na_sentinel=False)
+		_, first = np.unique(codes, return_index=True)
+		distinct[col] = df[col].iloc[first].tolist()
+		df[col] = codes
+	return df, distinct
+
+def _unpack_lists(df, distinct): # codes back to lists; rows with the same cell share one list
+	for col, lists in distinct.items():
+		table = np.empty(len(lists), dtype=object)
+		table[:] = lists
+		df[col] = table[df[col].to_numpy()]
+	return df
+
+@instrument.timed
+def clean_data_parallel(path='data/data.csv', workers=None, partitions=None): #clean_data over a process pool
+    #---> splits the file into record-aligned byte ranges (quoted newlines in description are safe),
+    #---> cleans them in workers processes (default: one per CPU) and concatenates them in file order,
+    #---> so the final drop_duplicates keeps exactly the rows clean_data keeps
+    #---> workers=1 runs the partitions in this process; partitions defaults to workers
+
+	workers = workers or os.cpu_count() or 1
+	ranges = csvscan.split_ranges(path, partitions or workers)
+	jobs = [(path, start, end) for start, end in ranges]
+	if workers == 1 or len(jobs) == 1:
+		parts = [_clean_range(job) for job in jobs]
+	else:
+		with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+			parts = list(pool.map(_clean_range, jobs))
+	df = pd.concat([_unpack_lists(*part) for part in parts], ignore_index=True)
+	# a text column that is empty in one partition was read there as float NaN
+	obj = [c for c in df.columns if df[c].dtype == object]
+	if obj:
+		df[obj] = df[obj].infer_objects()
 
 	# 5) Drop duplicate ids if present (if they exist)
 	if 'id' in df.columns:
 		df = df.drop_duplicates(subset=['id'], keep='first').reset_index(drop=True)
 	return df
 
-def save_cleaned_data(df, output_path): #Save a cleaned DataFrame to a CSV file.
+@instrument.timed
+def save_cleaned_data(df, output_path, append=False, search_index=True, profile=True, similar_index=True): #Save a cleaned DataFrame to a CSV file.
+    #---> append=True adds rows to an existing file without writing the header again
+    #---> search_index: also write the title/description search index next to it (full writes only;
+    #---> after appends it is rebuilt on the next load, see search.load_or_build)
+    #---> similar_index: also write the similar-titles neighbours, up to similar.BUILD_MAX_ROWS rows
+    #---> (all-pairs search); larger catalogues build them with python -m source.similar
+    #---> profile: also write the column profile (data/cleaned.profile.json, see source/profiling.py),
+    #---> full writes only; the chunked cleaners merge the profiles of their chunks instead
     
 	# Convert lists back to strings so CSV can store them
 	for col in ['genres', 'production_countries']:
 		if col in df.columns:
 			df[col] = df[col].apply(lambda x: str(x) if isinstance(x, list) else x)
-	df.to_csv(output_path, index=False)
+	prof = profiling.Profile.build(df) if profile and not append else None
+	df.to_csv(output_path, index=False, mode='a' if append else 'w', header=not append)
+	if search_index and not append:
+		search.build_for(df, output_path)
+	if prof is not None:
+		profiling.save_for(prof, output_path)
+	if similar_index and not append:
+		from source import similar  # imports multihot, which imports this module
+		if len(df) <= similar.BUILD_MAX_ROWS:
+			similar.build_for(df, output_path)
+
+class SeenIds: # compact set of ids already kept, for first-wins dedup across chunks
+    #---> stores 64-bit hashes of the ids (8 bytes per id) in a few sorted runs: a chunk's new
+    #---> hashes become a run, merged into the previous run while that one is at most twice its
+    #---> size, so each run is more than twice the next (O(log n) runs) and each hash is copied
+    #---> O(log n) times instead of the whole array being copied for every chunk
+
+	def __init__(self, hashes=None):
+		hashes = np.sort(np.asarray(hashes if hashes is not None else [], dtype=np.uint64))
+		self._runs = [hashes] if len(hashes) else []
+
+	def __len__(self):
+		return sum(len(run) for run in self._runs)
+
+	@property
+	def hashes(self): # every hash as one sorted array (merges the runs)
+		while len(self._runs) > 1:
+			self._runs.append(_merge_sorted(self._runs.pop(), self._runs.pop()))
+		return self._runs[0] if self._runs else np.zeros(0, dtype=np.uint64)
+
+	def first_seen(self, ids): # mask of ids not seen before (first one wins inside ids too), then remember them
+		h = pd.util.hash_array(np.asarray(ids, dtype=object))
+		new = ~pd.Series(h).duplicated().to_numpy()
+		# look the candidates up sorted: the runs are then read in order
+		cand = np.flatnonzero(new)
+		order = np.argsort(h[cand])
+		sorted_h = h[cand][order]
+		known = np.zeros(len(sorted_h), dtype=bool)
+		for run in self._runs:
+			pos = np.minimum(np.searchsorted(run, sorted_h), len(run) - 1)
+			known |= run[pos] == sorted_h
+		new[cand[order[known]]] = False
+		added = sorted_h[~known]
+		while self._runs and len(self._runs[-1]) <= 2 * len(added):
+			added = _merge_sorted(self._runs.pop(), added)
+		if len(added):
+			self._runs.append(added)
+		return new
+
+def _merge_sorted(a, b): # two sorted arrays as one, in one pass over the larger
+	if len(a) < len(b):
+		a, b = b, a
+	return np.insert(a, np.searchsorted(a, b), b)
+
+@instrument.timed
+def clean_data_chunked(input_path='data/data.csv', output_path='data/cleaned.csv', chunksize=50_000, seen=None,
+					   source=None, append=False, profile=None):
+    #---> streaming clean_data + save_cleaned_data: reads chunksize rows at a time, cleans them,
+    #---> drops ids already kept (first wins, as in clean_data) and appends to output_path,
+    #---> so peak memory depends on chunksize, not on the file size
+    #---> source: optional open stream to read instead of input_path; append: keep output_path's rows
+    #---> each chunk's profile is merged into one written next to output_path at the end; with append,
+    #---> profile is the saved profile of output_path's existing rows (None: no profile is written)
+    #---> returns a small summary dict
+
+	seen = seen if seen is not None else SeenIds()
+	stats = {'rows_in': 0, 'rows_out': 0, 'chunks': 0}
+	prof = profile if append else profiling.Profile()
+	wrote_header = append
+	for chunk in pd.read_csv(source if source is not None else input_path, chunksize=chunksize):
+		stats['rows_in'] += len(chunk)
+		stats['chunks'] += 1
+		chunk = clean_frame(chunk)
+		if 'id' in chunk.columns:
+			chunk = chunk[seen.first_seen(chunk['id'])]
+		if prof is not None:
+			prof.merge(profiling.Profile.build(chunk))
+		save_cleaned_data(chunk, output_path, append=wrote_header, search_index=False, profile=False,
+						  similar_index=False)
+		wrote_header = True
+		stats['rows_out'] += len(chunk)
+	if not wrote_header:
+		# empty input: still leave a header-only file like the in-memory path
+		save_cleaned_data(clean_frame(pd.read_csv(input_path, nrows=0)), output_path, search_index=False,
+						  similar_index=False)
+	elif prof is not None:
+		profiling.save_for(prof, output_path)
+	stats['duplicates'] = stats['rows_in'] - stats['rows_out']
+	return stats
+
+
+
+def _sha1_range(path, start, end, h=None): # h (a new sha1 by default) updated with bytes [start, end) of path
+	h = hashlib.sha1() if h is None else h
+	with open(path, 'rb') as fh:
+		fh.seek(start)
+		left = end - start
+		while left > 0:
+			block = fh.read(min(1 << 20, left))
+			if not block:
+				break
+			h.update(block)
+			left -= len(block)
+	return h
+
+@instrument.timed
+def clean_incremental(input_path='data/data.csv', output_path='data/cleaned.csv', checkpoint_path=None, chunksize=50_000):
+    #---> re-clean only the records appended to input_path since the last run
+    #---> the checkpoint (output_path + '.checkpoint.json') keeps the byte offset and record count
+    #---> reached plus hashes of the header and of the processed prefix; the kept ids live next to it
+    #---> (output_path + '.ids.npy') so the first-wins id dedup also holds against earlier rows
+    #---> if the prefix, header or output changed since, everything is rebuilt from scratch
+    #---> resuming reads the file once: the prefix hash is checked and then carried on over the new
+    #---> records for the next checkpoint, and the scan for complete records starts at the offset
+    #---> returns the clean_data_chunked summary plus 'mode' ('incremental', 'rebuild' or 'noop')
+
+	checkpoint_path = checkpoint_path or output_path + '.checkpoint.json'
+	ids_path = output_path + '.ids.npy'
+	try:
+		with open(checkpoint_path, 'r', encoding='utf-8') as fh:
+			ck = json.load(fh)
+	except Exception:
+		ck = None
+
+	head = csvscan.header_end(input_path)
+	header_sha1 = _sha1_range(input_path, 0, head).hexdigest()
+
+	resume = (
+		ck is not None
+		and ck.get('header_sha1') == header_sha1
+		and os.path.exists(output_path) and os.path.exists(ids_path)
+		and os.path.getsize(output_path) == ck.get('output_size')
+		and head <= ck.get('offset', 0) <= os.path.getsize(input_path)
+	)
+	prefix = _sha1_range(input_path, 0, ck['offset']) if resume else None
+	resume = resume and prefix.hexdigest() == ck.get('prefix_sha1')
+	# the offset is a record boundary, so the scan for complete records can start there
+	end = csvscan.complete_end(input_path, ck['offset'] if resume else head)
+	if resume:
+		start, seen = ck['offset'], SeenIds(np.load(ids_path))
+		# the new rows' profile merges into the saved one while it matches the output
+		prof = profiling.load_for(output_path)
+		mode = 'incremental' if end > start else 'noop'
+	else:
+		start, seen, mode, ck = head, SeenIds(), 'rebuild', {'records': 0, 'rows_out': 0}
 
+	if mode == 'noop':
+		stats = {'rows_in': 0, 'rows_out': 0, 'chunks': 0, 'duplicates': 0}
+	else:
+		with csvscan.open_range(input_path, start, end) as stream:
+			stats = clean_data_chunked(input_path, output_path, chunksize=chunksize, seen=seen,
+									   source=stream, append=resume, profile=prof if resume else None)
+		np.save(ids_path, seen.hashes)
 
+	ck = {
+		'input': os.path.abspath(input_path),
+		'offset': int(end),
+		'records': int(ck.get('records', 0) + stats['rows_in']),
+		'rows_out': int(ck.get('rows_out', 0) + stats['rows_out']),
+		'header_sha1': header_sha1,
+		'prefix_sha1': (_sha1_range(input_path, start, end, prefix) if resume else _sha1_range(input_path, 0, end)).hexdigest(),
+		'output_size': os.path.getsize(output_path),
+	}
+	tmp = checkpoint_path + '.tmp'
+	with open(tmp, 'w', encoding='utf-8') as fh:
+		json.dump(ck, fh)
+	os.replace(tmp, checkpoint_path)
+	stats['mode'] = mode
+	return stats
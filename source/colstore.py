@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from source.cleaning import parseList
+
+
+FORMAT_VERSION = 1
+LIST_COLUMNS = ['genres', 'production_countries']
+
+
+def cache_dir_for(path):
+	# data/cleaned.csv -> data/.cache/cleaned
+	base = os.path.splitext(os.path.basename(path))[0]
+	return os.path.join(os.path.dirname(os.path.abspath(path)), '.cache', base)
+
+
+def file_hash(path, block_size=1 << 20):
+	h = hashlib.sha1()
+	with open(path, 'rb') as fh:
+		while True:
+			block = fh.read(block_size)
+			if not block:
+				break
+			h.update(block)
+	return h.hexdigest()
+
+
+def source_fingerprint(path, with_hash=True):
+	stat = os.stat(path)
+	fp = {'size': int(stat.st_size), 'mtime_ns': int(stat.st_mtime_ns)}
+	if with_hash:
+		fp['sha1'] = file_hash(path)
+	return fp
+
+
+# ---- column encoding --------------------------------------------------------
+#
+# Strings are stored as one utf-8 blob joined on SEP (split back in C with
+# str.split) plus a null mask; if a value contains SEP the column falls back to
+# char offsets. Low-cardinality string columns are dictionary encoded (int32
+# codes plus the distinct values). List columns are always dictionary encoded:
+# per-row codes into the distinct lists, stored as offsets into a flat items
+# string column, so they load back as native (shared, read-only) lists.
+
+SEP = '\x1f'
+
+
+def _save(directory, name, arr):
+	np.save(os.path.join(directory, name + '.npy'), arr, allow_pickle=False)
+
+
+def _load(directory, name, mmap_mode=None):
+	return np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+
+
+def _offsets(lengths):
+	offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+	np.cumsum(lengths, out=offsets[1:])
+	return offsets
+
+
+def _is_missing(v):
+	return v is None or (not isinstance(v, str) and pd.isna(v))
+
+
+def _save_strings(directory, name, values):
+	mask = np.fromiter((_is_missing(v) for v in values), dtype=bool, count=len(values))
+	texts = ['' if m else str(v) for v, m in zip(values, mask.tolist())]
+	text = SEP.join(texts)
+	spec = {'n': len(texts), 'offsets': False}
+	if any(SEP in t for t in texts):
+		_save(directory, name + '.offsets', _offsets([len(t) for t in texts]))
+		text = ''.join(texts)
+		spec['offsets'] = True
+	_save(directory, name, np.frombuffer(text.encode('utf-8'), dtype=np.uint8))
+	_save(directory, name + '.mask', mask)
+	return spec
+
+
+def _load_strings(directory, name, spec):
+	text = _load(directory, name).tobytes().decode('utf-8')
+	if spec['offsets']:
+		offsets = _load(directory, name + '.offsets').tolist()
+		values = [text[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+	else:
+		values = text.split(SEP) if spec['n'] else []
+	out = np.empty(spec['n'], dtype=object)
+	out[:] = values
+	out[_load(directory, name + '.mask')] = None
+	return out
+
+
+def _write_column(directory, name, series):
+	if name in LIST_COLUMNS:
+		lists = [v if isinstance(v, list) else parseList(v) for v in series]
+		keys = [None if v is None else tuple(v) for v in lists]
+		codes, uniques = pd.factorize(pd.Series(keys, dtype=object), use_na_sentinel=True)
+		_save(directory, name + '.codes', codes.astype(np.int32))
+		_save(directory, name + '.offsets', _offsets([len(v) for v in uniques]))
+		items = _save_strings(directory, name + '.items', [x for v in uniques for x in v])
+		return {'name': name, 'kind': 'list', 'items': items}
+	if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+		_save(directory, name, series.to_numpy())
+		return {'name': name, 'kind': 'num', 'dtype': str(series.dtype)}
+	codes, uniques = pd.factorize(series, use_na_sentinel=True)
+	if len(uniques) * 4 <= len(series):
+		_save(directory, name + '.codes', codes.astype(np.int32))
+		spec = _save_strings(directory, name + '.dict', list(uniques))
+		return {'name': name, 'kind': 'dict', 'dtype': str(series.dtype), 'values': spec}
+	spec = _save_strings(directory, name, list(series))
+	return {'name': name, 'kind': 'str', 'dtype': str(series.dtype), 'values': spec}
+
+
+def _read_column(directory, col):
+	name = col['name']
+	if col['kind'] == 'num':
+		return _load(directory, name)
+	if col['kind'] == 'list':
+		items = _load_strings(directory, name + '.items', col['items']).tolist()
+		offsets = _load(directory, name + '.offsets').tolist()
+		uniques = np.empty(len(offsets), dtype=object)
+		uniques[:-1] = [items[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+		# code -1 (missing) picks the trailing None
+		return pd.Series(uniques[_load(directory, name + '.codes')], dtype=object)
+	if col['kind'] == 'dict':
+		uniques = np.append(_load_strings(directory, name + '.dict', col['values']), None)
+		# code -1 (missing) picks the trailing None
+		values = uniques[_load(directory, name + '.codes')]
+	else:
+		values = _load_strings(directory, name, col['values'])
+	s = pd.Series(values, dtype=object)
+	if col.get('dtype') not in (None, 'object'):
+		s = s.astype(col['dtype'])
+	return s
+
+
+# ---- public API -------------------------------------------------------------
+
+def write_frame(df, directory, source=None):
+	"""Write df as one binary file per column plus a meta.json written last."""
+	os.makedirs(directory, exist_ok=True)
+	meta_path = os.path.join(directory, 'meta.json')
+	if os.path.exists(meta_path):
+		os.remove(meta_path)
+	cols = [_write_column(directory, name, df[name]) for name in df.columns]
+	meta = {'format': FORMAT_VERSION, 'rows': int(len(df)), 'columns': cols, 'source': source}
+	write_meta(directory, meta)
+	return meta
+
+
+def write_meta(directory, meta):
+	meta_path = os.path.join(directory, 'meta.json')
+	tmp = meta_path + '.tmp'
+	with open(tmp, 'w', encoding='utf-8') as fh:
+		json.dump(meta, fh)
+	os.replace(tmp, meta_path)
+
+
+def read_meta(directory):
+	try:
+		with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as fh:
+			meta = json.load(fh)
+	except Exception:
+		return None
+	if meta.get('format') != FORMAT_VERSION:
+		return None
+	return meta
+
+
+def read_frame(directory, meta=None):
+	meta = meta or read_meta(directory)
+	if meta is None:
+		raise FileNotFoundError(f'no column store in {directory}')
+	data = {col['name']: _read_column(directory, col) for col in meta['columns']}
+	return pd.DataFrame(data, columns=[c['name'] for c in meta['columns']])
+
+
+def _is_fresh(meta, path):
+	# cheap check first (size + mtime), hash only when the stat changed
+	src = (meta or {}).get('source') or {}
+	fp = source_fingerprint(path, with_hash=False)
+	if src.get('size') != fp['size']:
+		return False, None
+	if src.get('mtime_ns') == fp['mtime_ns']:
+		return True, None
+	digest = file_hash(path)
+	return src.get('sha1') == digest, digest
+
+
+def load_csv(path, cache_dir=None, read_csv=pd.read_csv):
+	"""Load a CSV through its binary column cache.
+
+	Returns (df, info) where info reports the load time, whether the cache
+	was hit or rebuilt and the CSV's sha1 as 'version'. The cache is rebuilt
+	when the CSV size, mtime or hash changes.
+	"""
+	t0 = time.perf_counter()
+	cache_dir = cache_dir or cache_dir_for(path)
+	meta = read_meta(cache_dir)
+	info = {'source': path, 'cache_dir': cache_dir, 'hit': False}
+	if meta is not None:
+		fresh, digest = _is_fresh(meta, path)
+		if fresh:
+			try:
+				df = read_frame(cache_dir, meta)
+				if digest is not None:
+					# content unchanged, only touched: remember the new mtime
+					meta['source'] = source_fingerprint(path, with_hash=False)
+					meta['source']['sha1'] = digest
+					write_meta(cache_dir, meta)
+				info.update(hit=True, reason='fresh', version=meta['source'].get('sha1'),
+							rows=int(len(df)), seconds=time.perf_counter() - t0)
+				return df, info
+			except Exception as e:
+				info['reason'] = f'cache read failed: {e}'
+		else:
+			info['reason'] = 'source changed'
+	else:
+		info['reason'] = 'no cache'
+
+	df = read_csv(path)
+	source = source_fingerprint(path)
+	info['version'] = source['sha1']
+	try:
+		write_frame(df, cache_dir, source=source)
+		# reload so a rebuild returns exactly what a later cache hit returns
+		df = read_frame(cache_dir)
+	except Exception as e:
+		shutil.rmtree(cache_dir, ignore_errors=True)
+		info['reason'] += f'; cache write failed: {e}'
+	info.update(rows=int(len(df)), seconds=time.perf_counter() - t0)
+	return df, info
@@ -0,0 +1,77 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+from source import instrument
+
+
+# value -> (iso3, label); filled lazily, misses included, shared by all reruns
+_RESOLVED = {}
+
+
+@functools.lru_cache(maxsize=1)
+def _tables():
+	# ISO2 / ISO3 / lower-cased name -> (iso3, display name), built once from pycountry
+	import pycountry
+	by_iso2, by_iso3, by_name = {}, {}, {}
+	for c in pycountry.countries:
+		rec = (c.alpha_3, c.name)
+		by_iso2[c.alpha_2.upper()] = rec
+		by_iso3[c.alpha_3.upper()] = rec
+		by_name[c.name.lower()] = rec
+	return by_iso2, by_iso3, by_name
+
+
+def _resolve_one(v):
+	by_iso2, by_iso3, by_name = _tables()
+	if not isinstance(v, str):
+		# same as before: no map location, label is the plain string
+		return None, str(v)
+	# map location: ISO2 -> ISO3, 3 letters taken as ISO3, anything else by name
+	if len(v) == 2:
+		iso3 = (by_iso2.get(v.upper()) or (None,))[0]
+	elif len(v) == 3:
+		iso3 = v.upper()
+	else:
+		iso3 = (by_name.get(v.lower()) or (None,))[0]
+	# label: full name from the code (or name), else the upper-cased code
+	code = v.strip().upper()
+	rec = None
+	if len(code) == 2 and code.isalpha():
+		rec = by_iso2.get(code)
+	elif len(code) == 3 and code.isalpha():
+		rec = by_iso3.get(code)
+	if rec is None:
+		rec = by_name.get(code.lower())
+	return iso3, rec[1] if rec else code
+
+
+@instrument.timed
+def resolve(values):
+	"""Map a column of country codes/names to (iso3, label) arrays.
+
+	Only distinct values are looked up, each at most once per process
+	(unknown ones too), so repeated calls do no pycountry work.
+	"""
+	codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+	pairs = []
+	for u in uniques:
+		rec = _RESOLVED.get(u)
+		if rec is None:
+			rec = _RESOLVED[u] = _resolve_one(u)
+		pairs.append(rec)
+	# trailing slot for missing values
+	pairs.append((None, 'nan'))
+	iso3 = np.array([p[0] for p in pairs], dtype=object)
+	labels = np.array([p[1] for p in pairs], dtype=object)
+	codes = np.where(codes < 0, len(uniques), codes)
+	return iso3[codes], labels[codes]
+
+
+def iso3(values):
+	return resolve(values)[0]
+
+
+def labels(values):
+	return resolve(values)[1]
@@ -0,0 +1,193 @@
+import io
+import json
+import os
+
+import numpy as np
+
+
+BLOCK_SIZE = 1 << 20
+QUOTE = 34  # '"'
+NEWLINE = 10
+
+
+def _scan(path, start=0, end=None, block_size=BLOCK_SIZE):
+	# yield (block offset, block bytes, positions of record-ending newlines in the block)
+	size = os.path.getsize(path)
+	end = size if end is None else min(end, size)
+	in_quotes = 0
+	pos = start
+	with open(path, 'rb') as fh:
+		fh.seek(start)
+		while pos < end:
+			block = fh.read(min(block_size, end - pos))
+			if not block:
+				break
+			arr = np.frombuffer(block, dtype=np.uint8)
+			# only the parity matters, so a wrapping uint8 running count is enough
+			quotes = np.cumsum(arr == QUOTE, dtype=np.uint8)
+			outside = ((quotes + in_quotes) & 1) == 0
+			yield pos, arr, np.flatnonzero((arr == NEWLINE) & outside)
+			in_quotes = (in_quotes + int(quotes[-1])) & 1
+			pos += len(block)
+
+
+def iter_record_ends(path, start=0, end=None, block_size=BLOCK_SIZE):
+	"""Yield arrays of byte offsets just past each record-terminating newline.
+
+	Quote-aware: newlines inside double-quoted fields (e.g. multi-line
+	descriptions) do not end a record. start must be a record boundary.
+	"""
+	for pos, _, ends in _scan(path, start, end, block_size):
+		if len(ends):
+			yield ends + pos + 1
+
+
+def header_end(path):
+	# byte offset just past the header record
+	for ends in iter_record_ends(path):
+		return int(ends[0])
+	return os.path.getsize(path)
+
+
+def complete_end(path, start=0):
+	# byte offset just past the last complete (newline-terminated) record
+	last = start
+	for ends in iter_record_ends(path, start):
+		last = int(ends[-1])
+	return last
+
+
+def split_ranges(path, parts, start=None, end=None):
+	"""Cut [start, end) into up to parts record-aligned byte ranges of similar size.
+
+	start defaults to the end of the header, end to the file size. Each cut is
+	the first record boundary at or after an equal-size target, found in one
+	quote-aware pass, so a range never splits a quoted multi-line field.
+	"""
+	start = header_end(path) if start is None else start
+	end = os.path.getsize(path) if end is None else end
+	if parts <= 1 or end <= start:
+		return [(start, end)]
+	step = (end - start) / parts
+	targets = [start + int(step * i) for i in range(1, parts)]
+	cuts = [start]
+	t = 0
+	for ends in iter_record_ends(path, start, end):
+		while t < len(targets):
+			j = int(np.searchsorted(ends, targets[t]))
+			if j == len(ends):
+				break
+			cut = int(ends[j])
+			if cuts[-1] < cut < end:
+				cuts.append(cut)
+			t += 1
+		if t == len(targets):
+			break
+	cuts.append(end)
+	return list(zip(cuts[:-1], cuts[1:]))
+
+
+class RangeReader(io.RawIOBase):
+	"""Read-only stream over prefix + path[start:end], e.g. header + a tail."""
+
+	def __init__(self, path, start, end, prefix=b''):
+		self._fh = open(path, 'rb')
+		self._fh.seek(start)
+		self._left = end - start
+		self._prefix = prefix
+
+	def readable(self):
+		return True
+
+	def readinto(self, b):
+		n = len(b)
+		if self._prefix:
+			chunk = self._prefix[:n]
+			self._prefix = self._prefix[len(chunk):]
+		else:
+			chunk = self._fh.read(min(n, self._left))
+			self._left -= len(chunk)
+		b[:len(chunk)] = chunk
+		return len(chunk)
+
+	def close(self):
+		self._fh.close()
+		super().close()
+
+
+def open_range(path, start, end, with_header=True):
+	# text stream of the header record followed by the records in [start, end)
+	prefix = b''
+	if with_header:
+		with open(path, 'rb') as fh:
+			prefix = fh.read(header_end(path))
+	raw = RangeReader(path, start, end, prefix)
+	return io.TextIOWrapper(io.BufferedReader(raw), encoding='utf-8', newline='')
+
+
+def count_sidecar_path(path):
+	# data/data.csv -> data/.cache/data.csv.count.json
+	return os.path.join(os.path.dirname(os.path.abspath(path)), '.cache', os.path.basename(path) + '.count.json')
+
+
+def scan_counts(path):
+	"""Count records in one buffered byte pass.
+
+	Returns physical_lines (newline-separated lines, header included),
+	csv_records (quote-aware records after the header, blank lines included,
+	as csv.reader counts them) and pandas_rows (the same without blank
+	records, as read_csv counts them).
+	"""
+	lines = records = blank = 0
+	last_byte = None
+	prev_end = 0  # absolute offset where the current record starts
+	for pos, arr, ends in _scan(path):
+		lines += int(np.count_nonzero(arr == NEWLINE))
+		if len(ends):
+			starts = np.concatenate(([prev_end - pos], ends[:-1] + 1))
+			length = ends - starts
+			# blank record: nothing but the newline (or \r\n)
+			cr = arr[np.maximum(ends - 1, 0)] == 13
+			blank += int(np.count_nonzero((length == 0) | ((length == 1) & cr)))
+			records += len(ends)
+			prev_end = pos + int(ends[-1]) + 1
+		last_byte = int(arr[-1])
+	size = os.path.getsize(path)
+	if last_byte is not None and last_byte != NEWLINE:
+		# final record without a trailing newline
+		lines += 1
+		records += 1
+	# first record is the header
+	data_records = max(records - 1, 0)
+	return {
+		'physical_lines': lines,
+		'csv_records': data_records,
+		'pandas_rows': max(data_records - blank, 0),
+		'size_bytes': size,
+	}
+
+
+def count_records(path, use_cache=True):
+	"""scan_counts with a sidecar cache keyed on the file's size and mtime."""
+	stat = os.stat(path)
+	key = {'size': int(stat.st_size), 'mtime_ns': int(stat.st_mtime_ns)}
+	sidecar = count_sidecar_path(path)
+	if use_cache:
+		try:
+			with open(sidecar, 'r', encoding='utf-8') as fh:
+				cached = json.load(fh)
+			if cached.get('key') == key:
+				return dict(cached['counts'], cached=True)
+		except Exception:
+			pass
+	counts = scan_counts(path)
+	if use_cache:
+		try:
+			os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+			tmp = sidecar + '.tmp'
+			with open(tmp, 'w', encoding='utf-8') as fh:
+				json.dump({'key': key, 'counts': counts}, fh)
+			os.replace(tmp, sidecar)
+		except Exception:
+			pass
+	return dict(counts, cached=False)
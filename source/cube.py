@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+from source import analysis as an
+from source import instrument
+from source import planner
+from source.cleaning import parse_list_column
+
+
+class Cube:
+	"""Pre-aggregated counts over (type, decade, genre set, country).
+
+	Cells hold the row count plus sum/count of imdb_score and tmdb_score. The
+	genre dimension is the exact genre list of a title rather than single
+	genres, so any-of / all-of genre filters select whole cells and a title is
+	never counted twice; per-genre counts come from a (genre set x genre)
+	multiplicity table. Queries cost O(cells), independent of the row count.
+	"""
+
+	def __init__(self, types, decades, decade_labels, genre_sets, genres, members,
+				 cells, cell_stats, country_cells, countries):
+		self.types = types                  # type label per type code
+		self.decades = decades              # decade start year per decade code (-1 = missing)
+		self.decade_labels = decade_labels  # decade label per decade code (None = missing)
+		self.genre_sets = genre_sets        # genre list per genre-set code
+		self.genres = genres                # genre labels (sorted)
+		self.members = members              # genre sets x genres, occurrence counts
+		self.cells = cells                  # cells x (type, decade, genre set) codes
+		self.cell_stats = cell_stats        # DataFrame per cell: count, imdb/tmdb sum and n
+		self.country_cells = country_cells  # (cell, country code, count) entries
+		self.countries = countries          # country labels
+
+	@classmethod
+	def build(cls, df):
+		n = len(df)
+		# missing type / decade get their own trailing code (label None)
+		type_codes, types = pd.factorize(df['type'].astype(object).str.upper() if 'type' in df.columns else pd.Series([None] * n, dtype=object))
+		type_codes = np.where(type_codes < 0, len(types), type_codes)
+		types = np.append(np.asarray(types, dtype=object), None)
+		dec_codes, decade_labels = pd.factorize(df['decade'].astype(object) if 'decade' in df.columns else pd.Series([None] * n, dtype=object))
+		dec_codes = np.where(dec_codes < 0, len(decade_labels), dec_codes)
+		decade_labels = np.append(np.asarray(decade_labels, dtype=object), None)
+		# -1 for labels that do not parse (and the NaN label)
+		decades = np.array([-1 if y is None else y for y in map(planner.decade_int, decade_labels)], dtype=np.int64)
+
+		genres_col = parse_list_column(df['genres']) if 'genres' in df.columns else parse_list_column(pd.Series([None] * n))
+		lists = genres_col.to_lists()
+		set_codes, set_keys = pd.factorize(pd.Series([None if v is None else tuple(v) for v in lists], dtype=object))
+		genre_sets = [list(k) for k in set_keys] + [None]
+		set_codes = np.where(set_codes < 0, len(set_keys), set_codes)
+		genres = np.array(sorted({g for k in set_keys for g in k}), dtype=object)
+		lookup = {g: j for j, g in enumerate(genres.tolist())}
+		members = np.zeros((len(genre_sets), len(genres)), dtype=np.int32)
+		for i, k in enumerate(set_keys):
+			for g in k:
+				members[i, lookup[g]] += 1
+
+		# one cell per distinct (type, decade, genre set)
+		keys = np.stack([type_codes, dec_codes, set_codes], axis=1).astype(np.int64)
+		cells, row_cell = np.unique(keys, axis=0, return_inverse=True)
+		row_cell = row_cell.reshape(-1)
+		stats = {'count': np.bincount(row_cell, minlength=len(cells))}
+		for col in ['imdb_score', 'tmdb_score']:
+			vals = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float) if col in df.columns else np.full(n, np.nan)
+			ok = ~np.isnan(vals)
+			stats[col + '_sum'] = np.bincount(row_cell[ok], weights=vals[ok], minlength=len(cells))
+			stats[col + '_n'] = np.bincount(row_cell[ok], minlength=len(cells))
+		cell_stats = pd.DataFrame(stats)
+
+		if 'production_countries' in df.columns:
+			pc = parse_list_column(df['production_countries'])
+			c_codes, countries = pd.factorize(pc.values.astype(str))
+			pairs = row_cell[pc.row_ids()] * max(len(countries), 1) + c_codes
+			uniq, counts = np.unique(pairs, return_counts=True)
+			country_cells = np.stack([uniq // max(len(countries), 1), uniq % max(len(countries), 1), counts], axis=1)
+		else:
+			countries, country_cells = np.array([], dtype=object), np.zeros((0, 3), dtype=np.int64)
+
+		return cls(types, decades, decade_labels, genre_sets, genres, members, cells, cell_stats, country_cells, np.asarray(countries, dtype=object))
+
+	# ---- slicing -------------------------------------------------------------
+
+	def cell_mask(self, type_value=None, decades=None, genres=None, genre_mode='any'):
+		"""Boolean mask over cells with filter_data's semantics."""
+		mask = np.ones(len(self.cells), dtype=bool)
+		if type_value:
+			mask &= np.array([t == type_value.upper() for t in self.types], dtype=bool)[self.cells[:, 0]]
+		if decades and len(decades) == 2:
+			start, end = planner.decade_int(decades[0]), planner.decade_int(decades[1])
+			if start is not None and end is not None:
+				dec = self.decades[self.cells[:, 1]]
+				mask &= (dec >= 0) & (dec >= start) & (dec <= end)
+		if genres and len(genres) > 0:
+			cols = [j for j, g in enumerate(self.genres.tolist()) if g in set(genres)]
+			has = self.members[:, cols] > 0
+			if genre_mode == 'all':
+				ok = has.all(axis=1) if len(cols) == len(set(genres)) else np.zeros(len(self.members), dtype=bool)
+			else:
+				ok = has.any(axis=1)
+			mask &= ok[self.cells[:, 2]]
+		return mask
+
+	@instrument.timed
+	def count(self, **filters):
+		return int(self.cell_stats['count'].to_numpy()[self.cell_mask(**filters)].sum())
+
+	@instrument.timed
+	def mean_score(self, score_col='imdb_score', **filters):
+		mask = self.cell_mask(**filters)
+		n = self.cell_stats[score_col + '_n'].to_numpy()[mask].sum()
+		return float(self.cell_stats[score_col + '_sum'].to_numpy()[mask].sum() / n) if n else float('nan')
+
+	@instrument.timed
+	def titles_per_decade(self, **filters):
+		mask = self.cell_mask(**filters)
+		counts = np.bincount(self.cells[mask, 1], weights=self.cell_stats['count'].to_numpy()[mask],
+							 minlength=len(self.decade_labels)).astype(np.int64)
+		out = pd.DataFrame({'decade': self.decade_labels, 'count': counts})
+		out = out[out['decade'].notna() & (out['count'] > 0)]
+		return out.sort_values('decade').reset_index(drop=True)
+
+	@instrument.timed
+	def top_genres(self, n=10, **filters):
+		mask = self.cell_mask(**filters)
+		per_set = np.bincount(self.cells[mask, 2], weights=self.cell_stats['count'].to_numpy()[mask],
+							  minlength=len(self.genre_sets))
+		counts = pd.Series((per_set @ self.members).astype(np.int64), index=self.genres, name='count')
+		counts = counts[counts > 0].sort_values(ascending=False, kind='stable').head(n)
+		return counts.rename_axis('genre').reset_index()
+
+	@instrument.timed
+	def country_counts(self, **filters):
+		mask = self.cell_mask(**filters)
+		cc = self.country_cells
+		keep = mask[cc[:, 0]] if len(cc) else np.zeros(0, dtype=bool)
+		counts = np.bincount(cc[keep, 1], weights=cc[keep, 2], minlength=len(self.countries)).astype(np.int64)
+		out = pd.Series(counts, index=self.countries, name='count')
+		out = out[out > 0].sort_values(ascending=False, kind='stable')
+		return out.rename_axis('country').reset_index()
+
+
+@instrument.timed
+def build_cube(df):
+	return Cube.build(df)
+
+
+def check_consistency(df, cube, filters=None):
+	"""Compare cube answers with the row-scan functions in analysis.
+
+	filters: list of filter_data keyword dicts (defaults to a small grid over
+	type, first/last decade and the two most common genres). Returns a list of
+	(filters, what, cube_value, scan_value) mismatches; empty means consistent.
+	"""
+	if filters is None:
+		decs = sorted(set(df['decade'].dropna().astype(str))) if 'decade' in df.columns else []
+		top = an.top_genres(df, n=2)['genre'].tolist()
+		filters = []
+		for t in [None, 'MOVIE', 'SHOW']:
+			for d in [None] + ([[decs[0], decs[-1]], [decs[len(decs) // 2], decs[-1]]] if decs else []):
+				for g in [None, top[:1], top]:
+					for mode in (['any', 'all'] if g and len(g) > 1 else ['any']):
+						filters.append({'type_value': t, 'decades': d, 'genres': g, 'genre_mode': mode})
+	problems = []
+	for f in filters:
+		scan = an.filter_data(df, **f)
+		checks = [
+			('count', cube.count(**f), len(scan)),
+			('titles_per_decade', _as_dict(cube.titles_per_decade(**f)), _as_dict(an.titles_per_decade(scan))),
+			('top_genres', _as_dict(cube.top_genres(n=10_000, **f)), _as_dict(an.top_genres(scan, n=10_000))),
+			('country_counts', _as_dict(cube.country_counts(**f)), _as_dict(an.country_counts(scan))),
+		]
+		for what, got, want in checks:
+			if got != want:
+				problems.append((f, what, got, want))
+		got, want = cube.mean_score('imdb_score', **f), scan['imdb_score'].dropna().mean()
+		if not (np.isnan(got) and pd.isna(want)) and not np.isclose(got, want):
+			problems.append((f, 'avg_imdb', got, want))
+	return problems
+
+
+def _as_dict(frame):
+	return {str(k): int(v) for k, v in zip(frame.iloc[:, 0], frame['count'])}
@@ -0,0 +1,199 @@
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+# the active Trace of the current thread (a Streamlit session reruns in its own thread)
+_local = threading.local()
+# recently finished traces, newest last, for export()
+RECENT = deque(maxlen=50)
+
+
+def _rows(value):
+	if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+		return int(len(value))
+	return None
+
+
+class Trace:
+	"""Flat list of span records (name, depth, start, seconds, rows, memory) for one run."""
+
+	def __init__(self, name, memory=False):
+		self.name = name
+		self.memory = memory
+		self.records = []
+		self.started = time.time()
+		self.seconds = None
+		self._stack = []
+		self._t0 = time.perf_counter()
+		self._own_tracemalloc = False
+
+	def open(self, name, rows_in=None, **attrs):
+		rec = {'name': name, 'depth': len(self._stack), 'start': time.perf_counter() - self._t0,
+			   'seconds': None, 'rows_in': rows_in, 'rows_out': None}
+		rec.update(attrs)
+		if self.memory:
+			cur, peak = tracemalloc.get_traced_memory()
+			# fold the peak so far into the parent before resetting it for this span
+			if self._stack:
+				parent = self._stack[-1]
+				parent['_peak'] = max(parent['_peak'], peak)
+			tracemalloc.reset_peak()
+			rec['_mem0'] = rec['_peak'] = cur
+		self.records.append(rec)
+		self._stack.append(rec)
+		return rec
+
+	def close(self, rec):
+		rec['seconds'] = time.perf_counter() - self._t0 - rec['start']
+		if self.memory:
+			cur, peak = tracemalloc.get_traced_memory()
+			rec['_peak'] = max(rec['_peak'], peak)
+			rec['alloc_bytes'] = cur - rec['_mem0']
+			rec['peak_bytes'] = rec['_peak'] - rec['_mem0']
+			if len(self._stack) > 1:
+				parent = self._stack[-2]
+				parent['_peak'] = max(parent['_peak'], rec['_peak'])
+		self._stack.pop()
+
+	def to_dict(self):
+		return {
+			'name': self.name, 'started': self.started, 'seconds': self.seconds, 'memory': self.memory,
+			'records': [{k: v for k, v in r.items() if not k.startswith('_')} for r in self.records],
+		}
+
+	def to_json(self, **kwargs):
+		return json.dumps(self.to_dict(), **kwargs)
+
+	def table(self):
+		"""One row per span, names indented by depth, times in ms, memory in KiB.
+
+		Extra attributes set on records (e.g. payload_bytes) become extra columns.
+		"""
+		base = {'name', 'depth', 'start', 'seconds', 'rows_in', 'rows_out', 'alloc_bytes', 'peak_bytes'}
+		extra = []
+		for r in self.records:
+			extra += [k for k in r if k not in base and not k.startswith('_') and k not in extra]
+		rows = []
+		for r in self.records:
+			row = {
+				'span': '  ' * r['depth'] + r['name'],
+				'ms': round(r['seconds'] * 1000, 2) if r['seconds'] is not None else None,
+				'rows_in': r['rows_in'], 'rows_out': r['rows_out'],
+			}
+			if self.memory:
+				row['alloc_kib'] = round(r.get('alloc_bytes', 0) / 1024, 1)
+				row['peak_kib'] = round(r.get('peak_bytes', 0) / 1024, 1)
+			for k in extra:
+				row[k] = r.get(k)
+			rows.append(row)
+		columns = ['span', 'ms', 'rows_in', 'rows_out'] + (['alloc_kib', 'peak_kib'] if self.memory else []) + extra
+		return pd.DataFrame(rows, columns=columns).astype({'rows_in': 'Int64', 'rows_out': 'Int64'})
+
+
+def current():
+	return getattr(_local, 'trace', None)
+
+
+class collect:
+	"""Record every instrumented call made in this thread inside the block.
+
+		with instrument.collect('rerun', memory=True) as tr:
+			...
+		tr.table()
+
+	memory=True also records allocated and peak bytes per span via
+	tracemalloc (started for the block if it is not already running), which
+	slows the traced code down noticeably; timings alone are cheap.
+	"""
+
+	def __init__(self, name='run', memory=False):
+		self.trace = Trace(name, memory)
+
+	def __enter__(self):
+		tr = self.trace
+		self._outer = current()
+		if tr.memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+			tr._own_tracemalloc = True
+		_local.trace = tr
+		return tr
+
+	def __exit__(self, *exc):
+		tr = self.trace
+		tr.seconds = time.perf_counter() - tr._t0
+		_local.trace = self._outer
+		if tr._own_tracemalloc:
+			tracemalloc.stop()
+		RECENT.append(tr)
+		return False
+
+
+class span:
+	"""Time a block as one record of the active trace; a no-op without one.
+
+		with instrument.span('filter', rows_in=len(df)) as rec:
+			out = ...
+			rec['rows_out'] = len(out)
+	"""
+
+	def __init__(self, name, rows_in=None, **attrs):
+		self.name, self.rows_in, self.attrs = name, rows_in, attrs
+
+	def __enter__(self):
+		self.trace = current()
+		if self.trace is None:
+			self.rec = {}
+			return self.rec
+		self.rec = self.trace.open(self.name, self.rows_in, **self.attrs)
+		return self.rec
+
+	def __exit__(self, *exc):
+		if self.trace is not None:
+			self.trace.close(self.rec)
+		return False
+
+
+def timed(fn=None, name=None):
+	"""Decorator recording fn's calls in the active trace.
+
+	rows_in is the length of the first frame/array argument, rows_out the
+	length of a frame/array result. Without an active trace the only cost is
+	one thread-local lookup per call.
+	"""
+	if fn is None:
+		return functools.partial(timed, name=name)
+	label = name or f'{fn.__module__.rsplit(".", 1)[-1]}.{fn.__qualname__}'
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		tr = getattr(_local, 'trace', None)
+		if tr is None:
+			return fn(*args, **kwargs)
+		rows_in = None
+		for a in args[:2]:
+			rows_in = _rows(a)
+			if rows_in is not None:
+				break
+		rec = tr.open(label, rows_in)
+		try:
+			out = fn(*args, **kwargs)
+			rec['rows_out'] = _rows(out)
+			return out
+		finally:
+			tr.close(rec)
+	return wrapper
+
+
+def export(path, traces=None):
+	"""Write traces (default: the recent ones) to a JSON file; returns how many."""
+	traces = list(RECENT) if traces is None else list(traces)
+	with open(path, 'w', encoding='utf-8') as fh:
+		json.dump([t.to_dict() for t in traces], fh, indent=1)
+	return len(traces)
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+from source.cleaning import parse_list_column
+
+
+# set bits per byte value, for counting rows in packed bitmaps
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int64)
+
+
+class MultiHotIndex:
+	"""Per-label row bitmaps over the rows of a list column.
+
+	Built once from a frame (e.g. genres or production_countries). Each label's
+	rows are one packed bitmap (np.packbits, little bit order: 1 bit per row),
+	so the index is rows/8 bytes per label. Filtering is bitwise OR/AND over
+	those bitmaps, unpacked to a row mask once at the end. Per-label counts for
+	a subset of rows are a masked bincount over the (row, label) entries, so
+	they match value_counts on the flattened lists, duplicates included.
+	"""
+
+	def __init__(self, labels, bits, entry_rows, entry_codes, index):
+		self.labels = labels
+		self.bits = bits  # labels x ceil(rows / 8), uint8, bit r % 8 of byte r // 8 is row r
+		self.entry_rows = entry_rows
+		self.entry_codes = entry_codes
+		self.index = index
+		self._lookup = {label: j for j, label in enumerate(labels.tolist())}
+
+	@classmethod
+	def build(cls, df, col):
+		try:
+			cells, distinct = pd.factorize(df[col], use_na_sentinel=True)
+		except TypeError:
+			# unhashable cells (lists): parse every row
+			parsed = parse_list_column(df[col])
+			codes, labels = pd.factorize(parsed.values.astype(str), sort=True)
+			labels = np.asarray(labels)
+			rows = parsed.row_ids()
+			return cls.from_entries(labels, rows.astype(np.int32), codes.astype(np.int32), len(parsed), df.index)
+		# only the distinct cells (genre / country combos) are parsed and their
+		# labels factorized; rows pick their entries by cell code. The trailing
+		# empty cell stands for NaN
+		parsed = parse_list_column(pd.Series(list(distinct) + [None], dtype=object))
+		item_codes, labels = pd.factorize(parsed.values.astype(str), sort=True)
+		labels = np.asarray(labels)
+		cells = np.where(cells < 0, len(distinct), cells)
+		# (row, label) entries in row order, as parsing every row would give
+		lengths = parsed.lengths()[cells]
+		rows = np.repeat(np.arange(len(cells), dtype=np.int32), lengths)
+		starts = np.cumsum(lengths) - lengths
+		codes = item_codes[np.repeat(parsed.offsets[:-1][cells] - starts, lengths) + np.arange(lengths.sum())].astype(np.int32)
+		return cls.from_entries(labels, rows, codes, len(cells), df.index)
+
+	@classmethod
+	def from_entries(cls, labels, rows, codes, n, index):
+		# set bit (label, row) for every entry: the bit keys sorted, each
+		# byte is the OR of its run of keys (repeated entries included)
+		width = (n + 7) // 8
+		bits = np.zeros((len(labels), width), dtype=np.uint8)
+		key = np.sort(codes.astype(np.int64) * (width * 8) + rows)
+		if len(key):
+			byte = key >> 3
+			first = np.flatnonzero(np.concatenate(([True], byte[1:] != byte[:-1])))
+			bits.ravel()[byte[first]] = np.bitwise_or.reduceat(np.left_shift(1, key & 7).astype(np.uint8), first)
+		return cls(labels, bits, rows, codes, index)
+
+	def __len__(self):
+		return len(self.index)
+
+	def positions(self, index):
+		# row positions (in the indexed frame) of the labels in index
+		if isinstance(self.index, pd.RangeIndex) and self.index.start == 0 and self.index.step == 1:
+			return np.asarray(index, dtype=np.int64)
+		pos = self.index.get_indexer(index)
+		if (pos < 0).any():
+			raise KeyError('rows not covered by this index')
+		return pos
+
+	def _unpack(self, words, rows=None):
+		# a packed bitmap as a bool mask over every row, or over the rows at positions rows
+		if rows is None:
+			return np.unpackbits(words, count=len(self), bitorder='little').view(bool)
+		rows = np.asarray(rows)
+		return ((words[rows >> 3] >> (rows & 7).astype(np.uint8)) & 1).view(bool)
+
+	def bitmap(self, labels, mode='any'):
+		"""Packed bitmap of the rows with any (or all) of labels."""
+		js = [self._lookup.get(label) for label in labels]
+		if mode == 'all':
+			if not js or None in js:
+				return np.full(self.bits.shape[1], 0 if js else 0xFF, dtype=np.uint8)
+			return np.bitwise_and.reduce(self.bits[js], axis=0)
+		js = [j for j in js if j is not None]
+		if not js:
+			return np.zeros(self.bits.shape[1], dtype=np.uint8)
+		return np.bitwise_or.reduce(self.bits[js], axis=0)
+
+	def column(self, label):
+		return self.match([label])
+
+	def any_of(self, labels):
+		return self.match(labels, 'any')
+
+	def all_of(self, labels):
+		return self.match(labels, 'all')
+
+	def match(self, labels, mode='any', rows=None):
+		# row mask of the labels' bitmap, over every row or the rows at positions rows
+		return self._unpack(self.bitmap(labels, mode), rows)
+
+	def row_counts(self):
+		"""Rows carrying each label (a row listing a label twice counts once), in labels order."""
+		return _POPCOUNT[self.bits].sum(axis=1)
+
+	def pairs(self):
+		"""(rows, codes) of the distinct (row, label) entries, by row then label."""
+		width = max(len(self.labels), 1)
+		key = np.sort(self.entry_rows.astype(np.int64) * width + self.entry_codes)
+		key = key[np.concatenate(([True], key[1:] != key[:-1]))] if len(key) else key
+		return np.divmod(key, width)
+
+	def dense(self, dtype=bool):
+		"""rows x labels matrix; small frames only (it is 8x the bitmaps as bool)."""
+		return np.unpackbits(self.bits, axis=1, count=len(self), bitorder='little').T.astype(dtype)
+
+	def counts(self, rows=None):
+		"""Label -> count over all rows, or over a row mask / row positions."""
+		codes = self.entry_codes
+		if rows is not None:
+			rows = np.asarray(rows)
+			if rows.dtype != bool:
+				mask = np.zeros(len(self), dtype=bool)
+				mask[rows] = True
+				rows = mask
+			codes = codes[rows[self.entry_rows]]
+		counts = np.bincount(codes, minlength=len(self.labels))
+		out = pd.Series(counts, index=self.labels, name='count')
+		return out[out > 0]
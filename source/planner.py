@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+from source import instrument
+from source.multihot import MultiHotIndex
+
+
+def decade_int(x):
+	# "1970s" -> 1970; None when the first four characters are not a year
+	try:
+		return int(str(x)[:4])
+	except Exception:
+		return None
+
+
+def _per_value(series, fn):
+	# fn over the distinct values only (a categorical's categories, a few type /
+	# decade labels), gathered back per row; NaN rows get fn(NaN)
+	codes, uniques = pd.factorize(series, use_na_sentinel=True)
+	values = fn(pd.Series(list(uniques) + [np.nan], dtype=object)).to_numpy()
+	return values[np.where(codes < 0, len(uniques), codes)]
+
+
+class FilterKeys:
+	"""Typed per-row keys for filter_data's predicates, built once per frame.
+
+	type as a code into the upper-cased type labels, decade as a float year
+	(nan when it does not parse), genres as the multi-hot index, plus the
+	counts per key used to order the predicates.
+	"""
+
+	def __init__(self, index, type_codes, type_labels, decades, genres):
+		self.index = index
+		self.type_codes = type_codes
+		self.type_lookup = {} if type_labels is None else {t: j for j, t in enumerate(type_labels)}
+		self.type_counts = None if type_codes is None else np.bincount(type_codes[type_codes >= 0], minlength=len(self.type_lookup))
+		self.decades = decades
+		if decades is not None:
+			self.decade_values, self.decade_counts = np.unique(decades[~np.isnan(decades)], return_counts=True)
+		self.genres = genres
+		self.genre_counts = None if genres is None else dict(zip(genres.labels.tolist(), genres.row_counts().tolist()))
+
+	@classmethod
+	@instrument.timed
+	def build(cls, df, genres=None, columns=('type', 'decade', 'genres')):
+		# columns: the keys to build (a one-off filter needs only its own)
+		type_codes = type_labels = decades = None
+		if 'type' in df.columns and 'type' in columns:
+			codes, labels = pd.factorize(_per_value(df['type'], lambda s: s.str.upper()))
+			type_codes, type_labels = codes.astype(np.int32), labels.tolist()
+		if 'decade' in df.columns and 'decade' in columns:
+			decades = _per_value(df['decade'], lambda s: pd.to_numeric(s.astype(str).str[:4], errors='coerce')).astype(float)
+		if genres is None and 'genres' in df.columns and 'genres' in columns:
+			genres = MultiHotIndex.build(df, 'genres')
+		return cls(df.index, type_codes, type_labels, decades, genres)
+
+	def __len__(self):
+		return len(self.index)
+
+	def covers(self, df):
+		return len(df) == len(self) and (df.index is self.index or df.index.equals(self.index))
+
+	def predicates(self, type_value=None, decades=None, genres=None, genre_mode='any'):
+		"""[(estimated rows, name, test)] for the active filters, most selective first.
+
+		test(rows) is the predicate over the rows at positions rows, or over
+		every row for rows=None.
+		"""
+		preds = []
+		if type_value:
+			if self.type_codes is None:
+				raise KeyError('type')
+			code = self.type_lookup.get(type_value.upper(), -2)
+			codes = self.type_codes
+			estimate = int(self.type_counts[code]) if code >= 0 else 0
+			preds.append((estimate, 'type', lambda rows: (codes if rows is None else codes[rows]) == code))
+
+		if decades and len(decades) == 2 and self.decades is not None:
+			start, end = decade_int(decades[0]), decade_int(decades[1])
+			if start is not None and end is not None:
+				dec = self.decades
+				inside = (self.decade_values >= start) & (self.decade_values <= end)
+				estimate = int(self.decade_counts[inside].sum())
+				# inclusive range; rows whose decade does not parse (nan) never match
+				preds.append((estimate, 'decades', lambda rows: _between(dec if rows is None else dec[rows], start, end)))
+
+		if genres and len(genres) > 0 and self.genres is not None:
+			gi, labels = self.genres, list(genres)
+			counts = [self.genre_counts.get(g, 0) for g in labels]
+			estimate = min(counts) if genre_mode == 'all' else min(len(self), sum(counts))
+
+			def test(rows, gi=gi, labels=labels):
+				# the labels' bitmaps combine packed; only the rows asked for are unpacked
+				return gi.match(labels, genre_mode, rows)
+			preds.append((estimate, 'genres', test))
+
+		return sorted(preds, key=lambda p: p[0])
+
+	def rows(self, type_value=None, decades=None, genres=None, genre_mode='any', rows=None):
+		"""Ascending positions (into rows, or into the keyed frame) that pass every filter.
+
+		The most selective predicate is evaluated first over all candidate
+		rows; each later one only over the rows still left.
+		"""
+		left = None
+		for _, _, test in self.predicates(type_value, decades, genres, genre_mode):
+			if left is None:
+				left = np.flatnonzero(test(rows))
+			else:
+				left = left[test(left if rows is None else rows[left])]
+			if not len(left):
+				break
+		if left is None:
+			return np.arange(len(self) if rows is None else len(rows))
+		return left
+
+
+def _between(values, start, end):
+	return (values >= start) & (values <= end)
+
+
+@instrument.timed
+def select(df, type_value=None, decades=None, genres=None, index=None, genre_mode='any'):
+	"""Ascending positions of df's rows that pass filter_data's filters.
+
+	index: the dict from analysis.build_list_indexes; its 'keys' are used
+	when they were built for df or a frame containing df's rows, its
+	'genres' index when keys have to be built.
+	"""
+	# a filter on a column df lacks is skipped, except type (KeyError), as in filter_data
+	if type_value and 'type' not in df.columns:
+		raise KeyError('type')
+	decades = decades if 'decade' in df.columns else None
+	genres = genres if 'genres' in df.columns else None
+	keys = index.get('keys') if index else None
+	if keys is not None and not keys.covers(df):
+		pos = keys.index.get_indexer(df.index) if keys.index.is_unique else None
+		if pos is not None and (pos >= 0).all():
+			return keys.rows(type_value, decades, genres, genre_mode, rows=pos)
+		keys = None
+	if keys is None:
+		active = [c for c, on in [('type', type_value), ('decade', decades and len(decades) == 2), ('genres', genres)] if on]
+		if not active:
+			return np.arange(len(df))
+		gi = index.get('genres') if index else None
+		if gi is not None and not (len(gi) == len(df) and gi.index.equals(df.index)):
+			gi = None
+		keys = FilterKeys.build(df, gi, active)
+	return keys.rows(type_value, decades, genres, genre_mode)
@@ -0,0 +1,360 @@
+"""Column profile of the cleaned dataset, written next to it at clean time.
+
+	data/cleaned.csv -> data/cleaned.profile.json
+
+Per (type, decade) cell the profile holds the row count, null counts of
+every column, moments (count, min, max, mean, M2) of every numeric column
+and a quantile sketch of the SKETCHED columns. All of them merge: the
+profile of a type or a decade range is the merge of its cells, and a
+chunked or incremental clean merges the profiles of its chunks instead of
+rescanning the rows. The dashboard reads percentiles, spreads and
+histograms from it without touching the frame.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from source import instrument
+
+
+FORMAT_VERSION = 1
+SKETCHED = ['imdb_score', 'tmdb_score', 'tmdb_popularity', 'imdb_votes', 'runtime']
+NUMERIC = ['release_year', 'runtime', 'seasons', 'imdb_votes', 'imdb_score', 'tmdb_popularity', 'tmdb_score']
+# sketch size: rank error about 1.7 / K of the values summarized
+K = 200
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def profile_path(csv_path):
+	# data/cleaned.csv -> data/cleaned.profile.json
+	return os.path.splitext(csv_path)[0] + '.profile.json'
+
+
+class Moments:
+	"""count / min / max / mean / M2 of the present values, merged with Chan's update."""
+
+	__slots__ = ('n', 'min', 'max', 'mean', 'm2')
+
+	def __init__(self, n=0, min=np.inf, max=-np.inf, mean=0.0, m2=0.0):
+		self.n, self.min, self.max, self.mean, self.m2 = int(n), float(min), float(max), float(mean), float(m2)
+
+	@classmethod
+	def of(cls, values):
+		values = values[~np.isnan(values)]
+		if not len(values):
+			return cls()
+		mean = values.mean()
+		return cls(len(values), values.min(), values.max(), mean, ((values - mean) ** 2).sum())
+
+	def merge(self, other):
+		if not other.n:
+			return self
+		if not self.n:
+			self.n, self.min, self.max, self.mean, self.m2 = other.n, other.min, other.max, other.mean, other.m2
+			return self
+		n = self.n + other.n
+		delta = other.mean - self.mean
+		self.mean += delta * other.n / n
+		self.m2 += other.m2 + delta * delta * self.n * other.n / n
+		self.n = n
+		self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+		return self
+
+	@property
+	def std(self):
+		# sample standard deviation, as pandas' Series.std
+		return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else float('nan')
+
+	def to_list(self):
+		return [self.n, self.min, self.max, self.mean, self.m2] if self.n else [0]
+
+	@classmethod
+	def from_list(cls, values):
+		return cls(*values)
+
+
+class QuantileSketch:
+	"""KLL-style mergeable quantile sketch.
+
+	Level h holds values standing for 2**h values each. A level over its
+	capacity (k at the top, shrinking by 2/3 per level down) is sorted and
+	every other value, from a random first one, moves up a level, so the
+	total weight stays exactly n. Updates take whole arrays; merging
+	concatenates the levels and compacts again.
+	"""
+
+	def __init__(self, k=K, levels=None, n=0, seed=0):
+		self.k = k
+		self.levels = levels if levels is not None else [np.zeros(0)]
+		self.n = int(n)
+		self._rng = np.random.default_rng(seed)
+
+	def _capacity(self, h):
+		return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - h))))
+
+	def _compact(self):
+		h = 0
+		while h < len(self.levels):
+			level = self.levels[h]
+			if len(level) > self._capacity(h):
+				level = np.sort(level)
+				# an odd value out stays on this level
+				keep, pairs = level[:len(level) % 2], level[len(level) % 2:]
+				if h + 1 == len(self.levels):
+					self.levels.append(np.zeros(0))
+				self.levels[h + 1] = np.concatenate([self.levels[h + 1], pairs[self._rng.integers(2)::2]])
+				self.levels[h] = keep
+				# capacities shrink when a level is added: recheck from the bottom
+				h = 0
+				continue
+			h += 1
+
+	def update(self, values):
+		values = np.asarray(values, dtype=float)
+		values = values[~np.isnan(values)]
+		if len(values):
+			self.levels[0] = np.concatenate([self.levels[0], values])
+			self.n += len(values)
+			self._compact()
+		return self
+
+	def merge(self, other):
+		for h, level in enumerate(other.levels):
+			if h == len(self.levels):
+				self.levels.append(np.zeros(0))
+			self.levels[h] = np.concatenate([self.levels[h], level])
+		self.n += other.n
+		self._compact()
+		return self
+
+	def _weighted(self):
+		values = np.concatenate(self.levels)
+		weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+		order = np.argsort(values, kind='stable')
+		return values[order], np.cumsum(weights[order])
+
+	def quantiles(self, qs):
+		"""Approximate values at the fractions qs (nan when empty)."""
+		qs = np.atleast_1d(np.asarray(qs, dtype=float))
+		if not self.n:
+			return np.full(len(qs), np.nan)
+		values, cum = self._weighted()
+		pos = np.searchsorted(cum, qs * cum[-1], 'left')
+		return values[np.minimum(pos, len(values) - 1)]
+
+	def cdf(self, points):
+		"""Approximate fraction of the values <= each point."""
+		points = np.atleast_1d(np.asarray(points, dtype=float))
+		if not self.n:
+			return np.full(len(points), np.nan)
+		values, cum = self._weighted()
+		pos = np.searchsorted(values, points, 'right')
+		return np.where(pos > 0, cum[np.maximum(pos - 1, 0)], 0.0) / cum[-1]
+
+	def to_list(self):
+		return [level.tolist() for level in self.levels]
+
+	@classmethod
+	def from_list(cls, levels, k=K):
+		levels = [np.asarray(level, dtype=float) for level in levels] or [np.zeros(0)]
+		n = sum(len(level) * 2 ** h for h, level in enumerate(levels))
+		return cls(k, levels, n, seed=n)
+
+
+class Cell:
+	"""Profile of the rows of one (type, decade) cell."""
+
+	def __init__(self, rows=0, nulls=None, moments=None, sketches=None):
+		self.rows = rows
+		self.nulls = nulls or {}
+		self.moments = moments or {}
+		self.sketches = sketches or {}
+
+	def merge(self, other):
+		self.rows += other.rows
+		for col, n in other.nulls.items():
+			self.nulls[col] = self.nulls.get(col, 0) + n
+		for col, m in other.moments.items():
+			self.moments.setdefault(col, Moments()).merge(m)
+		for col, s in other.sketches.items():
+			self.sketches.setdefault(col, QuantileSketch(s.k)).merge(s)
+		return self
+
+	def to_dict(self):
+		return {'rows': self.rows, 'nulls': self.nulls,
+				'moments': {c: m.to_list() for c, m in self.moments.items()},
+				'sketches': {c: s.to_list() for c, s in self.sketches.items()}}
+
+	@classmethod
+	def from_dict(cls, d, k=K):
+		return cls(d['rows'], dict(d['nulls']), {c: Moments.from_list(v) for c, v in d['moments'].items()},
+				   {c: QuantileSketch.from_list(v, k) for c, v in d['sketches'].items()})
+
+
+class Profile:
+	"""Cells keyed by (type, decade) label (None when missing), plus the source file."""
+
+	def __init__(self, cells=None, columns=None, k=K, source=None):
+		self.cells = cells or {}
+		self.columns = columns or []
+		self.k = k
+		self.source = source
+
+	@classmethod
+	@instrument.timed
+	def build(cls, df, k=K, source=None):
+		n = len(df)
+		missing = pd.Series([None] * n, dtype=object)
+		# types upper-cased per distinct label, as filter_data compares them
+		tcode, tkeys = pd.factorize(df['type'].astype(object) if 'type' in df.columns else missing)
+		ucode, tkeys = pd.factorize(pd.Series([str(x).upper() for x in tkeys], dtype=object))
+		tcode = np.where(tcode < 0, -1, ucode[np.maximum(tcode, 0)]) if len(ucode) else tcode
+		dcode, dkeys = pd.factorize(df['decade'].astype(object) if 'decade' in df.columns else missing)
+		# cell code from the type and decade codes; -1 (missing) is a value of its own
+		codes, pairs = pd.factorize((tcode + 1) * (len(dkeys) + 1) + dcode + 1)
+		tkeys, dkeys = [None] + [str(x) for x in tkeys], [None] + [str(x) for x in dkeys]
+		keys = [(tkeys[p // (len(dkeys))], dkeys[p % len(dkeys)]) for p in pairs.tolist()]
+		order = np.argsort(codes, kind='stable')
+		bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+		nulls = {col: np.bincount(codes, weights=df[col].isna().to_numpy(), minlength=len(keys)) for col in df.columns}
+		numeric = {col: pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)[order]
+				   for col in NUMERIC if col in df.columns}
+		cells = {}
+		for j, key in enumerate(keys):
+			lo, hi = bounds[j], bounds[j + 1]
+			cell = Cell(int(hi - lo), {col: int(v[j]) for col, v in nulls.items()})
+			for col, values in numeric.items():
+				cell.moments[col] = Moments.of(values[lo:hi])
+				if col in SKETCHED:
+					cell.sketches[col] = QuantileSketch(k, seed=j).update(values[lo:hi])
+			cells[key] = cell
+		return cls(cells, list(df.columns), k, source)
+
+	def merge(self, other):
+		"""Add other's rows (e.g. the next chunk of a clean) to this profile."""
+		for key, cell in other.cells.items():
+			if key in self.cells:
+				self.cells[key].merge(cell)
+			else:
+				self.cells[key] = Cell().merge(cell)
+		self.columns += [c for c in other.columns if c not in self.columns]
+		return self
+
+	@property
+	def rows(self):
+		return sum(cell.rows for cell in self.cells.values())
+
+	# ---- slicing -------------------------------------------------------------
+
+	def select(self, type_value=None, decades=None):
+		"""The merged Cell of the rows filter_data keeps for type_value and decades."""
+		from source.planner import decade_int  # planner imports multihot -> cleaning -> this module
+		start = end = None
+		if decades and len(decades) == 2:
+			start, end = decade_int(decades[0]), decade_int(decades[1])
+		out = Cell()
+		for (t, d), cell in self.cells.items():
+			if type_value and t != type_value.upper():
+				continue
+			if start is not None and end is not None:
+				year = decade_int(d) if d is not None else None
+				if year is None or not start <= year <= end:
+					continue
+			out.merge(cell)
+		return out
+
+	def describe(self, col, qs=QUANTILES, type_value=None, decades=None):
+		"""{count, nulls, min, max, mean, std, p10, ...} of col over the selected cells."""
+		return _describe(self.select(type_value, decades), col, qs)
+
+	def summary(self, qs=QUANTILES, type_value=None, decades=None):
+		"""describe() of every profiled numeric column, one row each."""
+		cell = self.select(type_value, decades)
+		return pd.DataFrame([dict(column=c, **_describe(cell, c, qs)) for c in NUMERIC if c in cell.moments])
+
+	def histogram(self, col, bins=30, type_value=None, decades=None):
+		"""Approximate counts of col over bins equal-width bins from min to max."""
+		cell = self.select(type_value, decades)
+		m, sketch = cell.moments.get(col, Moments()), cell.sketches.get(col)
+		if not m.n or sketch is None:
+			return pd.DataFrame({'left': [], 'right': [], 'count': []})
+		edges = np.linspace(m.min, m.max, bins + 1)
+		cdf = sketch.cdf(edges)
+		cdf[0], cdf[-1] = 0.0, 1.0
+		counts = np.round(np.diff(cdf) * m.n).astype(np.int64)
+		return pd.DataFrame({'left': edges[:-1], 'right': edges[1:], 'count': counts})
+
+	# ---- storage -------------------------------------------------------------
+
+	def to_dict(self):
+		return {'format': FORMAT_VERSION, 'k': self.k, 'columns': self.columns, 'source': self.source,
+				'cells': [{'type': t, 'decade': d, **cell.to_dict()} for (t, d), cell in self.cells.items()]}
+
+	@classmethod
+	def from_dict(cls, d):
+		if d.get('format') != FORMAT_VERSION:
+			raise ValueError('profile format changed')
+		cells = {(c['type'], c['decade']): Cell.from_dict(c, d['k']) for c in d['cells']}
+		return cls(cells, d['columns'], d['k'], d.get('source'))
+
+	def save(self, path):
+		tmp = path + '.tmp'
+		with open(tmp, 'w', encoding='utf-8') as fh:
+			json.dump(self.to_dict(), fh)
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path):
+		with open(path, 'r', encoding='utf-8') as fh:
+			return cls.from_dict(json.load(fh))
+
+
+def _describe(cell, col, qs):
+	m = cell.moments.get(col, Moments())
+	out = {'count': m.n, 'nulls': cell.nulls.get(col, 0),
+		   'min': m.min if m.n else float('nan'), 'max': m.max if m.n else float('nan'),
+		   'mean': m.mean if m.n else float('nan'), 'std': m.std}
+	if col in cell.sketches:
+		for q, v in zip(qs, cell.sketches[col].quantiles(qs)):
+			out[f'p{round(q * 100):g}'] = float(v)
+	return out
+
+
+def save_for(profile, csv_path):
+	"""Save a profile of csv_path's rows next to it, stamped with the file's current version."""
+	from source import colstore  # imports cleaning, which imports this module
+	profile.source = colstore.source_fingerprint(csv_path, with_hash=False)
+	profile.save(profile_path(csv_path))
+	return profile
+
+
+def load_for(csv_path):
+	"""The saved profile of csv_path if it still matches the file, else None."""
+	try:
+		profile = Profile.load(profile_path(csv_path))
+	except (OSError, ValueError, KeyError):
+		return None
+	from source import colstore
+	return profile if profile.source == colstore.source_fingerprint(csv_path, with_hash=False) else None
+
+
+@instrument.timed
+def summarize(df, qs=QUANTILES):
+	# Profile.summary of a frame's own rows, for filters the cells cannot answer (genres)
+	return Profile.build(df).summary(qs)
+
+
+@instrument.timed
+def load_or_build(csv_path, df):
+	"""The saved profile of csv_path if current, else one built from df (and saved)."""
+	profile = load_for(csv_path)
+	if profile is not None and profile.rows == len(df):
+		return profile
+	profile = Profile.build(df)
+	try:
+		save_for(profile, csv_path)
+	except OSError:
+		pass
+	return profile
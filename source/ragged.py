@@ -0,0 +1,65 @@
+import numpy as np
+
+
+class Ragged:
+	"""Column of lists stored as offsets + flat values (a ragged array).
+
+	Row i holds values[offsets[i]:offsets[i + 1]]. Rows flagged in mask were
+	missing in the source (None rather than an empty list).
+	"""
+
+	def __init__(self, offsets, values, mask=None):
+		self.offsets = np.asarray(offsets, dtype=np.int64)
+		self.values = np.asarray(values, dtype=object)
+		if mask is None:
+			mask = np.zeros(len(self.offsets) - 1, dtype=bool)
+		self.mask = np.asarray(mask, dtype=bool)
+
+	@classmethod
+	def from_lists(cls, lists):
+		lists = list(lists)
+		lengths = [len(v) if isinstance(v, list) else 0 for v in lists]
+		offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+		np.cumsum(lengths, out=offsets[1:])
+		values = np.empty(int(offsets[-1]), dtype=object)
+		values[:] = [x for v in lists if isinstance(v, list) for x in v]
+		mask = np.fromiter((not isinstance(v, list) for v in lists), dtype=bool, count=len(lists))
+		return cls(offsets, values, mask)
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def lengths(self):
+		return np.diff(self.offsets)
+
+	def row_ids(self):
+		# row number of every entry in values
+		return np.repeat(np.arange(len(self)), self.lengths())
+
+	def first(self):
+		# first item per row, None for empty or missing rows
+		out = np.full(len(self), None, dtype=object)
+		has = self.lengths() > 0
+		out[has] = self.values[self.offsets[:-1][has]]
+		return out
+
+	def unique(self):
+		return np.unique(self.values.astype(str)) if len(self.values) else np.array([], dtype=object)
+
+	def take(self, positions):
+		positions = np.asarray(positions, dtype=np.int64)
+		starts = self.offsets[:-1][positions]
+		lengths = self.offsets[1:][positions] - starts
+		offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+		np.cumsum(lengths, out=offsets[1:])
+		# index of every kept value: row start + position within the row
+		within = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+		idx = np.repeat(starts, lengths) + within
+		return Ragged(offsets, self.values[idx], self.mask[positions])
+
+	def to_lists(self):
+		values = self.values.tolist()
+		bounds = zip(self.mask.tolist(), self.offsets[:-1].tolist(), self.offsets[1:].tolist())
+		out = np.empty(len(self), dtype=object)
+		out[:] = [None if m else values[a:b] for m, a, b in bounds]
+		return out
@@ -0,0 +1,326 @@
+import numpy as np
+import pandas as pd
+
+from source import analysis as an
+from source import instrument
+from source import planner
+from source.multihot import MultiHotIndex
+
+
+SCORES = ['imdb_score', 'tmdb_score']
+
+
+class YearRanges:
+	"""Prefix sums over release_year per (type, genre) group, for range aggregates.
+
+	Groups are every type (or all types) crossed with every genre (or all
+	genres). Per group and distinct year the build keeps the row count and,
+	per score column, the count / sum / sum of squares of the present scores
+	as cumulative arrays along the years, plus a sparse table of the year
+	maxima (and the first row holding each). Count, mean, std and max over
+	any year range are then two binary searches on the year axis and O(1)
+	lookups, whatever the number of rows.
+
+	Filters take filter_data's arguments with at most one genre (a set of
+	genres is not a single group), plus years=(start, end), inclusive. A
+	decade range is the year range it covers. Rows without a release_year
+	count only when no year range is given.
+	"""
+
+	def __init__(self, years, types, genres, counts, missing, stats):
+		self.years = years      # distinct release years, ascending
+		self.types = types      # type label per type code (code 0 = all types)
+		self.genres = genres    # genre label per genre code (code 0 = all genres)
+		self.counts = counts    # groups x (years + 1), cumulative row counts
+		self.missing = missing  # {'count': per group, score: {n, sum, sumsq, max, row}} of rows without a year
+		self.stats = stats      # score -> {'n', 'sum', 'sumsq': cumulative, 'max', 'row': sparse table levels}
+		self._types = {t: j for j, t in enumerate(types) if t is not None}
+		self._genres = {g: j for j, g in enumerate(genres) if g is not None}
+
+	@classmethod
+	@instrument.timed
+	def build(cls, df, index=None, scores=SCORES):
+		# index: analysis.build_list_indexes(df), whose type codes and genres
+		# multi-hot are reused; built here when not given
+		n = len(df)
+		index = index or {}
+		year = pd.to_numeric(df['release_year'], errors='coerce').to_numpy(dtype=float) if 'release_year' in df.columns else np.full(n, np.nan)
+		has_year = ~np.isnan(year)
+		years = np.unique(year[has_year])
+		# year code per row; rows without a year go to the trailing bucket
+		ycode = np.where(has_year, np.searchsorted(years, np.where(has_year, year, 0)), len(years))
+
+		keys = index.get('keys')
+		if keys is None or not keys.covers(df) or (keys.type_codes is None and 'type' in df.columns):
+			keys = planner.FilterKeys.build(df, columns=('type',))
+		if keys.type_codes is not None:
+			tcode, tlabels = keys.type_codes.astype(np.int64), list(keys.type_lookup)
+		else:
+			tcode, tlabels = np.full(n, -1), []
+		types = [None] + tlabels
+		genres = index.get('genres')
+		if genres is not None and not (len(genres) == n and genres.index.equals(df.index)):
+			genres = None
+		if genres is None and 'genres' in df.columns:
+			genres = MultiHotIndex.build(df, 'genres')
+		if genres is not None and len(genres.labels):
+			grows, gcode = genres.pairs()
+			glabels = genres.labels.tolist()
+		else:
+			grows, gcode, glabels = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), []
+		genre_labels = [None] + glabels
+
+		# (row, group) entries: every row is in (all, all) and (its type, all),
+		# and per genre it has in (all, genre) and (its type, genre)
+		ng = len(genre_labels)
+		rows = np.arange(n)
+		typed = tcode >= 0
+		entry_rows = np.concatenate([rows, rows[typed], grows, grows[typed[grows]]])
+		entry_groups = np.concatenate([
+			np.zeros(n, dtype=np.int64), (tcode[typed] + 1) * ng,
+			gcode + 1, (tcode[grows][typed[grows]] + 1) * ng + gcode[typed[grows]] + 1,
+		])
+		width = len(years) + 1
+		cell = entry_groups * width + ycode[entry_rows]
+		size = len(types) * ng * width
+
+		def grid(values):
+			return values.reshape(len(types) * ng, width)
+
+		def cumulative(per_year):
+			out = np.zeros((per_year.shape[0], width), dtype=per_year.dtype)
+			np.cumsum(per_year[:, :-1], axis=1, out=out[:, 1:])
+			return out
+
+		count = grid(np.bincount(cell, minlength=size))
+		missing = {'count': count[:, -1]}
+		stats = {}
+		for col in scores:
+			if col not in df.columns:
+				continue
+			vals = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+			ok = ~np.isnan(vals[entry_rows])
+			c, v, r = cell[ok], vals[entry_rows[ok]], entry_rows[ok]
+			n_ = grid(np.bincount(c, minlength=size))
+			sum_ = grid(np.bincount(c, weights=v, minlength=size))
+			sumsq = grid(np.bincount(c, weights=v * v, minlength=size))
+			# per cell the best score and the first row holding it: the smallest
+			# rank of its rows in (score desc, row asc) order
+			order = np.lexsort((np.arange(n), -vals))
+			rank = np.empty(n, dtype=np.int64)
+			rank[order] = np.arange(n)
+			top = np.full(size, n, dtype=np.int64)
+			np.minimum.at(top, c, rank[r])
+			best_row = np.where(top < n, order[np.minimum(top, n - 1)], -1)
+			best = np.where(best_row >= 0, vals[np.maximum(best_row, 0)], -np.inf)
+			best, best_row = grid(best), grid(best_row)
+			missing[col] = {'n': n_[:, -1], 'sum': sum_[:, -1], 'sumsq': sumsq[:, -1], 'max': best[:, -1], 'row': best_row[:, -1]}
+			maxima, rows_ = _sparse_table(best[:, :-1], best_row[:, :-1])
+			stats[col] = {'n': cumulative(n_), 'sum': cumulative(sum_), 'sumsq': cumulative(sumsq), 'max': maxima, 'row': rows_}
+		return cls(years, types, genre_labels, cumulative(count), missing, stats)
+
+	# ---- slicing -------------------------------------------------------------
+
+	def supports(self, genres=None, **filters):
+		return not genres or len(set(genres)) == 1
+
+	def group(self, type_value=None, genres=None, genre_mode='any'):
+		"""Row of the (type, genre) group, or None when no row can match."""
+		if not self.supports(genres):
+			raise ValueError('YearRanges answers at most one genre; use the cube or filter_data for a set')
+		t = self._types.get(type_value.upper()) if type_value else 0
+		g = self._genres.get(next(iter(genres))) if genres else 0
+		if t is None or g is None:
+			return None
+		return t * len(self.genres) + g
+
+	def span(self, decades=None, years=None):
+		"""(lo, hi, all_rows): the year codes [lo, hi) in range; all_rows when unbounded."""
+		lo, hi, bounded = 0, len(self.years), False
+		if decades and len(decades) == 2:
+			start, end = planner.decade_int(decades[0]), planner.decade_int(decades[1])
+			if start is not None and end is not None:
+				lo = max(lo, int(np.searchsorted(self.years, start, 'left')))
+				hi = min(hi, int(np.searchsorted(self.years, end + 10, 'left')))
+				bounded = True
+		if years is not None:
+			start, end = years
+			if start is not None:
+				lo = max(lo, int(np.searchsorted(self.years, start, 'left')))
+			if end is not None:
+				hi = min(hi, int(np.searchsorted(self.years, end, 'right')))
+			bounded = True
+		return lo, max(lo, hi), not bounded
+
+	def _where(self, filters):
+		g = self.group(filters.get('type_value'), filters.get('genres'), filters.get('genre_mode', 'any'))
+		lo, hi, all_rows = self.span(filters.get('decades'), filters.get('years'))
+		return g, lo, hi, all_rows
+
+	@instrument.timed
+	def count(self, **filters):
+		g, lo, hi, all_rows = self._where(filters)
+		if g is None:
+			return 0
+		return int(self.counts[g, hi] - self.counts[g, lo] + (self.missing['count'][g] if all_rows else 0))
+
+	@instrument.timed
+	def year_span(self, **filters):
+		"""(first, last) release year of the matching rows, or None."""
+		g, lo, hi, _ = self._where(filters)
+		if g is None:
+			return None
+		cum = self.counts[g]
+		if cum[hi] == cum[lo]:
+			return None
+		# first year whose count moves the prefix past lo, last that reaches hi
+		first = int(np.searchsorted(cum, cum[lo], 'right')) - 1
+		last = int(np.searchsorted(cum, cum[hi], 'left')) - 1
+		return self.years[first].item(), self.years[last].item()
+
+	@instrument.timed
+	def summary(self, score_col='imdb_score', **filters):
+		"""{count, n, mean, std, max, max_row} of score_col over the matching rows.
+
+		n counts the rows with a score; std is the sample standard deviation
+		(pandas' default); max_row is the position of the first row with the
+		max, -1 when there is none.
+		"""
+		out = {'count': self.count(**filters), 'n': 0, 'mean': float('nan'), 'std': float('nan'), 'max': float('nan'), 'max_row': -1}
+		g, lo, hi, all_rows = self._where(filters)
+		if g is None:
+			return out
+		s, m = self.stats[score_col], self.missing[score_col]
+		n = s['n'][g, hi] - s['n'][g, lo]
+		total = s['sum'][g, hi] - s['sum'][g, lo]
+		sumsq = s['sumsq'][g, hi] - s['sumsq'][g, lo]
+		best, row = _range_max(s['max'], s['row'], g, lo, hi)
+		if all_rows:
+			n, total, sumsq = n + m['n'][g], total + m['sum'][g], sumsq + m['sumsq'][g]
+			if m['max'][g] > best or (m['max'][g] == best and 0 <= m['row'][g] < row):
+				best, row = m['max'][g], m['row'][g]
+		if n:
+			out.update(n=int(n), mean=float(total / n), max=float(best), max_row=int(row))
+			if n > 1:
+				out['std'] = float(np.sqrt(max(sumsq - total * total / n, 0.0) / (n - 1)))
+		return out
+
+	@instrument.timed
+	def per_year(self, score_col='imdb_score', **filters):
+		"""Per release year in range: count, and score_col's n, mean and max with its first row."""
+		g, lo, hi, _ = self._where(filters)
+		if g is None:
+			lo = hi = 0
+			g = 0
+		s = self.stats[score_col]
+		count = np.diff(self.counts[g, lo:hi + 1])
+		n = np.diff(s['n'][g, lo:hi + 1])
+		total = np.diff(s['sum'][g, lo:hi + 1])
+		with np.errstate(invalid='ignore', divide='ignore'):
+			mean = np.where(n > 0, total / n, np.nan)
+		out = pd.DataFrame({
+			'release_year': self.years[lo:hi], 'count': count, 'n': n, 'mean': mean,
+			'max': np.where(n > 0, s['max'][0][g, lo:hi], np.nan), 'max_row': s['row'][0][g, lo:hi],
+		})
+		return out[out['count'] > 0].reset_index(drop=True)
+
+	def best_per_year(self, df, **filters):
+		"""best_imdb_each_year of the filtered frame, from the per-year maxima of df's rows."""
+		if 'imdb_score' not in self.stats or 'title' not in df.columns:
+			return pd.DataFrame({'release_year': [], 'title': [], 'imdb_score': []})
+		py = self.per_year('imdb_score', **filters)
+		py = py[py['max_row'] >= 0]
+		rows = py['max_row'].to_numpy()
+		return pd.DataFrame({
+			'release_year': py['release_year'].astype(int).to_numpy(),
+			'title': df['title'].iloc[rows].to_numpy(),
+			'imdb_score': df['imdb_score'].iloc[rows].to_numpy(),
+		})
+
+
+def _sparse_table(values, rows):
+	# levels k = 0.. of the best (value, first row) over 2**k consecutive years
+	maxima, positions = [values], [rows]
+	k = 1
+	while (1 << k) <= values.shape[1]:
+		v, r = maxima[-1], positions[-1]
+		half = 1 << (k - 1)
+		a, b = v[:, :-half], v[:, half:]
+		ra, rb = r[:, :-half], r[:, half:]
+		take_b = (b > a) | ((b == a) & (rb >= 0) & ((ra < 0) | (rb < ra)))
+		maxima.append(np.where(take_b, b, a))
+		positions.append(np.where(take_b, rb, ra))
+		k += 1
+	return maxima, positions
+
+
+def _range_max(maxima, positions, g, lo, hi):
+	# best (value, first row) over the year codes [lo, hi): two overlapping blocks
+	if hi <= lo:
+		return -np.inf, -1
+	k = (hi - lo).bit_length() - 1
+	a, ra = maxima[k][g, lo], positions[k][g, lo]
+	b, rb = maxima[k][g, hi - (1 << k)], positions[k][g, hi - (1 << k)]
+	if b > a or (b == a and rb >= 0 and (ra < 0 or rb < ra)):
+		return b, rb
+	return a, ra
+
+
+@instrument.timed
+def build_ranges(df, index=None):
+	return YearRanges.build(df, index)
+
+
+def check_consistency(df, ranges, filters=None):
+	"""Compare YearRanges answers with filter_data and the row-scan functions.
+
+	filters: list of filter_data keyword dicts, optionally with years=(start,
+	end) (defaults to a grid over type, decade and year ranges and the two
+	most common genres). Returns (filters, what, ranges_value, scan_value)
+	mismatches; empty means consistent.
+	"""
+	years = pd.to_numeric(df['release_year'], errors='coerce').dropna()
+	if filters is None:
+		decs = sorted(set(df['decade'].dropna().astype(str))) if 'decade' in df.columns else []
+		top = an.top_genres(df, n=2)['genre'].tolist()
+		lo, hi = (int(years.min()), int(years.max())) if len(years) else (0, 0)
+		spans = [{}, {'years': (lo + (hi - lo) // 3, hi - (hi - lo) // 3)}, {'years': (hi, hi)}, {'years': (hi + 1, None)}]
+		if decs:
+			spans += [{'decades': [decs[0], decs[-1]]}, {'decades': [decs[len(decs) // 2], decs[-1]]},
+					  {'decades': [decs[-1], decs[0]]}]
+		filters = [dict(type_value=t, genres=g, **s) for t in [None, 'MOVIE', 'SHOW', 'nope'] for g in [None] + [[x] for x in top] for s in spans]
+	problems = []
+	for f in filters:
+		span = f.get('years')
+		rows = an.filter_rows(df, **{k: v for k, v in f.items() if k != 'years'})
+		if span is not None:
+			y = pd.to_numeric(df['release_year'], errors='coerce').to_numpy(dtype=float)[rows]
+			keep = ~np.isnan(y)
+			if span[0] is not None:
+				keep &= y >= span[0]
+			if span[1] is not None:
+				keep &= y <= span[1]
+			rows = rows[keep]
+		scan = df.iloc[rows]
+		score = scan['imdb_score'].dropna()
+		got = ranges.summary('imdb_score', **f)
+		want = {'count': len(scan), 'n': len(score), 'mean': score.mean(), 'std': score.std(), 'max': score.max()}
+		for what, value in want.items():
+			g = got[what]
+			if pd.isna(value) and pd.isna(g):
+				continue
+			if pd.isna(value) or pd.isna(g) or not np.isclose(g, value):
+				problems.append((f, what, g, value))
+		want_row = int(rows[np.argmax(scan['imdb_score'].to_numpy(dtype=float) == score.max())]) if len(score) else -1
+		if got['max_row'] != want_row:
+			problems.append((f, 'max_row', got['max_row'], want_row))
+		y = pd.to_numeric(scan['release_year'], errors='coerce').dropna()
+		want_span = (y.min().item(), y.max().item()) if len(y) else None
+		if ranges.year_span(**f) != want_span:
+			problems.append((f, 'year_span', ranges.year_span(**f), want_span))
+		best, want_best = ranges.best_per_year(df, **f), an.best_imdb_each_year(scan)
+		if not (best['release_year'].tolist() == want_best['release_year'].tolist()
+				and best['title'].tolist() == want_best['title'].tolist()
+				and np.allclose(best['imdb_score'].to_numpy(dtype=float), want_best['imdb_score'].to_numpy(dtype=float))):
+			problems.append((f, 'best_per_year', len(best), len(want_best)))
+	return problems
@@ -0,0 +1,189 @@
+"""Render the dashboard's figures for a grid of filter combinations, headless.
+
+	python -m source.report --out reports/ --format html
+	python -m source.report --types MOVIE,SHOW --decades each --top-genres 3 --workers 4 --format json
+
+One page (HTML) or one JSON file of plotly figure specs per combination,
+plus an index. Aggregations are computed once per combination and shared by
+its figures; combinations are rendered in a process pool.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from source import analysis as an
+from source import cube as cb
+
+
+FIGURES = [
+	'line_titles_per_decade', 'bar_top_genres', 'hist_scores', 'line_best_imdb_each_year',
+	'bar_top_popular', 'bar_top_countries', 'choropleth_countries', 'scatter_imdb_vs_tmdb',
+]
+
+# dataset, list indexes and cube of this process; a forked worker inherits the
+# parent's, a spawned one maps the same shared column files
+_STATE = {}
+
+
+def _load(path):
+	if _STATE.get('path') != path:
+		df = an.load_cleaned(path, shared=True)
+		_STATE.update(path=path, df=df, index=an.build_list_indexes(df), cube=cb.build_cube(df))
+	return _STATE
+
+
+def build_grid(df, types=None, decades='all', top_genres=5):
+	"""Filter combinations: types x decade ranges x (no genre + each of the top genres).
+
+	types: list of 'MOVIE' / 'SHOW' / 'ALL'. decades: 'all' (no decade filter),
+	'each' (no filter plus every single decade) or a list of [start, end] pairs.
+	"""
+	types = types or ['ALL', 'MOVIE', 'SHOW']
+	decs = sorted(set(df['decade'].dropna().astype(str))) if 'decade' in df.columns else []
+	if decades == 'all':
+		ranges = [None]
+	elif decades == 'each':
+		ranges = [None] + [[d, d] for d in decs]
+	else:
+		ranges = [list(r) for r in decades]
+	genres = [None] + (an.top_genres(df, n=top_genres)['genre'].tolist() if top_genres else [])
+	grid = []
+	for t in types:
+		for r in ranges:
+			for g in genres:
+				grid.append({
+					'type_value': None if t == 'ALL' else t,
+					'decades': r,
+					'genres': [g] if g else [],
+				})
+	return grid
+
+
+def slug(filters):
+	t = (filters.get('type_value') or 'all').lower()
+	d = '-'.join(filters['decades']) if filters.get('decades') else 'all-decades'
+	g = '+'.join(filters['genres']) if filters.get('genres') else 'all-genres'
+	return f'{t}_{d}_{g}'.replace(' ', '_')
+
+
+def figures_for(state, filters, names=None, template='plotly'):
+	"""{figure name: plotly figure} for one filter combination."""
+	from source import countries
+	from source import visuals as vz
+	names = names or FIGURES
+	df, index, cube = state['df'], state['index'], state['cube']
+	# each aggregation once; counts from the cube, row-level views from one filtered frame
+	data = {}
+	need = set(names)
+	if 'line_titles_per_decade' in need:
+		data['line_titles_per_decade'] = cube.titles_per_decade(**filters)
+	if 'bar_top_genres' in need:
+		data['bar_top_genres'] = cube.top_genres(n=10, **filters)
+	if need & {'bar_top_countries', 'choropleth_countries'}:
+		cc = cube.country_counts(**filters)
+		data['choropleth_countries'] = cc
+		data['bar_top_countries'] = cc.assign(label=countries.labels(cc['country']))
+	if need & {'hist_scores', 'line_best_imdb_each_year', 'bar_top_popular', 'scatter_imdb_vs_tmdb'}:
+		sub = an.filter_data(df, index=index, **filters)
+		data['hist_scores'] = sub[['imdb_score']].dropna()
+		data['line_best_imdb_each_year'] = an.best_imdb_each_year(sub)
+		data['bar_top_popular'] = an.top_popular(sub, n=20)
+		data['scatter_imdb_vs_tmdb'] = an.imdb_vs_tmdb(sub)
+	return {name: getattr(vz, name)(data[name], template=template) for name in names}
+
+
+def render_one(job):
+	"""Worker: build and write one combination's figures; returns a summary row."""
+	path, out_dir, filters, names, fmt, template = job
+	t = time.perf_counter()
+	state = _load(path)
+	figs = figures_for(state, filters, names, template)
+	name = slug(filters)
+	target = os.path.join(out_dir, f'{name}.{fmt}')
+	if fmt == 'html':
+		# plotly.js from the CDN once per page rather than inlined per figure
+		parts = [fig.to_html(full_html=False, include_plotlyjs='cdn' if i == 0 else False)
+				 for i, fig in enumerate(figs.values())]
+		with open(target, 'w', encoding='utf-8') as fh:
+			fh.write(f'<html><head><meta charset="utf-8"><title>{name}</title></head><body>\n<h1>{name}</h1>\n')
+			fh.write('\n'.join(parts))
+			fh.write('\n</body></html>\n')
+	else:
+		with open(target, 'w', encoding='utf-8') as fh:
+			fh.write('{' + ','.join(f'{json.dumps(k)}:{fig.to_json()}' for k, fig in figs.items()) + '}')
+	return {'slug': name, 'filters': filters, 'file': os.path.basename(target),
+			'figures': len(figs), 'seconds': time.perf_counter() - t}
+
+
+def _init_worker(path):
+	_load(path)
+
+
+def render_grid(path='data/cleaned.csv', out_dir='reports', grid=None, names=None, fmt='html',
+				template='plotly', workers=None, log=print):
+	"""Render every combination of grid; returns {'combinations', 'figures', 'seconds', 'figures_per_second'}.
+
+	The dataset is loaded once here; forked workers inherit it, others attach
+	to its shared memory-mapped columns in their initializer.
+	"""
+	if fmt not in ('html', 'json'):
+		raise ValueError(f"fmt must be 'html' or 'json', not {fmt!r}")
+	t = time.perf_counter()
+	state = _load(path)
+	grid = grid if grid is not None else build_grid(state['df'])
+	os.makedirs(out_dir, exist_ok=True)
+	jobs = [(path, out_dir, f, names, fmt, template) for f in grid]
+	workers = workers or os.cpu_count() or 1
+	if workers == 1 or len(jobs) <= 1:
+		rows = [render_one(job) for job in jobs]
+	else:
+		with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker, initargs=(path,)) as pool:
+			rows = list(pool.map(render_one, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+	seconds = time.perf_counter() - t
+	n_figs = sum(r['figures'] for r in rows)
+	summary = {
+		'combinations': len(rows), 'figures': n_figs, 'workers': workers, 'format': fmt,
+		'seconds': seconds, 'figures_per_second': n_figs / seconds if seconds else None,
+	}
+	with open(os.path.join(out_dir, 'index.json'), 'w', encoding='utf-8') as fh:
+		json.dump({'summary': summary, 'reports': rows}, fh, indent=1)
+	if fmt == 'html':
+		links = '\n'.join(f'<li><a href="{r["file"]}">{r["slug"]}</a></li>' for r in rows)
+		with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as fh:
+			fh.write(f'<html><head><meta charset="utf-8"><title>MovieMind reports</title></head><body><ul>\n{links}\n</ul></body></html>\n')
+	log(f"{len(rows)} combinations, {n_figs} figures in {seconds:.2f}s "
+		f"({summary['figures_per_second']:.1f} figures/s, {workers} workers) -> {out_dir}")
+	return summary
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--data', default='data/cleaned.csv')
+	parser.add_argument('--out', default='reports')
+	parser.add_argument('--format', choices=['html', 'json'], default='html')
+	parser.add_argument('--types', default='ALL,MOVIE,SHOW', help='comma-separated MOVIE, SHOW, ALL')
+	parser.add_argument('--decades', default='all',
+						help="'all' (no decade filter), 'each' (every single decade too) or ranges like 1990s-2010s,2000s-2020s")
+	parser.add_argument('--top-genres', type=int, default=5, help='one combination per top-N genre (plus none)')
+	parser.add_argument('--figures', default=None, help='comma-separated subset of ' + ', '.join(FIGURES))
+	parser.add_argument('--template', default='plotly')
+	parser.add_argument('--workers', type=int, default=None, help='process pool size (default: CPU count)')
+	args = parser.parse_args(argv)
+
+	decades = args.decades
+	if decades not in ('all', 'each'):
+		decades = [r.split('-', 1) for r in decades.split(',')]
+	names = args.figures.split(',') if args.figures else None
+	unknown = set(names or []) - set(FIGURES)
+	if unknown:
+		parser.error(f'unknown figures: {", ".join(sorted(unknown))}')
+	state = _load(args.data)
+	grid = build_grid(state['df'], args.types.split(','), decades, args.top_genres)
+	render_grid(args.data, args.out, grid, names, args.format, args.template, args.workers)
+
+
+if __name__ == '__main__':
+	sys.exit(main())
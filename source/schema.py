@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+# column -> compact dtype for the cleaned dataset. 'list' columns become a
+# categorical over the distinct list reprs: one small code per row, and the
+# distinct lists are parsed into a Ragged (offsets + values) on demand by
+# cleaning.parse_list_column, which only ever parses distinct cells.
+SCHEMA = {
+	'type': 'category',
+	'age_certification': 'category',
+	'primary_genre': 'category',
+	'decade': 'category',
+	'release_year': 'Int16',
+	'runtime': 'Int16',
+	'seasons': 'Int16',
+	'imdb_votes': 'Int32',
+	'imdb_score': 'float32',
+	'tmdb_score': 'float32',
+	'tmdb_popularity': 'float32',
+	'genres': 'list',
+	'production_countries': 'list',
+}
+
+
+def widen_float32(values):
+	"""float32 values as float64 rounded to float32's 7 significant digits.
+
+	Scores stored as float32 come back as the decimals they were written
+	with (7.4, 2274.044) rather than their binary approximations
+	(7.400000095367432) once widened: for JSON, hover labels and tables.
+	"""
+	values = np.asarray(values, dtype=np.float64)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		digits = 6 - np.floor(np.log10(np.abs(values)))
+	digits = np.where(np.isfinite(digits), digits, 0)
+	scale = 10.0 ** digits
+	return np.round(values * scale) / scale
+
+
+def widen_floats(df):
+	"""df with its float32 columns widened by widen_float32 (df itself if it has none)."""
+	cols = [c for c in df.columns if df[c].dtype == np.float32]
+	if not cols:
+		return df
+	return df.assign(**{c: widen_float32(df[c].to_numpy()) for c in cols})
+
+
+def _to_int(s, dtype):
+	# nullable narrow int, only if every value is integral and fits
+	vals = pd.to_numeric(s, errors='coerce')
+	info = np.iinfo(dtype.lower())
+	present = vals.dropna()
+	if len(present) and ((present % 1 != 0).any() or present.min() < info.min or present.max() > info.max):
+		return s
+	return vals.astype(dtype)
+
+
+def _to_list_category(s):
+	return s.map(lambda v: str(v) if isinstance(v, list) else v).astype('category')
+
+
+def compact(df, schema=None):
+	"""Return a copy of df with the schema's dtypes applied (unknown columns untouched)."""
+	schema = SCHEMA if schema is None else schema
+	out = df.copy()
+	for col, dtype in schema.items():
+		if col not in out.columns:
+			continue
+		if dtype == 'list':
+			out[col] = _to_list_category(out[col])
+		elif dtype.startswith('Int'):
+			out[col] = _to_int(out[col], dtype)
+		elif dtype == 'category':
+			out[col] = out[col].astype('category')
+		else:
+			out[col] = out[col].astype(dtype)
+	return out
+
+
+def memory_report(df, compacted=None):
+	"""Bytes per column before and after compact(), plus a total row."""
+	compacted = compact(df) if compacted is None else compacted
+	before = df.memory_usage(deep=True, index=False)
+	after = compacted.memory_usage(deep=True, index=False).reindex(before.index)
+	out = pd.DataFrame({
+		'dtype_before': df.dtypes.astype(str),
+		'dtype_after': compacted.dtypes.reindex(before.index).astype(str),
+		'bytes_before': before,
+		'bytes_after': after,
+	})
+	out.loc['total'] = ['', '', int(before.sum()), int(after.sum())]
+	out['ratio'] = out['bytes_after'] / out['bytes_before']
+	return out
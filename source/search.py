@@ -0,0 +1,225 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from source import instrument
+
+
+FORMAT_VERSION = 1
+# title words count this much more than description words
+FIELDS = {'title': 3.0, 'description': 1.0}
+# term-frequency saturation, as in BM25
+K1 = 1.2
+CHUNK_ROWS = 100_000
+_COMBINING = '[\u0300-\u036f]'
+_WORD = re.compile(r'\w+')
+
+
+def index_path(csv_path):
+	# data/cleaned.csv -> data/cleaned.search.npz
+	return os.path.splitext(csv_path)[0] + '.search.npz'
+
+
+def normalize(series):
+	# lower case, accents folded (é -> e), so 'pokemon' finds 'Pokémon'
+	s = series.astype(object).where(series.notna(), '').astype(str)
+	return s.str.normalize('NFKD').str.replace(_COMBINING, '', regex=True).str.lower()
+
+
+def tokenize(text):
+	return _WORD.findall(normalize(pd.Series([text])).iloc[0])
+
+
+def _pack_strings(values):
+	data = [v.encode('utf-8') for v in values]
+	offsets = np.zeros(len(data) + 1, dtype=np.int64)
+	np.cumsum([len(b) for b in data], out=offsets[1:])
+	return np.frombuffer(b''.join(data), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob, offsets):
+	raw = blob.tobytes()
+	return [raw[a:b].decode('utf-8') for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+class SearchIndex:
+	"""Inverted index over the words of title and description.
+
+	terms is the sorted vocabulary; the postings of terms[t] are
+	rows[offsets[t]:offsets[t + 1]] (row positions in the indexed frame,
+	ascending) with a BM25-style weight each (title words weighted up).
+	Sorted terms make prefix queries a binary search for a term range.
+	"""
+
+	def __init__(self, terms, offsets, rows, weights, ids, source=None):
+		self.terms = np.asarray(terms, dtype=str)
+		self.offsets = np.asarray(offsets, dtype=np.int64)
+		self.rows = np.asarray(rows, dtype=np.int32)
+		self.weights = np.asarray(weights, dtype=np.float32)
+		self.ids = np.asarray(ids, dtype=object)
+		self.source = source or {}
+		# idf per term from its document frequency
+		doc_freq = np.diff(self.offsets)
+		self.idf = np.log1p((len(self.ids) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+	def __len__(self):
+		return len(self.ids)
+
+	@classmethod
+	@instrument.timed
+	def build(cls, df, source=None, chunk_rows=CHUNK_ROWS):
+		n = len(df)
+		vocab = {}
+		keys, weights = [], []
+		# tokens are turned into (term code, row) int pairs chunk by chunk, so
+		# only one chunk's words exist as Python strings at a time
+		for start in range(0, n, chunk_rows):
+			stop = min(start + chunk_rows, n)
+			for field, boost in FIELDS.items():
+				if field not in df.columns:
+					continue
+				words = normalize(df[field].iloc[start:stop]).str.findall(_WORD)
+				counts = words.str.len().to_numpy()
+				flat = np.array([w for ws in words for w in ws], dtype=object)
+				if not len(flat):
+					continue
+				local, uniques = pd.factorize(flat)
+				to_global = np.array([vocab.setdefault(u, len(vocab)) for u in uniques], dtype=np.int64)
+				rows = np.repeat(np.arange(start, stop, dtype=np.int64), counts)
+				keys.append(to_global[local] * n + rows)
+				weights.append(np.full(len(flat), boost, dtype=np.float32))
+		if keys:
+			keys, weights = np.concatenate(keys), np.concatenate(weights)
+		else:
+			keys, weights = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+		# renumber terms in sorted order, then sort postings by (term, row)
+		terms = np.array(sorted(vocab), dtype=str)
+		rank = np.empty(len(vocab), dtype=np.int64)
+		rank[[vocab[t] for t in terms.tolist()]] = np.arange(len(vocab))
+		code, rows = np.divmod(keys, max(n, 1))
+		keys = rank[code] * n + rows
+		order = np.argsort(keys, kind='stable')
+		keys, weights = keys[order], weights[order]
+		# one posting per (term, row): summed field-weighted frequency, saturated
+		starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.zeros(0, dtype=np.int64)
+		tf = np.add.reduceat(weights, starts) if len(keys) else weights
+		keys = keys[starts]
+		code, rows = np.divmod(keys, max(n, 1))
+		offsets = np.searchsorted(code, np.arange(len(terms) + 1))
+		ids = df['id'].astype(str).to_numpy(dtype=object) if 'id' in df.columns else np.arange(n).astype(str).astype(object)
+		return cls(terms, offsets, rows, tf * (K1 + 1) / (tf + K1), ids, source)
+
+	def save(self, path):
+		terms_blob, terms_offsets = _pack_strings(self.terms.tolist())
+		ids_blob, ids_offsets = _pack_strings(self.ids.tolist())
+		meta = json.dumps({'format': FORMAT_VERSION, 'source': self.source})
+		tmp = path + '.tmp.npz'
+		np.savez(tmp, terms_blob=terms_blob, terms_offsets=terms_offsets, offsets=self.offsets, rows=self.rows,
+				 weights=self.weights, ids_blob=ids_blob, ids_offsets=ids_offsets, meta=np.array(meta))
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path):
+		with np.load(path, allow_pickle=False) as z:
+			meta = json.loads(str(z['meta']))
+			if meta.get('format') != FORMAT_VERSION:
+				raise ValueError('search index format changed')
+			return cls(_unpack_strings(z['terms_blob'], z['terms_offsets']), z['offsets'], z['rows'], z['weights'],
+					   _unpack_strings(z['ids_blob'], z['ids_offsets']), meta.get('source'))
+
+	def _term_range(self, word, prefix):
+		lo = int(np.searchsorted(self.terms, word, side='left'))
+		hi = int(np.searchsorted(self.terms, word + '\U0010ffff' if prefix else word, side='right'))
+		return lo, hi
+
+	def _postings(self, lo, hi):
+		# (rows ascending and unique, scores) of the terms in [lo, hi); a row
+		# matching several terms of a prefix gets their summed score
+		starts, ends = self.offsets[lo:hi], self.offsets[lo + 1:hi + 1]
+		lengths = ends - starts
+		idx = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) + np.arange(lengths.sum())
+		rows = self.rows[idx]
+		scores = self.weights[idx] * np.repeat(self.idf[lo:hi], lengths)
+		if hi - lo <= 1:
+			return rows, scores
+		if len(rows) > len(self) // 8:
+			# broad prefix: a dense bincount beats sorting the postings
+			sums = np.bincount(rows, weights=scores, minlength=len(self))
+			hit = np.flatnonzero(np.bincount(rows, minlength=len(self)))
+			return hit.astype(np.int32), sums[hit]
+		order = np.argsort(rows, kind='stable')
+		rows, scores = rows[order], scores[order]
+		first = np.flatnonzero(np.concatenate(([True], rows[1:] != rows[:-1])))
+		return rows[first], np.add.reduceat(scores, first)
+
+	@instrument.timed
+	def search(self, query, rows=None, limit=None):
+		"""Ranked (row positions, scores) of the rows matching every word of query.
+
+		The last word matches as a prefix (search as you type), and so does
+		any word ending in '*'. rows: optional boolean mask or positions of
+		the rows to search in (e.g. the current filters). Rows are ordered by
+		the summed word scores, best first, ties by position.
+		"""
+		words = re.findall(r'\w+\*?', normalize(pd.Series([query])).iloc[0])
+		if not words:
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+		hit, total = None, None
+		for i, w in enumerate(words):
+			prefix = w.endswith('*') or (i == len(words) - 1 and not query.rstrip('*').endswith((' ', '\t')))
+			r, s = self._postings(*self._term_range(w.rstrip('*'), prefix))
+			if hit is None:
+				hit, total = r, s.astype(np.float64)
+			else:
+				keep_old = np.isin(hit, r, assume_unique=True)
+				keep_new = np.isin(r, hit, assume_unique=True)
+				# both sorted by row, so the kept entries line up
+				hit, total = hit[keep_old], total[keep_old] + s[keep_new]
+			if not len(hit):
+				break
+		if rows is not None:
+			rows = np.asarray(rows)
+			if rows.dtype == bool:
+				keep = rows[hit]
+			else:
+				keep = np.isin(hit, rows)
+			hit, total = hit[keep], total[keep]
+		order = np.lexsort((hit, -total))
+		if limit is not None:
+			order = order[:limit]
+		return hit[order].astype(np.int64), total[order]
+
+	def search_ids(self, query, rows=None, limit=None):
+		positions, _ = self.search(query, rows, limit)
+		return self.ids[positions].tolist()
+
+
+def build_for(df, csv_path):
+	"""Build the index of a cleaned frame and save it next to its CSV."""
+	from source import colstore  # imports cleaning, which imports this module
+	idx = SearchIndex.build(df, source=colstore.source_fingerprint(csv_path, with_hash=False))
+	idx.save(index_path(csv_path))
+	return idx
+
+
+@instrument.timed
+def load_or_build(csv_path, df):
+	"""The saved index of csv_path if it still matches the file, else a rebuilt (and saved) one."""
+	from source import colstore  # imports cleaning, which imports this module
+	path = index_path(csv_path)
+	source = colstore.source_fingerprint(csv_path, with_hash=False)
+	try:
+		idx = SearchIndex.load(path)
+		if idx.source == source and len(idx) == len(df):
+			return idx
+	except Exception:
+		pass
+	idx = SearchIndex.build(df, source=source)
+	try:
+		idx.save(path)
+	except OSError:
+		pass
+	return idx
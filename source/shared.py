@@ -0,0 +1,212 @@
+"""The cleaned dataset as memory-mapped column files, shared by every process.
+
+A frame is published once per CSV version into data/.cache/<name>.shared/:
+
+- numeric columns: one .npy of values (nullable ints: values + mask)
+- categoricals: .npy codes plus the categories
+- strings: the Arrow layout, int64 offsets + one utf-8 byte blob + a
+  validity bitmap
+
+attach() maps the files read-only and wraps them in pandas arrays without
+copying, so the pages live once in the OS page cache however many Streamlit
+sessions, replicas or worker processes read them. A frame attached this way
+must not be written to; take rows (df.iloc / analysis.filter_rows) instead.
+Publishing and attaching need pyarrow; importing this module does not.
+"""
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+FORMAT_VERSION = 1
+# nullable dtypes -> the pandas array wrapping (values, mask) without a copy
+MASKED = {
+	**{name: pd.arrays.IntegerArray for name in ['Int8', 'Int16', 'Int32', 'Int64', 'UInt8', 'UInt16', 'UInt32', 'UInt64']},
+	'Float32': pd.arrays.FloatingArray, 'Float64': pd.arrays.FloatingArray, 'boolean': pd.arrays.BooleanArray,
+}
+
+# attached frames of this process, by version directory (the current one per shared directory)
+_ATTACHED = {}
+_lock = threading.Lock()
+
+
+def shared_dir_for(path):
+	# data/cleaned.csv -> data/.cache/cleaned.shared
+	base = os.path.splitext(os.path.basename(path))[0]
+	return os.path.join(os.path.dirname(os.path.abspath(path)), '.cache', base + '.shared')
+
+
+def _pyarrow():
+	# pyarrow is only needed for shared frames (the Arrow string layout), not to import this module
+	try:
+		import pyarrow
+	except ImportError:
+		raise ImportError('load_cleaned(shared=True) needs pyarrow: pip install pyarrow') from None
+	return pyarrow
+
+
+def _string_dtype():
+	_pyarrow()
+	return pd.StringDtype('pyarrow', na_value=np.nan)
+
+
+def _save(directory, name, arr):
+	np.save(os.path.join(directory, name + '.npy'), arr, allow_pickle=False)
+
+
+def _map(directory, name):
+	path = os.path.join(directory, name + '.npy')
+	try:
+		# a plain ndarray view of the map (pandas would keep the memmap subclass)
+		return np.asarray(np.load(path, mmap_mode='r', allow_pickle=False))
+	except ValueError:
+		# zero-length arrays cannot be mapped
+		return np.load(path, allow_pickle=False)
+
+
+def _write_strings(directory, name, values):
+	pa = _pyarrow()
+	arr = pa.array(np.asarray(values, dtype=object), type=pa.large_string(), from_pandas=True)
+	validity, offsets, data = arr.buffers()
+	n = len(arr)
+	if arr.null_count:
+		_save(directory, name + '.valid', np.frombuffer(validity, dtype=np.uint8)[:(n + 7) // 8])
+	offsets = np.frombuffer(offsets, dtype=np.int64)[:n + 1]
+	_save(directory, name + '.offsets', offsets)
+	_save(directory, name + '.data', np.frombuffer(data, dtype=np.uint8)[:offsets[-1]] if data is not None else np.zeros(0, dtype=np.uint8))
+	return {'n': n, 'nulls': arr.null_count}
+
+
+def _read_strings(directory, name, spec):
+	pa = _pyarrow()
+	valid = pa.py_buffer(_map(directory, name + '.valid')) if spec['nulls'] else None
+	buffers = [valid, pa.py_buffer(_map(directory, name + '.offsets')), pa.py_buffer(_map(directory, name + '.data'))]
+	arr = pa.Array.from_buffers(pa.large_string(), spec['n'], buffers, null_count=spec['nulls'])
+	return pd.arrays.ArrowStringArray(pa.chunked_array([arr], type=pa.large_string()), dtype=_string_dtype())
+
+
+def _write_column(directory, name, series):
+	dtype = series.dtype
+	if isinstance(dtype, pd.CategoricalDtype):
+		cats = dtype.categories
+		spec = {'name': name, 'kind': 'category', 'ordered': bool(dtype.ordered), 'codes': str(series.cat.codes.dtype)}
+		_save(directory, name + '.codes', series.cat.codes.to_numpy())
+		if pd.api.types.is_numeric_dtype(cats.dtype):
+			_save(directory, name + '.categories', cats.to_numpy())
+			spec['categories'] = None
+		else:
+			spec['categories'] = _write_strings(directory, name + '.categories', cats.astype(object))
+		return spec
+	if str(dtype) in MASKED:
+		# nullable Int16 / Int32 / boolean ...: values (0 where missing) + mask
+		_save(directory, name, series.to_numpy(dtype=dtype.numpy_dtype, na_value=0))
+		_save(directory, name + '.mask', series.isna().to_numpy())
+		return {'name': name, 'kind': 'masked', 'dtype': str(dtype)}
+	if isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+		_save(directory, name, series.to_numpy())
+		return {'name': name, 'kind': 'num', 'dtype': str(dtype)}
+	# strings (and anything else, as its str form)
+	spec = _write_strings(directory, name, series.astype(object).where(series.notna(), None))
+	return {'name': name, 'kind': 'str', 'values': spec}
+
+
+def _read_column(directory, col):
+	name = col['name']
+	if col['kind'] == 'num':
+		return _map(directory, name)
+	if col['kind'] == 'masked':
+		data, mask = _map(directory, name), _map(directory, name + '.mask')
+		return MASKED[col['dtype']](data, mask)
+	if col['kind'] == 'category':
+		if col['categories'] is None:
+			cats = pd.Index(_map(directory, name + '.categories'))
+		else:
+			# categories are few: decoded, not mapped
+			cats = pd.Index(np.asarray(_read_strings(directory, name + '.categories', col['categories']), dtype=object), dtype=_string_dtype())
+		return pd.Categorical.from_codes(_map(directory, name + '.codes'), dtype=pd.CategoricalDtype(cats, col['ordered']))
+	return _read_strings(directory, name, col['values'])
+
+
+def publish(df, directory, source=None):
+	"""Write df as mapped column files under directory and make it the current version.
+
+	Returns the version directory. Safe to run from several processes at
+	once: each writes to a private temporary directory and the first to
+	finish wins; attached readers of older versions keep their mappings.
+	"""
+	if not (isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1):
+		raise ValueError('publish needs a frame with a default RangeIndex')
+	source = source or {}
+	version = f"{source.get('size', 0)}-{source.get('mtime_ns', 0)}-v{FORMAT_VERSION}"
+	final = os.path.join(directory, version)
+	if not os.path.exists(os.path.join(final, 'meta.json')):
+		tmp = f'{final}.tmp-{os.getpid()}-{threading.get_ident()}'
+		os.makedirs(tmp, exist_ok=True)
+		cols = [_write_column(tmp, name, df[name]) for name in df.columns]
+		meta = {'format': FORMAT_VERSION, 'rows': int(len(df)), 'columns': cols, 'source': source}
+		with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as fh:
+			json.dump(meta, fh)
+		try:
+			os.rename(tmp, final)
+		except OSError:
+			# another process published the same version first
+			shutil.rmtree(tmp, ignore_errors=True)
+	pointer = os.path.join(directory, 'CURRENT')
+	with open(pointer + f'.tmp-{os.getpid()}', 'w', encoding='utf-8') as fh:
+		fh.write(version)
+	os.replace(pointer + f'.tmp-{os.getpid()}', pointer)
+	# older versions: unlinking mapped files is fine on POSIX, skipped elsewhere
+	for name in os.listdir(directory):
+		if name not in (version, 'CURRENT') and not name.startswith(('CURRENT.', version + '.')):
+			shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+	return final
+
+
+def current(directory):
+	"""(version directory, meta) of the published frame under directory, or None."""
+	try:
+		with open(os.path.join(directory, 'CURRENT'), 'r', encoding='utf-8') as fh:
+			version = os.path.join(directory, fh.read().strip())
+		with open(os.path.join(version, 'meta.json'), 'r', encoding='utf-8') as fh:
+			meta = json.load(fh)
+	except (OSError, ValueError):
+		return None
+	if meta.get('format') != FORMAT_VERSION:
+		return None
+	return version, meta
+
+
+def attach(version, meta=None):
+	"""The frame published in a version directory, mapped read-only (once per process)."""
+	with _lock:
+		df = _ATTACHED.get(version)
+		if df is None:
+			if meta is None:
+				with open(os.path.join(version, 'meta.json'), 'r', encoding='utf-8') as fh:
+					meta = json.load(fh)
+			data = {col['name']: _read_column(version, col) for col in meta['columns']}
+			df = pd.DataFrame(data, columns=[c['name'] for c in meta['columns']], copy=False)
+			df.attrs['shared'] = {'version': version, 'rows': meta['rows'], 'bytes': mapped_bytes(version)}
+			# older versions of the same data are released here; their pages are
+			# unmapped once the frames still held by callers go away
+			parent = os.path.dirname(version)
+			for old in [v for v in _ATTACHED if os.path.dirname(v) == parent]:
+				del _ATTACHED[old]
+			_ATTACHED[version] = df
+		return df
+
+
+def attach_current(directory, source=None):
+	"""The current frame under directory if it was published from source, else None."""
+	found = current(directory)
+	if found is None or (source is not None and found[1].get('source') != source):
+		return None
+	return attach(*found)
+
+
+def mapped_bytes(version):
+	return sum(e.stat().st_size for e in os.scandir(version) if e.name.endswith('.npy'))
@@ -0,0 +1,251 @@
+"""Precomputed "titles like this one" neighbours.
+
+	python -m source.similar data/cleaned.csv --k 10
+
+Each title becomes one vector of weighted blocks: its description's TF-IDF
+(randomly projected to TEXT_DIMS dimensions), multi-hot genres and
+production countries, and release year and IMDb score as angles. Blocks
+are unit length and scaled by sqrt(weight), so the dot product of two titles
+is the weighted sum of their per-block cosine similarities. The k nearest
+titles of every title are found once, by blocked brute force, and saved
+next to the CSV; a lookup is then one row of an array.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from source import colstore
+from source import instrument
+from source import search
+from source.multihot import MultiHotIndex
+
+
+FORMAT_VERSION = 1
+K = 10
+# share of each block in the similarity (they sum to 1)
+WEIGHTS = {'description': 0.5, 'genres': 0.25, 'production_countries': 0.1, 'release_year': 0.1, 'imdb_score': 0.05}
+# dimensions of the projected description TF-IDF
+TEXT_DIMS = 128
+# similarity block held in memory while searching (rows x all rows, float32)
+BLOCK_BYTES = 128 << 20
+# the all-pairs search grows with rows^2 (~10 s at 20K rows, minutes at 100K):
+# built when cleaning or on demand up to this size, beyond it by this module's CLI
+BUILD_MAX_ROWS = 20_000
+
+
+def index_path(csv_path):
+	# data/cleaned.csv -> data/cleaned.similar.npz
+	return os.path.splitext(csv_path)[0] + '.similar.npz'
+
+
+def _unit(x):
+	norms = np.sqrt(np.einsum('ij,ij->i', x, x))
+	norms[norms == 0] = 1
+	x /= norms[:, None]
+	return x
+
+
+def _text_block(df, dims, seed):
+	# TF-IDF of the description words (the search index's saturated tf x idf),
+	# times a random Gaussian term x dims matrix: cosines are kept up to
+	# ~1/sqrt(dims) noise without a vocabulary-wide sparse matrix
+	out = np.zeros((len(df), dims), dtype=np.float32)
+	if 'description' not in df.columns or not len(df):
+		return out
+	idx = search.SearchIndex.build(df[['description']])
+	lengths = np.diff(idx.offsets)
+	terms = np.repeat(np.arange(len(idx.terms)), lengths)
+	values = idx.weights * idx.idf[terms]
+	order = np.argsort(idx.rows, kind='stable')
+	rows, terms, values = idx.rows[order], terms[order], values[order]
+	proj = np.random.default_rng(seed).standard_normal((len(idx.terms), dims), dtype=np.float32)
+	# postings in chunks that end on a row boundary: sum each row's projected terms
+	step = max(1, (16 << 20) // (dims * 4))
+	start = 0
+	while start < len(rows):
+		stop = min(start + step, len(rows))
+		while stop < len(rows) and rows[stop] == rows[stop - 1]:
+			stop += 1
+		r = rows[start:stop]
+		first = np.flatnonzero(np.concatenate(([True], r[1:] != r[:-1])))
+		out[r[first]] = np.add.reduceat(proj[terms[start:stop]] * values[start:stop, None], first)
+		start = stop
+	return _unit(out)
+
+
+def _list_block(df, col, index=None):
+	mh = index.get(col) if index else None
+	if mh is None or len(mh) != len(df):
+		mh = MultiHotIndex.build(df, col)
+	return _unit(mh.dense(np.float32))
+
+
+def _angle_block(values):
+	# a number scaled to [0, 1] as a point on a quarter circle: the dot product
+	# of two points is cos of their distance (1 equal, 0 at the extremes), and a
+	# missing value is the zero vector
+	v = np.asarray(values, dtype=float)
+	lo, hi = np.nanmin(v) if np.isfinite(v).any() else 0, np.nanmax(v) if np.isfinite(v).any() else 1
+	t = (v - lo) / (hi - lo if hi > lo else 1) * (np.pi / 2)
+	out = np.stack([np.cos(t), np.sin(t)], axis=1).astype(np.float32)
+	out[~np.isfinite(v)] = 0
+	return out
+
+
+@instrument.timed
+def features(df, index=None, weights=None, dims=TEXT_DIMS, seed=0):
+	"""Title vectors (rows x dims, float32); see the module docstring.
+
+	index: the multi-hot indexes from analysis.build_list_indexes, reused
+	for genres / production_countries when given. Columns the frame lacks
+	are left out.
+	"""
+	weights = weights or WEIGHTS
+	blocks = []
+	for col, w in weights.items():
+		if not w or col not in df.columns:
+			continue
+		if col == 'description':
+			block = _text_block(df, dims, seed)
+		elif col in ('genres', 'production_countries'):
+			block = _list_block(df, col, index)
+		else:
+			block = _angle_block(df[col].to_numpy(dtype=float, na_value=np.nan))
+		blocks.append(block * np.float32(np.sqrt(w)))
+	if not blocks:
+		return np.zeros((len(df), 0), dtype=np.float32)
+	return np.ascontiguousarray(np.concatenate(blocks, axis=1))
+
+
+@instrument.timed
+def nearest(vectors, k=K, block_bytes=BLOCK_BYTES, group=256):
+	"""(neighbours, scores): the k most similar other rows of every row.
+
+	Both are rows x k, best first, ties by position; rows with fewer than k
+	others are padded with -1 / nan. Exact: every pair is scored, a block of
+	rows at a time so memory stays at block_bytes plus the vectors.
+	"""
+	n = len(vectors)
+	k = max(0, min(k, n - 1))
+	neighbours = np.full((n, k), -1, dtype=np.int32)
+	scores = np.full((n, k), np.nan, dtype=np.float32)
+	if not k:
+		return neighbours, scores
+	step = max(1, block_bytes // (n * 4))
+	whole = n // group * group
+	for a in range(0, n, step):
+		b = min(a + step, n)
+		sims = vectors[a:b] @ vectors.T
+		sims[np.arange(b - a), np.arange(a, b)] = -np.inf
+		if whole // group >= k:
+			# the k-th best of the per-group maxima is a lower bound of the k-th
+			# best score, and only a handful of scores reach it: cheaper than
+			# partitioning every row
+			tops = sims[:, :whole].reshape(b - a, -1, group).max(axis=2)
+			kth = np.partition(tops, tops.shape[1] - k, axis=1)[:, tops.shape[1] - k]
+			rows, cols = np.nonzero(sims >= kth[:, None])
+		else:
+			rows, cols = np.nonzero(sims > -np.inf)
+		vals = sims[rows, cols]
+		order = np.lexsort((cols, -vals, rows))
+		rows, cols, vals = rows[order], cols[order], vals[order]
+		rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+		keep = rank < k
+		neighbours[a + rows[keep], rank[keep]] = cols[keep]
+		scores[a + rows[keep], rank[keep]] = vals[keep]
+	return neighbours, scores
+
+
+class SimilarIndex:
+	"""The k nearest titles of every row of a frame, by row position."""
+
+	def __init__(self, neighbours, scores, source=None):
+		self.neighbours = np.asarray(neighbours, dtype=np.int32)
+		self.scores = np.asarray(scores, dtype=np.float32)
+		self.source = source or {}
+
+	def __len__(self):
+		return len(self.neighbours)
+
+	@property
+	def k(self):
+		return self.neighbours.shape[1]
+
+	@classmethod
+	@instrument.timed
+	def build(cls, df, k=K, index=None, source=None, **feature_args):
+		return cls(*nearest(features(df, index, **feature_args), k), source)
+
+	def of(self, position, k=None):
+		"""(positions, scores) of the titles most like the one at position, best first."""
+		nb, sc = self.neighbours[position, :k], self.scores[position, :k]
+		keep = nb >= 0
+		return nb[keep].astype(np.int64), sc[keep]
+
+	def save(self, path):
+		tmp = path + '.tmp.npz'
+		meta = json.dumps({'format': FORMAT_VERSION, 'source': self.source})
+		np.savez(tmp, neighbours=self.neighbours, scores=self.scores.astype(np.float16), meta=np.array(meta))
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path):
+		with np.load(path, allow_pickle=False) as z:
+			meta = json.loads(str(z['meta']))
+			if meta.get('format') != FORMAT_VERSION:
+				raise ValueError('similar index format changed')
+			return cls(z['neighbours'], z['scores'], meta.get('source'))
+
+
+def build_for(df, csv_path, k=K, index=None):
+	"""Build the neighbours of a cleaned frame and save them next to its CSV."""
+	idx = SimilarIndex.build(df, k, index, source=colstore.source_fingerprint(csv_path, with_hash=False))
+	idx.save(index_path(csv_path))
+	return idx
+
+
+def load_for(csv_path, df, k=K):
+	"""The saved neighbours of csv_path if they still match the file, else None."""
+	try:
+		idx = SimilarIndex.load(index_path(csv_path))
+	except Exception:
+		return None
+	if idx.source == colstore.source_fingerprint(csv_path, with_hash=False) and len(idx) == len(df) and idx.k >= min(k, len(df) - 1):
+		return idx
+	return None
+
+
+@instrument.timed
+def load_or_build(csv_path, df, k=K, index=None):
+	"""The saved neighbours of csv_path if they still match the file, else rebuilt (and saved) ones."""
+	path = index_path(csv_path)
+	idx = load_for(csv_path, df, k)
+	if idx is not None:
+		return idx
+	idx = SimilarIndex.build(df, k, index, source=colstore.source_fingerprint(csv_path, with_hash=False))
+	try:
+		idx.save(path)
+	except OSError:
+		pass
+	return idx
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('data', nargs='?', default='data/cleaned.csv')
+	parser.add_argument('--k', type=int, default=K)
+	args = parser.parse_args(argv)
+
+	from source import analysis as an
+	t = time.perf_counter()
+	df = an.load_cleaned(args.data, compact=True)
+	idx = build_for(df, args.data, args.k, an.build_list_indexes(df))
+	print(f'{len(idx)} titles x {idx.k} neighbours in {time.perf_counter() - t:.2f}s -> {index_path(args.data)}')
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from source import instrument
+from source.cleaning import parse_list_column
+
+
+LIST_COLUMNS = ['genres', 'production_countries']
+
+
+def _select(values, positions, k):
+	"""Positions of the k best values, in (value desc, position asc) order.
+
+	np.partition finds the k-th best value; every entry at least that good
+	is a candidate (so ties at the cut are all considered), and only the
+	candidates are sorted. Same result as a stable descending sort + head(k).
+	"""
+	if len(values) > k:
+		kth = np.partition(values, len(values) - k)[len(values) - k]
+		keep = values >= kth
+		values, positions = values[keep], positions[keep]
+	order = np.lexsort((positions, -values))[:k]
+	return positions[order]
+
+
+def _groups(df, by, index=None):
+	# (row positions, group codes, group labels), one entry per row and group item;
+	# list columns come from the parsed entries, without exploding the frame
+	if by in LIST_COLUMNS:
+		if index and by in index:
+			mh = index[by]
+			inv = np.full(len(mh), -1, dtype=np.int64)
+			inv[mh.positions(df.index)] = np.arange(len(df))
+			rows = inv[mh.entry_rows]
+			keep = rows >= 0
+			rows, codes, labels = rows[keep], mh.entry_codes[keep].astype(np.int64), mh.labels
+		else:
+			parsed = parse_list_column(df[by])
+			rows = parsed.row_ids()
+			codes, labels = pd.factorize(parsed.values.astype(str), sort=True)
+			labels = np.asarray(labels, dtype=object)
+		return rows, codes, labels
+	codes, labels = pd.factorize(df[by], sort=True)
+	rows = np.flatnonzero(codes >= 0)
+	return rows, codes[rows].astype(np.int64), np.asarray(labels, dtype=object)
+
+
+@instrument.timed
+def top_k(df, score_col, k=10, by=None, min_votes=None, votes_col='imdb_votes', index=None, columns=None):
+	"""The k highest score_col rows overall or per group of by.
+
+	by: None, a scalar column (release_year, decade, type, ...) or a list
+	column (genres, production_countries; a title counts in each of its
+	groups). Rows without a score, and with min_votes rows with fewer than
+	min_votes votes (or none), are left out. index: the multi-hot indexes
+	from analysis.build_list_indexes, used for list columns when given.
+
+	Returns df's rows (original index labels) with a rank column (1 = best)
+	and, for by, a group column named by. Groups are in sorted order, rows
+	within a group by score descending, ties in frame order: exactly
+	sort_values(score_col, ascending=False, kind='stable') + head(k) per
+	group (on the exploded, per-row-deduplicated frame for list columns).
+	"""
+	columns = list(columns) if columns is not None else [c for c in ['title', 'release_year', score_col] if c in df.columns]
+	if score_col not in df.columns or k <= 0:
+		return pd.DataFrame(columns=([by] if by else []) + columns + ['rank'])
+	values = pd.to_numeric(df[score_col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+	ok = ~np.isnan(values)
+	if min_votes is not None:
+		votes = pd.to_numeric(df[votes_col], errors='coerce').to_numpy(dtype=float, na_value=np.nan) if votes_col in df.columns else np.full(len(df), np.nan)
+		ok &= votes >= min_votes
+
+	if by is None:
+		pos = np.flatnonzero(ok)
+		picked = _select(values[pos], pos, k)
+		out = df.iloc[picked][columns].copy()
+		out['rank'] = np.arange(1, len(picked) + 1)
+		return out
+
+	rows, codes, labels = _groups(df, by, index)
+	keep = ok[rows]
+	# one sort of (group, row) keys groups the entries and drops an item listed
+	# twice in one row, so a title ranks once per group
+	key = np.sort(codes[keep] * max(len(df), 1) + rows[keep])
+	key = key[np.concatenate(([True], key[1:] != key[:-1]))] if len(key) else key
+	codes, rows = np.divmod(key, max(len(df), 1))
+	bounds = np.flatnonzero(np.diff(codes)) + 1
+	starts = np.concatenate(([0], bounds))
+	ends = np.concatenate((bounds, [len(codes)]))
+	picked, group, rank = [], [], []
+	for a, b in zip(starts.tolist(), ends.tolist()):
+		if a == b:
+			continue
+		sel = _select(values[rows[a:b]], rows[a:b], k)
+		picked.append(sel)
+		group.append(np.full(len(sel), codes[a]))
+		rank.append(np.arange(1, len(sel) + 1))
+	if not picked:
+		return pd.DataFrame(columns=[by] + columns + ['rank'])
+	picked = np.concatenate(picked)
+	out = df.iloc[picked][[c for c in columns if c != by]].copy()
+	out.insert(0, by, labels[np.concatenate(group)] if by in LIST_COLUMNS else df[by].to_numpy()[picked])
+	out['rank'] = np.concatenate(rank)
+	return out
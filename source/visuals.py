@@ -1,9 +1,144 @@
+import functools
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+
 import plotly.express as px
 import plotly.graph_objects as go
-import pycountry
 import numpy as np
+import pandas as pd
+
+from source import countries
+from source import instrument
+from source import schema
+
+
+class FigureCache:
+	"""Thread-safe LRU of built figures, bounded by entry count and approximate bytes.
+
+	Keys are (builder, content hash of the input frame, options), so a builder
+	called again with equal data and options returns the figure it built
+	before. Cached figures are shared between callers; treat them as
+	read-only (st.plotly_chart serialises a copy and does not modify them).
+	"""
+
+	def __init__(self, maxsize=128, max_bytes=64 << 20):
+		self.maxsize = maxsize
+		self.max_bytes = max_bytes
+		self.bytes = 0
+		self.hits = self.misses = self.evictions = 0
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get_or_build(self, key, build):
+		with self._lock:
+			if key in self._data:
+				self._data.move_to_end(key)
+				self.hits += 1
+				return self._data[key][0]
+			self.misses += 1
+		fig = build()
+		size = figure_bytes(fig)
+		with self._lock:
+			if key not in self._data and size <= self.max_bytes:
+				self._data[key] = (fig, size)
+				self.bytes += size
+				while len(self._data) > self.maxsize or self.bytes > self.max_bytes:
+					_, (_, dropped) = self._data.popitem(last=False)
+					self.bytes -= dropped
+					self.evictions += 1
+		return fig
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+			self.bytes = 0
+
+	def stats(self):
+		with self._lock:
+			return {
+				'size': len(self._data), 'maxsize': self.maxsize, 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+				'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+			}
+
+
+FIGURES = FigureCache()
+
+# point counts above which the large-N paths kick in: hist_scores bins on the
+# server, scatter_imdb_vs_tmdb switches to WebGL and then to a density heatmap
+BIN_THRESHOLD = 20_000
+WEBGL_THRESHOLD = 5_000
+DENSITY_THRESHOLD = 100_000
+
+
+def scatter_mode(n_points):
+	if n_points > DENSITY_THRESHOLD:
+		return 'density'
+	return 'webgl' if n_points > WEBGL_THRESHOLD else 'svg'
+
 
+def payload_bytes(fig):
+	# size of the JSON spec sent to the browser
+	import plotly.io as pio
+	return len(pio.to_json(fig, validate=False))
 
+
+def figure_bytes(fig):
+	# rough payload size: array data of the traces plus a fixed allowance per trace
+	total = 0
+	for trace in fig.data:
+		for v in trace.to_plotly_json().values():
+			if isinstance(v, np.ndarray):
+				total += v.nbytes if v.dtype != object else 16 * v.size
+			elif isinstance(v, (list, tuple)):
+				total += 16 * len(v)
+		total += 1024
+	return total + 4096
+
+
+def frame_digest(df, columns=None):
+	"""sha1 of a frame's (selected) columns, dtypes, index and values."""
+	if columns is not None:
+		df = df[[c for c in columns if c in df.columns]]
+	h = hashlib.sha1(repr((list(df.columns), [str(t) for t in df.dtypes], len(df))).encode())
+	try:
+		values = pd.util.hash_pandas_object(df, index=True).to_numpy()
+	except TypeError:
+		# unhashable cells (e.g. lists): hash their text form
+		values = pd.util.hash_pandas_object(df.astype(str), index=True).to_numpy()
+	h.update(values.tobytes())
+	return h.hexdigest()
+
+
+def cached_figure(columns=None, column_args=(), cache=None):
+	"""Memoize a figure builder in FIGURES on its input's content and its options.
+
+	columns limits the hash to the columns the builder reads (plus the
+	columns named by column_args, e.g. score_col); None hashes every column.
+	The builder sees float32 columns widened by schema.widen_floats.
+	"""
+	def decorate(fn):
+		sig = inspect.signature(fn)
+
+		@functools.wraps(fn)
+		def wrapper(df, *args, **kwargs):
+			bound = sig.bind(df, *args, **kwargs)
+			bound.apply_defaults()
+			# repr keeps the key hashable for list-valued options (e.g. a custom colour scale)
+			options = repr(list(bound.arguments.items())[1:])
+			used = None
+			if columns is not None:
+				used = list(columns) + [bound.arguments[a] for a in column_args if bound.arguments.get(a)]
+			key = (fn.__name__, frame_digest(df, used), options)
+			# float32 scores are widened for the build so hover labels read 7.4, not 7.4000000954
+			return (cache or FIGURES).get_or_build(key, lambda: fn(schema.widen_floats(df), *args, **kwargs))
+		return wrapper
+	return decorate
+
+
+@instrument.timed
+@cached_figure(columns=('genre', 'count'))
 def bar_top_genres(df, template='plotly'):
 	if df.empty:
 		return px.bar(title='Top Genres (no data)')
@@ -12,6 +147,8 @@ def bar_top_genres(df, template='plotly'):
 	return fig
 
 
+@instrument.timed
+@cached_figure(columns=('decade', 'count'))
 def line_titles_per_decade(df, template='plotly'):
 	if df.empty:
 		return px.line(title='Titles per Decade (no data)')
@@ -20,14 +157,33 @@ def line_titles_per_decade(df, template='plotly'):
 	return fig
 
 
-def hist_scores(df, score_col='imdb_score', template='plotly'):
+@instrument.timed
+@cached_figure(columns=(), column_args=('score_col',))
+def hist_scores(df, score_col='imdb_score', template='plotly', max_points=None, nbins=30):
+	# above max_points (default BIN_THRESHOLD) the scores are binned here with
+	# numpy and only the bin edges and counts are sent, not one value per title
 	if df.empty:
 		return px.histogram(title=f'{score_col} Distribution (no data)')
-	fig = px.histogram(df, x=score_col, nbins=30, title=f'{score_col} Distribution')
-	fig.update_layout(template=template)
+	max_points = BIN_THRESHOLD if max_points is None else max_points
+	if len(df) <= max_points:
+		fig = px.histogram(df, x=score_col, nbins=nbins, title=f'{score_col} Distribution')
+		fig.update_layout(template=template)
+		return fig
+	values = pd.to_numeric(df[score_col], errors='coerce').to_numpy(dtype=float)
+	values = values[~np.isnan(values)]
+	counts, edges = np.histogram(values, bins=nbins)
+	fig = go.Figure(go.Bar(
+		x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+		customdata=np.stack([edges[:-1], edges[1:]], axis=1),
+		hovertemplate='%{customdata[0]:.2f} – %{customdata[1]:.2f}: %{y}<extra></extra>',
+	))
+	fig.update_layout(template=template, title=f'{score_col} Distribution', bargap=0,
+					  xaxis_title=score_col, yaxis_title='count')
 	return fig
 
 
+@instrument.timed
+@cached_figure(columns=('country', 'label', 'count'))
 def bar_top_countries(df, template='plotly'):
 	if df.empty:
 		return px.bar(title='Top Production Countries (no data)')
@@ -37,6 +193,8 @@ def bar_top_countries(df, template='plotly'):
 	return fig
 
 
+@instrument.timed
+@cached_figure(columns=('title', 'tmdb_popularity', 'release_year'))
 def bar_top_popular(df, template='plotly'):
 	if df.empty:
 		return px.bar(title='Top Popular Titles (no data)')
@@ -45,6 +203,8 @@ def bar_top_popular(df, template='plotly'):
 	return fig
 
 
+@instrument.timed
+@cached_figure(columns=('release_year', 'imdb_score'))
 def line_best_imdb_each_year(df, template='plotly'):
 	if df.empty:
 		return px.line(title='Best IMDb Each Year (no data)')
@@ -54,33 +214,47 @@ def line_best_imdb_each_year(df, template='plotly'):
 	return fig
 
 
-def scatter_imdb_vs_tmdb(df, color_by='type', template='plotly'):
+@instrument.timed
+@cached_figure(columns=('imdb_score', 'tmdb_score'), column_args=('color_by',))
+def scatter_imdb_vs_tmdb(df, color_by='type', template='plotly', mode='auto', bins=100):
+	# mode: 'svg' (one SVG marker per title), 'webgl' (Scattergl, same points),
+	# 'density' (2D counts binned here, sent as a heatmap) or 'auto', which
+	# picks svg / webgl / density by the number of points (WEBGL_THRESHOLD,
+	# DENSITY_THRESHOLD)
 	if df.empty:
 		return px.scatter(title='IMDb vs TMDB (no data)')
 	cols = ['imdb_score', 'tmdb_score']
 	for c in cols:
 		if c not in df.columns:
 			return px.scatter(title='IMDb vs TMDB (missing columns)')
+	data = df.dropna(subset=cols)
+	mode = scatter_mode(len(data)) if mode == 'auto' else mode
+	if mode == 'density':
+		x = data['imdb_score'].to_numpy(dtype=float)
+		y = data['tmdb_score'].to_numpy(dtype=float)
+		counts, xe, ye = np.histogram2d(x, y, bins=bins, range=[[0, 10], [0, 10]])
+		# empty cells transparent
+		z = np.where(counts.T > 0, counts.T, np.nan)
+		fig = go.Figure(go.Heatmap(
+			x=(xe[:-1] + xe[1:]) / 2, y=(ye[:-1] + ye[1:]) / 2, z=z, colorscale='Viridis',
+			colorbar_title='titles', hovertemplate='IMDb %{x:.1f}, TMDB %{y:.1f}: %{z}<extra></extra>',
+		))
+		fig.update_layout(template=template, title=f'IMDb vs TMDB (density of {len(data):,} titles)',
+						  xaxis_title='imdb_score', yaxis_title='tmdb_score')
+		return fig
+	render_mode = 'webgl' if mode == 'webgl' else 'svg'
 	if color_by in df.columns:
-		fig = px.scatter(df.dropna(subset=cols), x='imdb_score', y='tmdb_score', color=color_by,
-						 title='IMDb vs TMDB', opacity=0.7)
+		fig = px.scatter(data, x='imdb_score', y='tmdb_score', color=color_by,
+						 title='IMDb vs TMDB', opacity=0.7, render_mode=render_mode)
 	else:
-		fig = px.scatter(df.dropna(subset=cols), x='imdb_score', y='tmdb_score',
-						 title='IMDb vs TMDB', opacity=0.7)
+		fig = px.scatter(data, x='imdb_score', y='tmdb_score',
+						 title='IMDb vs TMDB', opacity=0.7, render_mode=render_mode)
 	fig.update_layout(template=template)
 	return fig
 
 
-def _iso2_to_iso3(code):
-	try:
-		if not isinstance(code, str) or len(code) == 0:
-			return None
-		c = pycountry.countries.get(alpha_2=code.upper())
-		return c.alpha_3 if c else None
-	except Exception:
-		return None
-
-
+@instrument.timed
+@cached_figure(columns=('country', 'count'))
 def choropleth_countries(df_counts, template='plotly', height=720, color_scale='portland', scale_mode='log'):
 	# expects columns: country (ISO2 or name), count
 	if df_counts.empty:
@@ -88,24 +262,9 @@ def choropleth_countries(df_counts, template='plotly', height=720, color_scale='
 	if 'country' not in df_counts.columns or 'count' not in df_counts.columns:
 		return go.Figure()
 
-	# Map ISO2 -> ISO3 when possible
-	iso3 = []
-	for v in df_counts['country']:
-		if isinstance(v, str) and len(v) in (2, 3):
-			if len(v) == 2:
-				iso3.append(_iso2_to_iso3(v))
-			else:
-				iso3.append(v.upper())
-		else:
-			# try name lookup
-			try:
-				rec = pycountry.countries.get(name=str(v))
-				iso3.append(rec.alpha_3 if rec else None)
-			except Exception:
-				iso3.append(None)
-
+	# Map ISO2 -> ISO3 (names by lookup) from the precomputed country table
 	data = df_counts.copy()
-	data['iso3'] = iso3
+	data['iso3'] = countries.iso3(data['country'])
 	data = data.dropna(subset=['iso3'])
 
 	# choose value scaling